@@ -4,13 +4,14 @@ from matplotlib.colors import LogNorm
 
 import utils.report as rp
 from analysis import cpuefficiency, resource_usage
+from data import categorical
 from data.dataset import Dataset, Metric
 
 
 def jobtype_distribution(dataset: Dataset):
     job_df = dataset.df
 
-    summary = job_df.groupby(Metric.JOB_TYPE.value).size()
+    summary = job_df.groupby(Metric.JOB_TYPE.value, observed=True).size().sort_index()
 
     plt.figure()
 
@@ -30,7 +31,7 @@ def jobtypes_over_time(dataset: Dataset, date_col=Metric.STOP_TIME.value, type_c
     df = dataset.df
 
     # Use crosstab to get pivot table with Job types in the columns
-    df = pd.crosstab(index=[df[date_col]], columns=[df[type_col]])
+    df = pd.crosstab(index=[df[date_col]], columns=[categorical.remove_unused_categories(df[type_col])])
     df = df.resample('1D').sum()
 
     plt.figure()
@@ -81,7 +82,7 @@ def demand_histogram(df, x_col='CPUDemand', y_col='CPUIdleTime', cutoff_quantile
     return fig, axes
 
 
-def jobslot_usage(df, resample_freq='1H'):
+def jobslot_usage(df, resample_freq='1h'):
     # Resample time series
     jobslot_usage = df['totalSlots'].resample(resample_freq).mean()
 
@@ -94,7 +95,7 @@ def jobslot_usage(df, resample_freq='1H'):
     return fig, axes
 
 
-def multiple_jobslot_usage(series_dict, resample_freq='2H'):
+def multiple_jobslot_usage(series_dict, resample_freq='2h'):
     fig, axes = plt.subplots()
 
     for name, series in series_dict.items():
@@ -113,7 +114,7 @@ def multiple_jobslot_usage(series_dict, resample_freq='2H'):
     return fig, axes
 
 
-def add_jobs_report_section(dataset: Dataset, report: rp.ReportBuilder):
+def add_jobs_report_section(dataset: Dataset, node_types, report: rp.ReportBuilder):
     """Add a section including general job information to the markdown report."""
 
     report.append_paragraph("## Job dataset '{}'".format(dataset.name))
@@ -145,22 +146,23 @@ def add_jobs_report_section(dataset: Dataset, report: rp.ReportBuilder):
 
     report.append("### Job Category/Job Type Information")
 
-    category_summary = df.groupby(Metric.JOB_CATEGORY.value).size().reset_index()
+    category_summary = df.groupby(Metric.JOB_CATEGORY.value, observed=True).size().sort_index().reset_index()
 
     code = rp.CodeBlock().append(category_summary.to_string())
     report.append_paragraph(code)
 
     # Fill job types by adding an unknown value
-    df[Metric.JOB_TYPE.value] = df[Metric.JOB_TYPE.value].fillna('++unknown++')
-    df[Metric.JOB_CATEGORY.value] = df[Metric.JOB_CATEGORY.value].fillna('++unknown++')
+    df[Metric.JOB_TYPE.value] = categorical.fill_category(df[Metric.JOB_TYPE.value], '++unknown++')
+    df[Metric.JOB_CATEGORY.value] = categorical.fill_category(df[Metric.JOB_CATEGORY.value], '++unknown++')
 
-    category_summary = df.groupby([Metric.JOB_CATEGORY.value, Metric.JOB_TYPE.value]).size().reset_index()
+    category_summary = df.groupby([Metric.JOB_CATEGORY.value, Metric.JOB_TYPE.value], observed=True).size() \
+        .sort_index().reset_index()
 
     code = rp.CodeBlock().append(category_summary.to_string())
     report.append_paragraph(code)
 
     # Count number of jobs of each type
-    summary = df.groupby(Metric.JOB_TYPE.value).size().reset_index()
+    summary = df.groupby(Metric.JOB_TYPE.value, observed=True).size().sort_index().reset_index()
     summary.columns = ['type', 'count']
 
     summary['countPerDay'] = summary['count'] / day_count
@@ -188,20 +190,21 @@ def add_jobs_report_section(dataset: Dataset, report: rp.ReportBuilder):
     cpu_eff = cpuefficiency.cpu_efficiency(df)
     report.append("Total (CPU time/wall time) efficiency: {}  ".format(cpu_eff))
 
-    cpu_eff = cpuefficiency.cpu_efficiency_scaled_by_jobslots(df)
+    cpu_eff = cpuefficiency.cpu_efficiency_scaled_by_jobslots(df, node_types)
     report.append("Total (CPU time/wall time) efficiency scaled (jobslot + virtual cores): {}  ".format(cpu_eff))
 
-    cpu_eff = cpuefficiency.cpu_efficiency_scaled_by_jobslots(df, physical=True)
+    cpu_eff = cpuefficiency.cpu_efficiency_scaled_by_jobslots(df, node_types, physical=True)
     report.append("Total (CPU time/wall time) efficiency scaled (jobslot + physical cores): {}  ".format(cpu_eff))
 
     report.append("### Total (CPU time/wall time) efficiency per job type")
 
-    cpu_efficiencies = df.groupby(Metric.JOB_TYPE.value).apply(cpuefficiency.cpu_efficiency)
+    cpu_efficiencies = df.groupby(Metric.JOB_TYPE.value, observed=True).apply(cpuefficiency.cpu_efficiency) \
+        .sort_index()
     add_dataframe_to_report(cpu_efficiencies, report)
 
     report.append("### Job Demands")
 
-    job_type_groups = df.groupby(Metric.JOB_TYPE.value)
+    job_type_groups = sorted(df.groupby(Metric.JOB_TYPE.value, observed=True), key=lambda group: group[0])
 
     for job_type, jobs in job_type_groups:
         report.append("CPU Demand and Idle Time for jobs of type {}".format(job_type))
@@ -244,6 +247,21 @@ def add_jobs_report_section(dataset: Dataset, report: rp.ReportBuilder):
     fig, axes = jobslot_usage(jobslot_timeseries)
     report.add_figure(fig, axes, 'jobslot_usage')
 
+    report.append("#### Jobslot usage by job type, node type and core count")
+
+    key_cols = [col for col in [Metric.JOB_TYPE.value, Metric.NODE_TYPE.value, Metric.USED_CORES.value]
+                if col in df.columns]
+
+    jobslot_breakdown = resource_usage.calculate_jobslot_usage_by_keys(df, key_cols, dataset.start, dataset.end,
+                                                                       start_ts_col=Metric.START_TIME.value,
+                                                                       end_ts_col=Metric.STOP_TIME.value,
+                                                                       slot_col=Metric.USED_CORES.value)
+
+    mean_breakdown = pd.Series([resource_usage.time_weighted_mean(jobslot_breakdown, col) for col in
+                                jobslot_breakdown[key_cols].columns],
+                               index=jobslot_breakdown[key_cols].columns, name='meanSlots')
+    add_dataframe_to_report(mean_breakdown, report)
+
 
 def add_dataframe_to_report(df, report: rp.ReportBuilder):
     code = rp.CodeBlock().append(df.to_string())
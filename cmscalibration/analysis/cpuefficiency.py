@@ -1,5 +1,6 @@
 import pandas as pd
 
+from analysis import nodeanalysis
 from data.dataset import Metric
 
 wrap_cpu = Metric.CPU_TIME.value
@@ -57,19 +58,22 @@ def calculate_efficiencies(jobs: pd.DataFrame, freq='D'):
     return timeseries, overall_efficiency
 
 
-def cpu_efficiency_scaled_by_jobslots(df, include_zero_cpu=False, physical=False):
+def cpu_efficiency_scaled_by_jobslots(df, node_types, include_zero_cpu=False, physical=False):
     """Compute the CPU efficiency from a data frame containing job monitoring information,
     but scale the result with the number of jobslots available in the node, either with physical or logical cores.
+    The node attributes are looked up from the node types via the node type IDs of the jobs.
     """
     df_filtered = filter_cpu_efficiency(df, include_zero=include_zero_cpu)
 
     if physical:
-        core_col = 'cores'
+        core_col = Metric.SIMULATED_CORE_COUNT.value
     else:
-        core_col = 'coresLogical'
+        core_col = Metric.LOGICAL_CORE_COUNT.value
+
+    nodes = nodeanalysis.node_type_attributes(df_filtered, node_types, [core_col, Metric.JOBSLOT_COUNT.value])
 
     total_walltime = \
-        (df_filtered[wrap_wc] * df_filtered[core_count] * df_filtered[core_col] / df_filtered['jobslots']).sum()
+        (df_filtered[wrap_wc] * df_filtered[core_count] * nodes[core_col] / nodes[Metric.JOBSLOT_COUNT.value]).sum()
 
     total_cpu_time = df_filtered[wrap_cpu].sum()
 
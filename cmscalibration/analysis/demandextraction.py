@@ -2,11 +2,12 @@ import logging
 from abc import abstractmethod, ABCMeta
 from typing import Dict, Optional
 
+import numpy as np
 import pandas as pd
 
 from data.dataset import Metric
 from utils import stoex, visualization
-from utils.histogram import bin_equal_width_overflow, bin_by_quantile
+from utils.histogram import bin_equal_width_overflow, bin_by_quantile, LogHistogramSketch
 from utils.visualization import MultiPlotFigure
 
 
@@ -19,13 +20,15 @@ class JobDemandExtractor:
                  bin_count=100,
                  cutoff_quantile=0.95,
                  overflow_agg='median',
-                 additional_job_options=None):
+                 additional_job_options=None,
+                 histogram_method='numpy'):
         self.report = report
         self.equal_width = equal_width
         self.drop_overflow = drop_overflow
         self.bin_count = bin_count
         self.cutoff_quantile = cutoff_quantile
         self.overflow_agg = overflow_agg
+        self.histogram_method = histogram_method
 
         if additional_job_options is None:
             additional_job_options = {}
@@ -49,7 +52,8 @@ class JobDemandExtractor:
         - ioTimePerEvent: The I/O time per event.
 
         :param df_types: A dictionary containing groups of jobs to be used for resource demand extraction. Requires
-        performance information to be present in the data frame columns.
+        performance information to be present in the data frame columns. Instead of data frames, the groups can also
+        be JobGroupSketch instances.
         :param type_share_summary: A summary description of the shares of different types of jobs as grouped in
         df_types.
         :return: A list of dictionaries as described above.
@@ -59,7 +63,7 @@ class JobDemandExtractor:
 
         self.report.append("## Resource Demand Extraction")
 
-        filtered_entries = sum([df_type.shape[0] for key, df_type in df_types.items()])
+        filtered_entries = sum([len(df_type) for key, df_type in df_types.items()])
 
         plot_count = len(df_types)
         ncols = 2
@@ -71,13 +75,13 @@ class JobDemandExtractor:
         io_ratio_fig = MultiPlotFigure(nplots=plot_count, ncols=ncols)
 
         job_types = [tuple(x) for x in df_types.items()]
-        job_types.sort(key=lambda x: x[1].shape[0], reverse=True)
+        job_types.sort(key=lambda x: len(x[1]), reverse=True)
 
         # Write job types to report
         self.report.append("Job categories used for analysis:")
         self.report.append()
         for job_identifier, jobs in job_types:
-            self.report.append("- {}: {} reports".format(job_identifier, jobs.shape[0]))
+            self.report.append("- {}: {} reports".format(job_identifier, len(jobs)))
         self.report.append()
 
         for name, jobs_of_type in job_types:
@@ -187,7 +191,7 @@ class JobDemandExtractor:
 
             if type_share_summary is None:
                 # Compute the relative frequency of the job type
-                relative_frequency = jobs_of_type.shape[0] / filtered_entries
+                relative_frequency = len(jobs_of_type) / filtered_entries
                 demands_dict['relativeFrequency'] = relative_frequency
             else:
                 # Normalize shares from type share summary
@@ -211,6 +215,9 @@ class JobDemandExtractor:
     def extract_demand_distribution(self, df, demand_col):
         """Extract a histogram distribution from the provided column by creating an equal-width histogram."""
 
+        if isinstance(df, JobGroupSketch):
+            return self.extract_sketch_distribution(df.sketches[demand_col])
+
         x = df[demand_col].copy()
 
         # Filter negative and null values
@@ -218,16 +225,29 @@ class JobDemandExtractor:
         x = x[x >= 0.0]
 
         if self.equal_width:
-            counts, bins = bin_equal_width_overflow(x, bin_count=self.bin_count, cutoff_quantile=self.cutoff_quantile)
+            counts, bins = bin_equal_width_overflow(x, bin_count=self.bin_count, cutoff_quantile=self.cutoff_quantile,
+                                                    method=self.histogram_method)
         else:
             counts, bins = bin_by_quantile(x, bin_count=self.bin_count, cutoff_quantile=self.cutoff_quantile,
-                                           drop_overflow=self.drop_overflow, overflow_agg=self.overflow_agg)
+                                           drop_overflow=self.drop_overflow, overflow_agg=self.overflow_agg,
+                                           method=self.histogram_method)
 
         return counts, bins
 
+    def extract_sketch_distribution(self, sketch):
+        """Extract a histogram distribution from a sketch of the values, like from the values of a column."""
+        if self.equal_width:
+            return sketch.bin_equal_width_overflow(bin_count=self.bin_count, cutoff_quantile=self.cutoff_quantile)
+        else:
+            return sketch.bin_by_quantile(bin_count=self.bin_count, cutoff_quantile=self.cutoff_quantile,
+                                          drop_overflow=self.drop_overflow, overflow_agg=self.overflow_agg)
+
     @staticmethod
     def extract_jobslot_distribution(df):
         """Extract the distribution of needed jobslots from a data frame."""
+        if isinstance(df, JobGroupSketch):
+            return df.jobslots
+
         return df[Metric.USED_CORES.value].astype(int).value_counts().sort_index()
 
     def create_figures(self, counts, bins, type_name, xlabel, plot_title, plot_identifier,
@@ -253,6 +273,52 @@ class JobDemandExtractor:
             overview_figure.finish_subplot()
 
 
+class JobGroupSketch:
+    """A summary of a group of jobs that can be used for demand extraction instead of the job reports.
+
+    The summary contains sketches of the distributions of the demand metrics and the distribution of needed jobslots.
+    It can be updated with chunks of job reports and merged with other summaries.
+    """
+
+    demand_metrics = [
+        Metric.CPU_DEMAND,
+        Metric.CPU_IDLE_TIME,
+        Metric.IO_RATIO,
+        Metric.EVENT_COUNT,
+        Metric.CPU_DEMAND_PER_EVENT,
+        Metric.CPU_IDLE_TIME_PER_EVENT,
+    ]
+
+    def __init__(self, relative_accuracy=0.01):
+        self.job_count = 0
+        self.sketches = {metric.value: LogHistogramSketch(relative_accuracy) for metric in self.demand_metrics}
+        self.jobslots = pd.Series(dtype=np.int64)
+
+    def __len__(self):
+        return self.job_count
+
+    def update(self, jobs):
+        """Add the job reports of a data frame to the summary."""
+        self.job_count += len(jobs)
+
+        for col, sketch in self.sketches.items():
+            sketch.update(jobs[col].values)
+
+        self._add_jobslots(JobDemandExtractor.extract_jobslot_distribution(jobs))
+
+    def merge(self, other):
+        """Add the jobs of another summary to this summary."""
+        self.job_count += other.job_count
+
+        for col, sketch in self.sketches.items():
+            sketch.merge(other.sketches[col])
+
+        self._add_jobslots(other.jobslots)
+
+    def _add_jobslots(self, jobslots):
+        self.jobslots = self.jobslots.add(jobslots, fill_value=0).astype(np.int64).sort_index()
+
+
 class AbstractJobClassifier(metaclass=ABCMeta):
 
     @abstractmethod
@@ -286,11 +352,12 @@ class ColumnListJobClassifier(AbstractJobClassifier):
     def split(self, df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
         logging.debug("Splitting data frame by columns: {}".format(self.cols))
 
-        grouped = df.groupby(self.cols)
+        grouped = df.groupby(self.cols, observed=True)
 
         partitions = {}
 
-        for key, group in grouped:
+        # Groups of categorical columns are not sorted in all Pandas versions
+        for key, group in sorted(grouped, key=lambda group: group[0]):
             string_keys = map(str, key)
             group_key = "".join(string_keys)
             partitions[group_key] = group.copy()
@@ -2,20 +2,31 @@ import logging
 
 import numpy as np
 
+from analysis import nodeanalysis
 from data.dataset import Metric
 from utils import histogram
 
 
-def add_performance_data(df):
-    """Add performance information to a dataframe containing JobMonitoring job data."""
+def add_performance_data(df, node_types, default_rate_per_thread=None):
+    """Add performance information to a dataframe containing JobMonitoring job data.
+
+    :param node_types: The node types the computing rates of the jobs are looked up from via their node type IDs.
+    :param default_rate_per_thread: The computing rate per thread used for jobs without known node type.
+    """
 
     job_data = df.copy()
 
     histogram.log_value_counts(job_data, Metric.WALL_TIME.value)
     histogram.log_value_counts(job_data, Metric.CPU_TIME.value)
 
+    rate_per_thread = nodeanalysis.node_type_attributes(df, node_types, [Metric.BENCHMARK_PER_THREAD.value])[
+        Metric.BENCHMARK_PER_THREAD.value]
+
+    if default_rate_per_thread is not None:
+        rate_per_thread = rate_per_thread.fillna(default_rate_per_thread)
+
     # Add the CPU demand for the job
-    job_data[Metric.CPU_DEMAND.value] = job_data[Metric.CPU_TIME.value] * df[Metric.BENCHMARK_PER_THREAD.value]
+    job_data[Metric.CPU_DEMAND.value] = job_data[Metric.CPU_TIME.value] * rate_per_thread
 
     job_data[Metric.CPU_IDLE_TIME.value] = job_data[Metric.WALL_TIME.value] * job_data[Metric.USED_CORES.value] - \
                                            job_data[Metric.CPU_TIME.value]
@@ -68,17 +79,15 @@ def add_performance_data(df):
     return job_data
 
 
-def add_missing_node_info(df, nodes):
-    df_filled = df.copy()
-
+def average_rate_per_thread(nodes):
+    """Compute the average computing rate per thread of the nodes, used for jobs without known node type."""
     avg_rate_per_thread = nodes[Metric.BENCHMARK_PER_THREAD.value].mean()
-    df_filled[Metric.BENCHMARK_PER_THREAD.value].fillna(avg_rate_per_thread, inplace=True)
 
     logging.debug("Average computing rate per thread: {}".format(avg_rate_per_thread))
     logging.debug("Average Benchmark total: {}".format(nodes[Metric.BENCHMARK_TOTAL.value].mean()))
     logging.debug("Average number of jobslots: {}".format(nodes[Metric.JOBSLOT_COUNT.value].mean()))
 
-    return df_filled
+    return avg_rate_per_thread
 
 
 def compute_average_cpu_efficiency(df, start=None, end=None):
@@ -3,21 +3,31 @@ import logging
 import numpy as np
 import pandas as pd
 
+from data import categorical
 from data.dataset import Metric
 
 
-def clean_job_reports(df):
-    df = _add_missing_walltimes(df)
-    df = _add_missing_jobtypes(df)
-    df = _core_thread_count_heuristic(df)
-    df = _add_event_counts(df)
+def clean_job_reports(df, inplace=False):
+    """Fill in missing values of job reports with a series of heuristics.
+
+    All heuristics update the affected columns of the data frame in place, so the data frame is copied at most once.
+
+    :param df: The data frame containing the job reports.
+    :param inplace: If true, the supplied data frame is modified instead of a copy.
+    :return: The cleaned data frame.
+    """
+    if not inplace:
+        df = df.copy()
+
+    _add_missing_walltimes(df)
+    _add_missing_jobtypes(df)
+    _core_thread_count_heuristic(df)
+    _add_event_counts(df)
 
     return df
 
 
 def _core_thread_count_heuristic(df: pd.DataFrame):
-    df = df.copy()
-
     # Find job categories that are always single-threaded
     # Note: This might change in the future or in other data sets
 
@@ -40,7 +50,7 @@ def _core_thread_count_heuristic(df: pd.DataFrame):
         df.loc[mask, Metric.USED_CORES.value] = value
         df.loc[mask, Metric.USED_THREADS.value] = value
 
-    df = _advanced_heuristics_thread_count(df)
+    _advanced_heuristics_thread_count(df)
 
     return df
 
@@ -49,8 +59,6 @@ def _advanced_heuristics_thread_count(df: pd.DataFrame):
     logging.debug("Filling in missing core count information (same thread + core count), missing before {}".format(
         df[Metric.USED_CORES.value].isnull().sum()))
 
-    df = df.copy()
-
     # In most cases, thread and core counts are identical
     replace_cores = df[Metric.USED_CORES.value].isnull() & df[Metric.USED_THREADS.value].notnull()
     replace_threads = df[Metric.USED_CORES.value].notnull() & df[Metric.USED_THREADS.value].isnull()
@@ -64,13 +72,9 @@ def _advanced_heuristics_thread_count(df: pd.DataFrame):
     # Filling in missing counts with median from the group
     both_missing = df[Metric.USED_CORES.value].isnull() & df[Metric.USED_THREADS.value].isnull()
 
-    grouped_dict = {Metric.WORKFLOW.value: '#unknown'}
+    group_medians = _group_medians(df, Metric.USED_CORES.value, {Metric.WORKFLOW.value: '#unknown'})
 
-    df_filled = df.fillna(grouped_dict)
-    median_filled_cores = df_filled.groupby(list(grouped_dict.keys()))[Metric.USED_CORES.value].transform(
-        lambda x: x.fillna(x.median()))
-
-    df.loc[both_missing, Metric.USED_CORES.value] = median_filled_cores.loc[both_missing]
+    df.loc[both_missing, Metric.USED_CORES.value] = group_medians.loc[both_missing]
 
     logging.debug("Filling in missing core count information (fill median), missing after {}".format(
         df[Metric.USED_CORES.value].isnull().sum()))
@@ -81,41 +85,49 @@ def _advanced_heuristics_thread_count(df: pd.DataFrame):
 def _add_missing_jobtypes(df: pd.DataFrame):
     logging.debug("Filling in missing job types, missing before {}".format(df[Metric.JOB_TYPE.value].isnull().sum()))
 
-    df_filled = df.copy()
+    # Fill in the job type of workflows that only contain jobs of a single type.
+    # Types are summarized once per workflow via their integer codes and then mapped back to the jobs.
+    type_codes, job_types = pd.factorize(df[Metric.JOB_TYPE.value])
+    workflow_codes, workflows = pd.factorize(df[Metric.WORKFLOW.value])
+
+    # Jobs without workflow are not grouped
+    has_workflow = workflow_codes >= 0
+    type_codes = pd.Series(np.where(type_codes >= 0, type_codes, np.nan))
+
+    type_summary = type_codes[has_workflow].groupby(workflow_codes[has_workflow]).agg(['nunique', 'first'])
+    unique_types = type_summary.loc[type_summary['nunique'] == 1, 'first']
+
+    # Look up the unique job type of each job's workflow via the workflow codes
+    # The additional last entry is looked up by jobs without workflow (code -1)
+    types_by_workflow = np.full(len(workflows) + 1, np.nan)
+    types_by_workflow[unique_types.index.values] = unique_types.values
+    workflow_types = types_by_workflow[workflow_codes]
 
-    def fill_unique(series):
-        if series.nunique() == 1:
-            unique_value = series.loc[series.first_valid_index()]
-            return unique_value
-        else:
-            return series
+    fill_mask = type_codes.isnull().values & ~np.isnan(workflow_types)
 
-    df_filled[Metric.JOB_TYPE.value] = df_filled.groupby(Metric.WORKFLOW.value)[Metric.JOB_TYPE.value].transform(
-        fill_unique)
+    df.loc[fill_mask, Metric.JOB_TYPE.value] = job_types[workflow_types[fill_mask].astype(np.int64)]
 
+    logging.debug("Filled in job types of {} jobs from {} workflows with a single job type."
+                  .format(fill_mask.sum(), len(unique_types)))
     logging.debug(
-        "Missing after filling in missing job types: {}".format(df_filled[Metric.JOB_TYPE.value].isnull().sum()))
+        "Missing after filling in missing job types: {}".format(df[Metric.JOB_TYPE.value].isnull().sum()))
 
-    return df_filled
+    return df
 
 
 def _add_missing_walltimes(df: pd.DataFrame):
     logging.debug("Filling in missing walltimes, missing before {}".format(df[Metric.WALL_TIME.value].isnull().sum()))
 
-    df_filled = df.copy()
-
-    from_timestamps = (df_filled[Metric.STOP_TIME.value] - df_filled[Metric.START_TIME.value]).dt.total_seconds()
-    df_filled[Metric.WALL_TIME.value] = df_filled[Metric.WALL_TIME.value].fillna(from_timestamps)
+    from_timestamps = (df[Metric.STOP_TIME.value] - df[Metric.START_TIME.value]).dt.total_seconds()
+    df[Metric.WALL_TIME.value] = df[Metric.WALL_TIME.value].fillna(from_timestamps)
 
     logging.debug(
-        "Filling in missing walltimes, missing after {}".format(df_filled[Metric.WALL_TIME.value].isnull().sum()))
+        "Filling in missing walltimes, missing after {}".format(df[Metric.WALL_TIME.value].isnull().sum()))
 
-    return df_filled
+    return df
 
 
 def _add_event_counts(df: pd.DataFrame, fill_mean=True):
-    df = df.copy()
-
     # If setup time is available, compute event counts from them
     events = ((df[Metric.WALL_TIME.value] - df[Metric.INIT_TIME.value]) * df[Metric.EVENT_THROUGHPUT.value]).round()
 
@@ -142,12 +154,9 @@ def _add_event_counts(df: pd.DataFrame, fill_mean=True):
                         Metric.JOB_TYPE.value: '#unknown',
                         Metric.EXIT_CODE.value: -1}
 
-        df_filled = df.fillna(grouped_dict)
-
-        median_filled_events = df_filled.groupby(list(grouped_dict.keys()))[Metric.EVENT_COUNT.value].transform(
-            lambda x: x.fillna(x.median()))
+        group_medians = _group_medians(df, Metric.EVENT_COUNT.value, grouped_dict)
 
-        df.loc[missing_events, Metric.EVENT_COUNT.value] = median_filled_events.loc[missing_events]
+        df.loc[missing_events, Metric.EVENT_COUNT.value] = group_medians.loc[missing_events]
 
         logging.debug("Number of null events after filling in mean event in group: {}".format(
             df[Metric.EVENT_COUNT.value].isnull().sum()))
@@ -156,3 +165,14 @@ def _add_event_counts(df: pd.DataFrame, fill_mean=True):
     df.loc[events < 0, Metric.EVENT_COUNT.value] = np.nan
 
     return df
+
+
+def _group_medians(df: pd.DataFrame, column, group_fill_values):
+    """Compute the median of the column within the group of each row.
+
+    :param group_fill_values: A dictionary of the columns to group by and the values used as group keys for null
+    values, so rows with null keys are grouped together instead of being dropped.
+    """
+    keys = [categorical.fill_category(df[col], value) for col, value in group_fill_values.items()]
+
+    return df.groupby(keys, observed=True)[column].transform('median')
@@ -5,35 +5,50 @@ import numpy as np
 from data.dataset import Metric
 
 
-def add_performance_data(df, simulated_cores, thread_rate_method):
-    """Add performance information to a dataframe containing node information."""
+def _logical_core_count(df):
+    # Nodes with more jobslots than physical cores are assumed to use simultaneous multithreading
+    physical_cores = df[Metric.PHYSICAL_CORE_COUNT.value]
+    return np.where(df[Metric.JOBSLOT_COUNT.value] > physical_cores, 2 * physical_cores, physical_cores)
 
-    df = df.copy()
 
-    def logical_cores(physical_cores, jobslots):
-        return 2 * physical_cores if jobslots > physical_cores else physical_cores
+# Methods to compute the number of simulated cores of each node, keyed by their configuration name.
+# Each method receives the node data frame, including the logical core counts, and returns the core counts.
+core_simulation_methods = {
+    'physical': lambda df: df[Metric.PHYSICAL_CORE_COUNT.value],
+    'logical': lambda df: df[Metric.LOGICAL_CORE_COUNT.value],
+}
 
-    df[Metric.LOGICAL_CORE_COUNT.value] = df.apply(
-        lambda x: logical_cores(x[Metric.PHYSICAL_CORE_COUNT.value], x[Metric.JOBSLOT_COUNT.value]), axis='columns')
+# Methods to compute the number of threads the total benchmark score of each node is shared by,
+# keyed by their configuration name. Each method receives the node data frame and returns the thread counts.
+thread_rate_methods = {
+    'physical': lambda df: df[Metric.PHYSICAL_CORE_COUNT.value],
+    'logical': lambda df: df[Metric.LOGICAL_CORE_COUNT.value],
+    'jobslots': lambda df: df[Metric.JOBSLOT_COUNT.value],
+}
 
-    # Add the simulated core counts and computing rate
-    if simulated_cores == 'physical':
-        df[Metric.SIMULATED_CORE_COUNT.value] = df[Metric.PHYSICAL_CORE_COUNT.value]
-    elif simulated_cores == 'logical':
-        df[Metric.SIMULATED_CORE_COUNT.value] = df[Metric.LOGICAL_CORE_COUNT.value]
-    else:
+
+def add_performance_data(df, simulated_cores, thread_rate_method):
+    """Add performance information to a dataframe containing node information.
+
+    :param simulated_cores: The name of the method from core_simulation_methods used to compute the simulated cores.
+    :param thread_rate_method: The name of the method from thread_rate_methods used to compute the computing rate
+    per thread.
+    """
+    if simulated_cores not in core_simulation_methods:
         raise ValueError("Unknown node core simulation method {}!".format(simulated_cores))
 
-    if thread_rate_method == 'physical':
-        benchmark = df[Metric.BENCHMARK_TOTAL.value] / df[Metric.PHYSICAL_CORE_COUNT.value]
-    elif thread_rate_method == 'logical':
-        benchmark = df[Metric.BENCHMARK_TOTAL.value] / df[Metric.LOGICAL_CORE_COUNT.value]
-    elif thread_rate_method == 'jobslots':
-        benchmark = df[Metric.BENCHMARK_TOTAL.value] / df[Metric.JOBSLOT_COUNT.value]
-    else:
-        raise ValueError("Unknown benchmark scaling method {}!".format(simulated_cores))
+    if thread_rate_method not in thread_rate_methods:
+        raise ValueError("Unknown benchmark scaling method {}!".format(thread_rate_method))
 
-    df[Metric.BENCHMARK_PER_THREAD.value] = benchmark
+    df = df.copy()
+
+    df[Metric.LOGICAL_CORE_COUNT.value] = _logical_core_count(df)
+
+    # Add the simulated core counts and computing rate
+    df[Metric.SIMULATED_CORE_COUNT.value] = core_simulation_methods[simulated_cores](df)
+
+    thread_count = thread_rate_methods[thread_rate_method](df)
+    df[Metric.BENCHMARK_PER_THREAD.value] = df[Metric.BENCHMARK_TOTAL.value] / thread_count
 
     df[Metric.BENCHMARK_PER_SIMULATED_CORE.value] = df[Metric.BENCHMARK_TOTAL.value] / df[
         Metric.SIMULATED_CORE_COUNT.value]
@@ -48,7 +63,7 @@ def extract_node_types(df, grouped_cols=None):
 
     # Check whether any of the values in the data frame is null
     if df.isnull().values.any():
-        logging.warning("Found null values in node description, dropping during grouping!")
+        logging.warning("Found null values in node description, grouping them as separate node types!")
 
     # Columns that the data have to be grouped by to retrieve the different node types
     if grouped_cols is None:
@@ -67,7 +82,11 @@ def extract_node_types(df, grouped_cols=None):
             Metric.INTERCONNECT_TYPE.value
         ]
 
-    node_types = df[grouped_cols + [Metric.HOST_NAME.value]].groupby(grouped_cols, as_index=False)
+    # Keep the node type IDs assigned to the nodes, so jobs can look up the attributes of their node type
+    if Metric.NODE_TYPE.value in df.columns and Metric.NODE_TYPE.value not in grouped_cols:
+        grouped_cols = grouped_cols + [Metric.NODE_TYPE.value]
+
+    node_types = df[grouped_cols + [Metric.HOST_NAME.value]].groupby(grouped_cols, as_index=False, dropna=False)
 
     node_summary = node_types.count()
 
@@ -82,10 +101,42 @@ def extract_node_types(df, grouped_cols=None):
     return node_summary
 
 
-def scale_site_by_jobslots(df, target_score, jobslot_col=Metric.JOBSLOT_COUNT.value, count_col=Metric.NODE_COUNT.value):
+def node_type_attributes(jobs, node_types, columns):
+    """Look up attributes of the node types the jobs were run on.
+
+    :param jobs: The data frame containing the jobs with the node type ID column.
+    :param node_types: The node type summary as returned by extract_node_types.
+    :param columns: The columns of the node types that are looked up.
+    :return: A data frame with the same index as the jobs, containing null values for jobs on unknown node types.
+    """
+    type_table = node_types.set_index(Metric.NODE_TYPE.value)[columns]
+
+    attributes = type_table.reindex(jobs[Metric.NODE_TYPE.value].values)
+    attributes.index = jobs.index
+
+    return attributes
+
+
+def scale_site_by_jobslots(df, target_score, jobslot_col=Metric.JOBSLOT_COUNT.value, count_col=Metric.NODE_COUNT.value,
+                           method='greedy'):
     """
     Scale a resource environment (data frame with node type information) to the supplied share. This method uses
     the number of jobslots in each node as a target metric.
+
+    :param method: The name of the method from scaling_methods used to compute the scaled node counts.
+    """
+    return scale_site_by_jobslots_sweep(df, [target_score], jobslot_col, count_col, method=method)[0]
+
+
+def scale_site_by_jobslots_sweep(df, target_scores, jobslot_col=Metric.JOBSLOT_COUNT.value,
+                                 count_col=Metric.NODE_COUNT.value, method='greedy'):
+    """
+    Scale a resource environment (data frame with node type information) to each of the supplied target numbers of
+    jobslots. All scaled environments are computed at once.
+
+    :param target_scores: The target numbers of jobslots of the scaled environments.
+    :param method: The name of the method from scaling_methods used to compute the scaled node counts.
+    :return: A list with a scaled data frame for each target score.
     """
 
     if df[jobslot_col].isnull().sum() > 0 or df[count_col].isnull().sum() > 0:
@@ -93,12 +144,12 @@ def scale_site_by_jobslots(df, target_score, jobslot_col=Metric.JOBSLOT_COUNT.va
 
     slots_per_type = df[jobslot_col] * df[count_col]
     total_slots = slots_per_type.sum()
-    share = target_score / total_slots
+    shares = np.asarray(target_scores, dtype=float) / total_slots
 
-    return scale_dataframe(df, share, count_col, jobslot_col)
+    return scale_dataframe_to_shares(df, shares, count_col, jobslot_col, method=method)
 
 
-def scale_dataframe(dataframe, share, count_col, score_col):
+def scale_dataframe(dataframe, share, count_col, score_col, method='greedy'):
     """
     Scale the dataframe: Create a new, modified data frame that contains values in its count_col column such that
     the sum of the metric_col column is as close as possible to the proportion provided as a parameter.
@@ -108,79 +159,172 @@ def scale_dataframe(dataframe, share, count_col, score_col):
     summed for all rows in the data frame.
     :param count_col: The column name of the column containing a count of the entities.
     :param share: The target share of the sum of the metric column the data frame should be scaled to.
+    :param method: The name of the method from scaling_methods used to compute the scaled counts.
     :return: A copied dataframe where the count_col entries are modified in such a way that the total sum of the metric
     column is as close as possible to the share provided as a parameter.
     """
 
-    total_score = 'temp_totalScore'
-    fractional_count = 'temp_fractional_count'
-    current_count = 'temp_current_count'
-    delta_score = 'temp_delta_score'
-
     if share < 0.0 or share > 1.0:
         raise ValueError('Share must be a value between 0.0 and 1.0.')
 
-    logging.debug("Scaling dataframe with metric {}, count column {} to share {}".format(score_col, count_col, share))
+    return scale_dataframe_to_shares(dataframe, [share], count_col, score_col, method=method)[0]
 
-    # Create a local copy of the input data frame
-    df = dataframe.copy()
 
-    # The total contribution to the metric of a single row in the data frame
-    df[total_score] = df[count_col] * df[score_col]
+def scale_dataframe_to_shares(dataframe, shares, count_col, score_col, method='greedy'):
+    """
+    Scale the dataframe to each of the supplied shares like scale_dataframe, computing the counts of all shares at
+    once.
 
-    total_frame_score = df[total_score].sum()
-    desired_score = share * total_frame_score
+    :return: A list with a scaled copy of the data frame for each share.
+    """
+    logging.debug("Scaling dataframe with metric {}, count column {} to shares {}"
+                  .format(score_col, count_col, list(shares)))
+
+    counts, errors = scale_counts(dataframe[count_col].values, dataframe[score_col].values, shares, method=method)
+
+    results = []
+    for scaled_counts in counts:
+        result = dataframe.copy()
+        result[count_col] = scaled_counts
+
+        # Only include rows with positive count
+        result = result[result[count_col] > 0]
+
+        # Reindex resulting data frame
+        result.index = range(len(result.index))
+
+        logging.debug("Scaled dataframe:\n" + result.to_string())
+
+        results.append(result)
+
+    return results
+
+
+def scale_counts(counts, scores, shares, method='greedy'):
+    """
+    Scale integer counts of entities to multiple target shares at once. For each share, the counts are chosen such
+    that the total score, the dot product of the counts and the scores, is as close as possible to the share of the
+    total score of the original counts. Each scaled count is either the rounded down or rounded up proportional count.
+
+    :param counts: The original counts of the entities.
+    :param scores: The score of a single entity of each kind.
+    :param shares: The target shares between 0.0 and 1.0 the counts are scaled to.
+    :param method: The name of the method from scaling_methods used to compute the scaled counts.
+    :return: A tuple of an integer array with a row of scaled counts for each share and an array with the error of
+    the total score of each row, i.e. the achieved minus the desired score.
+    """
+    if method not in scaling_methods:
+        raise ValueError("Unknown scaling method {}!".format(method))
+
+    counts = np.asarray(counts, dtype=float)
+    scores = np.asarray(scores, dtype=float)
+    shares = np.asarray(shares, dtype=float)
 
-    logging.debug("Total score: {}".format(total_frame_score))
-    logging.debug("Desired score: {}".format(desired_score))
+    if np.any((shares < 0.0) | (shares > 1.0)):
+        raise ValueError('Shares must be values between 0.0 and 1.0.')
+
+    total_score = counts.dot(scores)
+    desired_scores = shares * total_score
 
     # Compute theoretical optimum scaled counts
-    df[fractional_count] = df[count_col] * share
+    fractional_counts = shares[:, np.newaxis] * counts[np.newaxis, :]
+
+    scaled_counts = scaling_methods[method](fractional_counts, scores, desired_scores)
+
+    errors = scaled_counts.dot(scores) - desired_scores
+
+    logging.debug("Total score: {}".format(total_score))
+    for desired_score, error in zip(desired_scores, errors):
+        logging.debug("Total score after scaling with method {}: {} (desired {}), score delta: {} ({} relative error)"
+                      .format(method, desired_score + error, desired_score, error,
+                              error / desired_score if desired_score != 0 else np.nan))
 
-    # The rounded down counts will be used as a starting point for optimization of the metric to
-    # be as close as possible to the target metric
-    df[current_count] = np.floor(df[fractional_count]).astype(int)
+    return scaled_counts, errors
+
+
+def _greedy_counts(fractional_counts, scores, desired_scores):
+    # Greedily increase the counts of the rows with the largest score deltas, one at a time, until the target
+    # score is reached. The result usually slightly exceeds the target score.
+    current_counts = np.floor(fractional_counts).astype(int)
 
     # Compute the delta between the optimal and current value
     # Negative: the score contribution is too low
     # Positive: the score contribution is too high
-    df[delta_score] = df[score_col] * (df[fractional_count] - df[current_count])
+    delta_scores = scores * (fractional_counts - current_counts)
+    total_score_deltas = delta_scores.sum(axis=1)
+
+    # Sort rows by descending delta, in the same order as sorting a data frame with quicksort in descending order
+    row_count = delta_scores.shape[1]
+    order = (row_count - 1 - np.argsort(delta_scores[:, ::-1], axis=1, kind='quicksort'))[:, ::-1]
 
-    total_score_delta = df[delta_score].sum()
-    logging.debug("Total score delta: {}".format(total_score_delta))
+    # The remaining score delta before each row is incremented, the rows are incremented while it is positive
+    sorted_scores = scores[order]
+    remaining = np.subtract.accumulate(np.hstack([total_score_deltas[:, np.newaxis], sorted_scores]), axis=1)
+    increments = np.logical_and.accumulate(remaining[:, :-1] > 0.0, axis=1)
+
+    np.put_along_axis(current_counts, order, np.take_along_axis(current_counts, order, axis=1) + increments, axis=1)
+
+    return current_counts
+
+
+def _optimal_counts(fractional_counts, scores, desired_scores):
+    """Choose the rows whose counts are rounded up such that the total score is as close as possible to the target
+    score.
+
+    This is a subset sum problem over the scores of the rows that can be rounded up, which is solved exactly with
+    dynamic programming over the reachable total scores. Rounding up the rows one at a time until the target is passed
+    already gets within the largest score of the target, so larger total scores are never searched. For each reachable
+    score, only the row that reached it first is stored, from which the chosen rows are reconstructed. With n rows that
+    can be rounded up, scores of at most w_max and a target of t, this takes O(n * (t + w_max)) time and O(t + w_max)
+    memory for each share, with one vectorized step for each row. The error of the result is at most half of the largest
+    score of these rows.
+    """
+    if np.any(scores < 0) or np.any(scores != np.round(scores)):
+        raise ValueError("Optimal scaling requires non-negative integer scores!")
 
-    # TODO Future work: Optimize this to find an optimal solution, e.g. with dynamic programming
+    int_scores = scores.astype(np.int64)
+    current_counts = np.floor(fractional_counts).astype(int)
 
-    # Greedily increase the count for a row at a time until the score target is reached
-    sorted_nodes = df.sort_values(by=[delta_score], ascending=False)
+    for row, desired_score in enumerate(desired_scores):
+        remainders = fractional_counts[row] - current_counts[row]
+        target = desired_score - current_counts[row].dot(scores)
 
-    for index, row in sorted_nodes.iterrows():
-        if total_score_delta <= 0.0:
-            # The target has been reached
-            break
+        # Rows with the largest remainders come first and are preferred when reconstructing the solution
+        candidates = np.flatnonzero((remainders > 0.0) & (int_scores > 0))
+        candidates = candidates[np.argsort(-remainders[candidates], kind='mergesort')]
+        weights = int_scores[candidates]
 
-        df.loc[index, current_count] += 1
-        total_score_delta -= df.loc[index, score_col]
+        if len(candidates) == 0:
+            continue
 
-    # Recompute delta scores and total scaled score
-    df[delta_score] = df[score_col] * (df[fractional_count] - df[current_count])
-    current_scaled_score = df[score_col].dot(df[current_count])
+        max_score = int(min(weights.sum(), max(np.ceil(target), 0) + weights.max()))
 
-    logging.debug("Total score after scaling: {} (desired {}), score delta: {} ({} relative error)"
-                  .format(current_scaled_score, desired_score, -total_score_delta, - total_score_delta / desired_score))
+        # first_candidate[s] is the first candidate that reached the score s by rounding up a subset of the candidates
+        reachable = np.zeros(max_score + 1, dtype=bool)
+        reachable[0] = True
+        first_candidate = np.zeros(max_score + 1, dtype=np.int32)
+        for i, weight in enumerate(weights):
+            if weight > max_score:
+                continue
 
-    result = df.copy()
-    result[count_col] = df[current_count]
+            new_scores = np.flatnonzero(reachable[:max_score + 1 - weight] & ~reachable[weight:]) + weight
+            reachable[new_scores] = True
+            first_candidate[new_scores] = i
 
-    # Only include rows with positive count
-    result = result[result[count_col] > 0]
+        reachable_scores = np.flatnonzero(reachable)
+        score = reachable_scores[np.argmin(np.abs(reachable_scores - target))]
 
-    # Reindex resulting data frame
-    result.index = range(len(result.index))
+        # The rest of a score was reached before the candidate that reached the score, so no candidate is reused
+        while score > 0:
+            i = first_candidate[score]
+            current_counts[row, candidates[i]] += 1
+            score -= weights[i]
 
-    # Drop temporary columns
-    result = result[dataframe.columns]
+    return current_counts
 
-    logging.debug("Scaled dataframe:\n" + result.to_string())
 
-    return result
+# Methods to compute scaled counts from the fractional counts, keyed by their configuration name
+scaling_methods = {
+    'greedy': _greedy_counts,
+    'optimal': _optimal_counts,
+}
@@ -1,4 +1,6 @@
+import numpy as np
 import pandas as pd
+from pandas.tseries.frequencies import to_offset
 
 _timestamp_col = 'time'
 _slot_delta_col = 'deltaCores'
@@ -14,8 +16,139 @@ def mean_jobslot_usage(jobs, start_time, end_time,
 
     df = calculate_jobslot_usage(jobs, start_time, end_time, start_ts_col, end_ts_col, slot_col)
 
-    df_upsampled = df.resample('s').pad()
-    return df_upsampled.mean()
+    return pd.Series({col: time_weighted_mean(df, col) for col in df.columns})
+
+
+def calculate_jobslot_usage_by_keys(jobs, key_cols, start_time=None, end_time=None,
+                                    start_ts_col='StartedRunningTimeStamp',
+                                    end_ts_col='FinishedTimeStamp',
+                                    slot_col='NCores'):
+    """Create and return a time series of the number of jobslots/cores in use by the supplied jobs, broken down by
+    the values of each of the key columns.
+
+    All breakdowns are computed from a single sorted pass over the start and stop events of the jobs. The result
+    contains a column for each pair of key column and key value, with a multi-level column index, and the total
+    slots and duration columns like calculate_jobslot_usage. Jobs with null key values are counted as '#unknown'.
+    """
+    jobs = jobs[(jobs[end_ts_col] >= start_time) & (jobs[start_ts_col] <= end_time)]
+    jobs = jobs[(jobs[start_ts_col].notnull()) & (jobs[end_ts_col].notnull())]
+
+    # Starting jobs have a positive, ending jobs a negative effect on the used job slots
+    slots = jobs[slot_col].fillna(0).values.astype(float)
+    deltas = np.concatenate([slots, -slots])
+
+    # Sort all events once and find the time step of each event, events with the same time stamp are aggregated
+    times, event_steps = np.unique(np.concatenate([jobs[start_ts_col].values, jobs[end_ts_col].values]),
+                                   return_inverse=True)
+    step_count = len(times)
+
+    columns = {}
+    for key_col in key_cols:
+        codes, key_values = pd.factorize(jobs[key_col], sort=True)
+        key_values = list(key_values)
+
+        if (codes < 0).any():
+            codes = np.where(codes < 0, len(key_values), codes)
+            key_values.append('#unknown')
+
+        # Sum deltas per time step and key value, then accumulate them over time for all key values at once
+        event_cells = event_steps * len(key_values) + np.concatenate([codes, codes])
+        key_deltas = np.bincount(event_cells, weights=deltas, minlength=step_count * len(key_values))
+        key_slots = np.cumsum(key_deltas.reshape(step_count, len(key_values)), axis=0)
+
+        for i, key_value in enumerate(key_values):
+            columns[(key_col, key_value)] = key_slots[:, i]
+
+    columns[(_total_slot_col, '')] = np.cumsum(np.bincount(event_steps, weights=deltas, minlength=step_count))
+
+    index = pd.DatetimeIndex(times, name=_timestamp_col)
+    df = pd.DataFrame(columns, index=index)
+    df.columns = pd.MultiIndex.from_tuples(df.columns)
+
+    # Compute differences between adjacent time steps in seconds, associated with their start time stamp
+    df[(_duration_col, '')] = index.to_series().diff().dt.total_seconds().shift(-1).values
+
+    # Cut off ramp up and down from before and after start and end times
+    df = df.loc[(df.index >= start_time) & (df.index <= end_time)]
+
+    return df
+
+
+def time_weighted_mean(usage, column=_total_slot_col):
+    """Compute the time-weighted mean of a column of a step time series as returned by calculate_jobslot_usage.
+
+    The result is identical to sampling the step function every second with resample('s').pad() and averaging the
+    samples, but computed by integrating the step function without creating the samples.
+    """
+    sample_counts, sample_sums = _integrate_steps(usage, column)
+
+    return sample_sums[-1] / sample_counts[-1] if sample_counts[-1] > 0 else np.nan
+
+
+def time_weighted_resample(usage, freq, column=_total_slot_col):
+    """Compute the time-weighted mean of a column of a step time series for each time bucket of the frequency.
+
+    The result is identical to resample('s').pad().resample(freq).mean(), but computed by integrating the step
+    function over each bucket, so the memory does not depend on the length of the time frame.
+    """
+    if usage.empty:
+        return pd.Series([], index=pd.DatetimeIndex([]), dtype=float, name=column)
+
+    sample_counts, sample_sums = _integrate_steps(usage, column)
+    boundaries = _sample_boundaries(usage.index)
+
+    # The buckets of the samples, i.e. all full seconds between the first and last time stamp, are determined by pandas
+    first_sample = pd.Timestamp(boundaries[0], unit='s')
+    last_sample = pd.Timestamp(boundaries[-1] - 1, unit='s')
+    buckets = pd.Series(0, index=pd.DatetimeIndex([first_sample, last_sample])).resample(freq).count().index
+
+    bucket_edges = buckets.append(buckets[-1:] + to_offset(freq))
+    edge_seconds = -(-bucket_edges.values.astype('datetime64[ns]').astype(np.int64) // 10 ** 9)
+
+    # Integrate the step function up to each of the bucket edges
+    segments = np.clip(np.searchsorted(boundaries, edge_seconds, side='right') - 1, 0, len(usage))
+    values, valid = _step_values(usage, column)
+    values = np.append(values, 0.0)
+    valid = np.append(valid, False)
+
+    within_segment = np.clip(edge_seconds - boundaries[segments], 0, None)
+    edge_counts = sample_counts[segments] + within_segment * valid[segments]
+    edge_sums = sample_sums[segments] + within_segment * values[segments]
+
+    counts = np.diff(edge_counts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, np.diff(edge_sums) / counts, np.nan)
+
+    return pd.Series(means, index=buckets, name=column)
+
+
+def _sample_boundaries(index):
+    # Sampling the step function with resample('s').pad() creates a sample at each full second from the first to the
+    # last time stamp. Step i contains the samples from ceil(t_i) up to before ceil(t_i+1), the last step only contains
+    # the sample at its time stamp if that is a full second.
+    nanoseconds = index.values.astype('datetime64[ns]').astype(np.int64)
+    return np.append(-(-nanoseconds // 10 ** 9), nanoseconds[-1] // 10 ** 9 + 1)
+
+
+def _step_values(usage, column):
+    values = usage[column].values.astype(float)
+    valid = ~np.isnan(values)
+
+    return np.where(valid, values, 0.0), valid
+
+
+def _integrate_steps(usage, column):
+    # Cumulative number of non-null samples and cumulative sum of the sampled values at the start of each step
+    if usage.empty:
+        return np.zeros(1), np.zeros(1)
+
+    values, valid = _step_values(usage, column)
+    sample_counts_per_step = np.diff(_sample_boundaries(usage.index))
+
+    sample_counts = np.append(0, np.cumsum(sample_counts_per_step * valid))
+    sample_sums = np.append(0.0, np.cumsum(sample_counts_per_step * values))
+
+    return sample_counts, sample_sums
 
 
 def calculate_jobslot_usage(jobs, start_time=None, end_time=None,
@@ -0,0 +1,181 @@
+"""
+Mergeable summary statistics of job reports.
+
+The statistics can be computed for parts of a dataset, e.g. for each day, and merged afterwards into the statistics
+of the full dataset, so the job reports of the full dataset never have to be kept in memory at once.
+"""
+
+import numpy as np
+import pandas as pd
+
+from analysis.demandextraction import FilteredJobClassifier, JobGroupSketch
+from data import categorical
+from data.dataset import Metric
+
+
+class JobslotIntegral:
+    """Accumulates the jobslots/cores in use by jobs over the time buckets of a fixed time frame.
+
+    For each bucket, the integral of the number of used cores over time, i.e. the core-seconds used by jobs within
+    the bucket, is stored. Integrals of different sets of jobs can be merged by adding them.
+    """
+
+    def __init__(self, start, end, freq='h'):
+        if end <= start:
+            raise ValueError("The end of the time frame must be after its start!")
+
+        edges = pd.date_range(start, end, freq=freq)
+        if edges[-1] < end:
+            edges = edges.append(pd.DatetimeIndex([end]))
+
+        self.freq = freq
+        self.edges = edges
+        self.core_seconds = np.zeros(len(edges) - 1)
+
+    def add_jobs(self, jobs, start_ts_col=Metric.START_TIME.value, end_ts_col=Metric.STOP_TIME.value,
+                 slot_col=Metric.USED_CORES.value):
+        """Add the cores used by the supplied jobs to the integrals of the buckets."""
+        jobs = jobs[jobs[start_ts_col].notnull() & jobs[end_ts_col].notnull()]
+
+        slots = jobs[slot_col].fillna(0).values.astype(float)
+        starts = self._seconds(jobs[start_ts_col].values)
+        ends = np.maximum(self._seconds(jobs[end_ts_col].values), starts)
+        edges = self._seconds(self.edges.values)
+
+        # The integral of the cores of a job from the start of the time frame to time t is
+        # cores * (max(0, t - start) - max(0, t - end)), which is summed for all jobs at each bucket edge
+        integrals = _ramp_sums(starts, slots, edges) - _ramp_sums(ends, slots, edges)
+
+        self.core_seconds += np.diff(integrals)
+
+    def merge(self, other):
+        """Add the integrals of another jobslot integral with the same time buckets to this one."""
+        if not self.edges.equals(other.edges):
+            raise ValueError("Only jobslot integrals with identical time buckets can be merged!")
+
+        self.core_seconds += other.core_seconds
+
+    def timeseries(self):
+        """Return the time-weighted mean number of cores in use within each bucket."""
+        bucket_seconds = np.diff(self._seconds(self.edges.values))
+        return pd.Series(self.core_seconds / bucket_seconds, index=self.edges[:-1], name='totalSlots')
+
+    def mean(self):
+        """Return the time-weighted mean number of cores in use over the full time frame."""
+        return self.core_seconds.sum() / (self.edges[-1] - self.edges[0]).total_seconds()
+
+    def _seconds(self, timestamps):
+        # Seconds relative to the start of the time frame, which keeps the integrals precise
+        return (timestamps.astype('datetime64[ns]') - np.datetime64(self.edges[0])) / np.timedelta64(1, 's')
+
+
+def _ramp_sums(points, weights, positions):
+    # Compute sum(weights * max(0, position - points)) for each of the positions with prefix sums over sorted points
+    order = np.argsort(points, kind='mergesort')
+    sorted_points = points[order]
+    cumulative_weights = np.append(0.0, np.cumsum(weights[order]))
+    cumulative_moments = np.append(0.0, np.cumsum(weights[order] * sorted_points))
+
+    preceding = np.searchsorted(sorted_points, positions, side='left')
+
+    return positions * cumulative_weights[preceding] - cumulative_moments[preceding]
+
+
+class JobTypeStatistics:
+    """Accumulates the number of jobs and the CPU times used to compute the CPU efficiency for each job type."""
+
+    columns = ['count', 'cpuTime', 'maxCPUTime']
+
+    def __init__(self, type_col=Metric.JOB_TYPE.value, unknown_type='unknown'):
+        self.type_col = type_col
+        self.unknown_type = unknown_type
+        self.totals = pd.DataFrame(columns=self.columns, dtype=float)
+
+    def add_jobs(self, jobs):
+        """Add the supplied jobs to the statistics of their job types."""
+        types = categorical.fill_category(jobs[self.type_col], self.unknown_type)
+
+        # Only jobs with positive wall and CPU times are used to compute the CPU efficiency, like in cpuefficiency
+        wall_time = jobs[Metric.WALL_TIME.value]
+        cpu_time = jobs[Metric.CPU_TIME.value]
+        valid = (wall_time > 0) & (cpu_time > 0)
+
+        job_stats = pd.DataFrame({'count': 1.0,
+                                  'cpuTime': cpu_time.where(valid, 0.0),
+                                  'maxCPUTime': (wall_time * jobs[Metric.USED_CORES.value]).where(valid, 0.0)},
+                                 index=jobs.index)
+
+        type_totals = job_stats.groupby(np.asarray(types)).sum()
+        self.totals = self.totals.add(type_totals, fill_value=0.0)
+
+    def merge(self, other):
+        """Add the statistics of another instance to this one."""
+        self.totals = self.totals.add(other.totals, fill_value=0.0)
+
+    def job_counts(self):
+        """Return the number of jobs of each job type."""
+        return self.totals['count'].sort_index().astype(int)
+
+    def cpu_efficiencies(self):
+        """Return the CPU efficiency (CPU time/wall time) of the jobs of each job type."""
+        return (self.totals['cpuTime'] / self.totals['maxCPUTime']).sort_index()
+
+    def cpu_efficiency(self):
+        """Return the CPU efficiency (CPU time/wall time) of all jobs."""
+        return self.totals['cpuTime'].sum() / self.totals['maxCPUTime'].sum()
+
+
+class JobDemandStatistics:
+    """Accumulates sketches of the resource demands of the job groups used for demand extraction.
+
+    The jobs are filtered and grouped like with the FilteredJobClassifier, but rare groups are only dropped when the
+    groups are retrieved, as their relative frequency is only known after all jobs have been added.
+    """
+
+    def __init__(self, type_split_cols=None, relative_accuracy=0.01):
+        self.classifier = FilteredJobClassifier(type_split_cols, min_rel_freq=0.0)
+        self.relative_accuracy = relative_accuracy
+        self.groups = {}
+
+    def add_jobs(self, jobs):
+        """Add the supplied jobs to the sketches of their job groups."""
+        for key, jobs_of_group in self.classifier.split(jobs).items():
+            if key not in self.groups:
+                self.groups[key] = JobGroupSketch(self.relative_accuracy)
+
+            self.groups[key].update(jobs_of_group)
+
+    def merge(self, other):
+        """Add the sketches of another instance to this one."""
+        for key, group in other.groups.items():
+            if key in self.groups:
+                self.groups[key].merge(group)
+            else:
+                self.groups[key] = group
+
+    def job_groups(self, min_rel_freq=0.0005):
+        """Return the sketches of the job groups that can be used for demand extraction, without rare groups."""
+        total_jobs = sum(len(group) for group in self.groups.values())
+        if total_jobs == 0:
+            return {}
+
+        return {key: group for key, group in self.groups.items() if len(group) / total_jobs >= min_rel_freq}
+
+
+class CalibrationStatistics:
+    """The mergeable statistics of the job reports that are required for a calibration run."""
+
+    def __init__(self, start, end, freq='h', type_split_cols=None, relative_accuracy=0.01):
+        self.jobslots = JobslotIntegral(start, end, freq=freq)
+        self.job_types = JobTypeStatistics()
+        self.demands = JobDemandStatistics(type_split_cols, relative_accuracy=relative_accuracy)
+
+    def add_jobs(self, jobs):
+        self.jobslots.add_jobs(jobs)
+        self.job_types.add_jobs(jobs)
+        self.demands.add_jobs(jobs)
+
+    def merge(self, other):
+        self.jobslots.merge(other.jobslots)
+        self.job_types.merge(other.job_types)
+        self.demands.merge(other.demands)
@@ -0,0 +1,108 @@
+"""Contains functions to handle the categorical columns of datasets, e.g. workflows or host names.
+
+Categorical columns are stored as Pandas categoricals, i.e. as integer codes referring to a vocabulary of their values.
+Comparisons, joins and groupings of two categoricals only work on their codes if both share the same vocabulary.
+Categories are kept in sorted order. Groupings on categoricals must use observed=True to skip categories without
+values, which returns groups in order of their appearance in older Pandas versions, so results are sorted explicitly
+where their order matters.
+"""
+
+import pandas as pd
+
+from data.dataset import Metric
+
+# Metrics that describe categories of jobs or nodes and are stored as categoricals
+category_metrics = [
+    Metric.WORKFLOW,
+    Metric.SUBMISSION_TOOL,
+    Metric.JOB_TYPE,
+    Metric.JOB_CATEGORY,
+    Metric.TASK_NAME,
+    Metric.HOST_NAME,
+]
+
+
+def is_categorical(series):
+    """Return whether the series has a categorical data type."""
+    return isinstance(series.dtype, pd.api.types.CategoricalDtype)
+
+
+def to_categorical(df, metrics=None):
+    """Convert the columns of the supplied metrics contained in the data frame to categoricals.
+
+    :param df: The data frame, which is modified.
+    :param metrics: The metrics to convert. If None, all category metrics are converted.
+    :return: The data frame with converted columns.
+    """
+    if metrics is None:
+        metrics = category_metrics
+
+    for metric in metrics:
+        col = metric.value
+        if col in df.columns and not is_categorical(df[col]):
+            df[col] = df[col].astype('category')
+
+    return df
+
+
+def unify_categories(dfs, metrics=None):
+    """Set the categories of categorical columns in multiple data frames to the union of their categories, so all of
+    the data frames share the same vocabulary for the column.
+
+    :param dfs: A list of data frames.
+    :param metrics: The metrics whose columns are unified. If None, all category metrics are unified.
+    :return: A list of (shallow) copies of the data frames with unified categorical columns.
+    """
+    if metrics is None:
+        metrics = category_metrics
+
+    dfs = [df.copy(deep=False) for df in dfs]
+
+    for metric in metrics:
+        col = metric.value
+        columns = [df[col] for df in dfs if col in df.columns]
+
+        # Only columns that are categorical everywhere can be unified
+        if not columns or not all(is_categorical(column) for column in columns):
+            continue
+
+        categories = columns[0].cat.categories
+        for column in columns[1:]:
+            categories = categories.union(column.cat.categories)
+
+        for df in dfs:
+            if col in df.columns and not df[col].cat.categories.equals(categories):
+                df[col] = df[col].cat.set_categories(categories)
+
+    return dfs
+
+
+def fill_category(series, value):
+    """Fill null values of a (possibly categorical) series with the supplied value.
+
+    The value is added to the categories of categorical series if required.
+    """
+    if is_categorical(series) and value not in series.cat.categories:
+        series = series.cat.set_categories(series.cat.categories.union([value]))
+
+    return series.fillna(value)
+
+
+def fill_missing(df, values):
+    """Fill null values in the columns of the data frame like DataFrame.fillna with a dictionary of values, but also
+    handle categorical columns.
+    """
+    df = df.copy()
+
+    for col, value in values.items():
+        df[col] = fill_category(df[col], value)
+
+    return df
+
+
+def remove_unused_categories(series):
+    """Remove categories without any values from a categorical series, other series are returned unchanged."""
+    if is_categorical(series):
+        return series.cat.remove_unused_categories()
+
+    return series
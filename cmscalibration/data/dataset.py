@@ -78,6 +78,7 @@ class Metric(Enum):
     HOST_NAME = 'HostName'
     CPU_NAME = 'name'
     NODE_COUNT = 'nodeCount'
+    NODE_TYPE = 'nodeType'
 
     INTERCONNECT_TYPE = 'Interconnect'
 
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from data import categorical
+
+
+class NodeIndex:
+    """Maps the host names of nodes to the IDs of their node types.
+
+    The host names are stored in a hashed index, with the node type ID of each host in an array of the same order.
+    Host names of jobs are mapped to node types with a single lookup in the index, which is only done once for each
+    host name.
+    """
+
+    def __init__(self, hosts, node_types):
+        """Create a new index.
+
+        :param hosts: The unique host names of the nodes.
+        :param node_types: The node type IDs of the hosts, in the same order as the hosts.
+        """
+        self.hosts = pd.Index(np.asarray(hosts, dtype=object))
+        self.node_types = np.asarray(node_types, dtype=np.int64)
+
+        if not self.hosts.is_unique:
+            raise ValueError("Host names in the node index must be unique!")
+
+    def __len__(self):
+        return len(self.hosts)
+
+    def host_positions(self, host_names):
+        """Return the positions of the supplied host names in the index, or -1 for unknown host names."""
+        codes, uniques = factorize_hosts(host_names)
+
+        # Look up each distinct host name only once and map the codes of the values to the positions
+        unique_positions = np.append(self.hosts.get_indexer(uniques), -1)
+        return unique_positions[codes]
+
+    def lookup(self, host_names):
+        """Return the node type IDs of the supplied host names, or -1 for unknown host names."""
+        positions = self.host_positions(host_names)
+        return np.append(self.node_types, -1)[positions]
+
+
+def factorize_hosts(host_names):
+    """Encode host names as codes into an array of their distinct values, with the code -1 for missing host names.
+
+    The categories of categorical host names are used as distinct values without hashing the host names again.
+
+    :return: A tuple of the codes of the host names and the array of distinct host names.
+    """
+    if categorical.is_categorical(host_names):
+        return np.asarray(host_names.cat.codes), np.asarray(host_names.cat.categories, dtype=object)
+
+    codes, uniques = pd.factorize(host_names)
+    return codes, np.asarray(uniques, dtype=object)
@@ -36,6 +36,25 @@ class CalibrationParameterExporter:
 
         logging.info("Finished exporting calibration parameters.")
 
+    def export_sweep(self, node_type_sets, node_file_names, job_demands, job_file_name):
+        """Export multiple sets of node types, e.g. from a scaling sweep, that share the same job demands to the
+        specified location. The job demands are only exported once.
+        """
+
+        logging.info("Exporting {} sets of calibration parameters to path {}."
+                     .format(len(node_type_sets), self.base_path))
+
+        os.makedirs(self.base_path, exist_ok=True)
+
+        for node_types, node_file_name in zip(node_type_sets, node_file_names):
+            path = os.path.join(self.base_path, node_file_name)
+            self.node_exporter.export_to_json_file(node_types, path)
+
+        path = os.path.join(self.base_path, job_file_name)
+        self.job_exporter.export_to_json_file(job_demands, path)
+
+        logging.info("Finished exporting calibration parameters.")
+
 
 class NodeTypeExporter(JSONExporter):
 
@@ -0,0 +1,107 @@
+import json
+import logging
+import os
+
+import pandas as pd
+
+from data.dataset import Dataset
+from importers.parquetimport import ParquetDatasetImporter
+
+
+class PartitionedDatasetExporter:
+    """Exports a dataset into partitions of Parquet files, split up by the time periods of one of its metrics.
+
+    A dataset description file listing all partitions is written alongside, so the exported dataset can be imported
+    with a DatasetImporter and the ParquetDatasetImporter. Exporting into an existing location adds to and replaces
+    partitions of the existing description.
+    """
+
+    def __init__(self, base_path, name='dataset', freq='D', description_file='dataset.json'):
+        self.base_path = base_path
+        self.name = name
+        self.freq = freq
+        self.description_path = os.path.join(base_path, description_file)
+
+    def export(self, dataset: Dataset, partition_metric):
+        """Export the dataset, partitioned by the time stamps in the column of the supplied metric.
+
+        :return: The path to the dataset description file.
+        """
+        df = dataset.df
+
+        periods = df[dataset.col(partition_metric)].dt.floor(self.freq)
+
+        missing_periods = periods.isnull().sum()
+        if missing_periods > 0:
+            logging.warning("Dropping {} entries without {} values from partitioned export."
+                            .format(missing_periods, partition_metric.value))
+
+        return self.export_partitions(df.groupby(periods), extra_dfs=dataset.extra_dfs, dataset_name=dataset.name)
+
+    def export_partitions(self, partitions, extra_dfs=None, dataset_name=None):
+        """Export partitions that are supplied as pairs of the start of their period and their data frame.
+
+        Partitions are written one after another, so they can be created lazily (e.g. by a generator) and only a single
+        partition has to be kept in memory.
+
+        :param partitions: An iterable of (period start, data frame) pairs.
+        :param extra_dfs: Additional tables of the dataset, which are partitioned by the index of the partitions.
+        :param dataset_name: The name of the exported dataset, used for logging.
+        :return: The path to the dataset description file.
+        """
+        os.makedirs(self.base_path, exist_ok=True)
+
+        if extra_dfs is None:
+            extra_dfs = {}
+
+        file_entries = []
+
+        for period_start, partition in partitions:
+            index_col = partition.index.name
+
+            period_start = pd.Timestamp(period_start)
+            period_end = period_start + pd.tseries.frequencies.to_offset(self.freq)
+
+            file_name = '{}-{}.parquet'.format(self.name, period_start.strftime('%Y%m%d-%H%M%S'))
+            path = os.path.join(self.base_path, file_name)
+
+            partition.reset_index().to_parquet(path)
+
+            for table_name, table in extra_dfs.items():
+                if index_col not in table.columns:
+                    logging.warning("Cannot partition table {} without column {}, skipping it."
+                                    .format(table_name, index_col))
+                    continue
+
+                table_path = ParquetDatasetImporter.extra_table_path(path, table_name)
+                os.makedirs(os.path.dirname(table_path), exist_ok=True)
+
+                table[table[index_col].isin(partition.index)].reset_index(drop=True).to_parquet(table_path)
+
+            file_entries.append({'file': file_name, 'start': period_start.isoformat(), 'end': period_end.isoformat()})
+
+            logging.debug("Exported partition {} with {} entries.".format(file_name, partition.shape[0]))
+
+        self._update_description(file_entries)
+
+        logging.info("Exported {} partitions of dataset {} to {}."
+                     .format(len(file_entries), dataset_name, self.base_path))
+
+        return self.description_path
+
+    def _update_description(self, file_entries):
+        files = {}
+
+        if os.path.isfile(self.description_path):
+            with open(self.description_path, 'r') as file:
+                files = {entry['file']: entry for entry in json.load(file).get('files', [])}
+
+        files.update({entry['file']: entry for entry in file_entries})
+
+        description = {
+            'name': self.name,
+            'files': sorted(files.values(), key=lambda x: x['start'])
+        }
+
+        with open(self.description_path, 'w') as file:
+            json.dump(description, file, indent=4)
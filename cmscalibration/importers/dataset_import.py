@@ -53,13 +53,21 @@ class DatasetImporter:
     def __init__(self, file_data_importer: MultiFileDataImporter):
         self._importer = file_data_importer
 
-    def import_dataset(self, dataset_description_path, start_date, end_date):
-        """Import data from a dataset, only importing files that intersect with the supplied time frame."""
+    def import_dataset(self, dataset_description_path, start_date, end_date, file_margin=None):
+        """Import data from a dataset, only importing files that intersect with the supplied time frame.
+
+        :param file_margin: An optional time delta the time frame is extended by in both directions when selecting the
+        files, e.g. if the entries of a file can be shifted into the time frame of adjacent files by time zone
+        corrections. The imported entries are still limited to the supplied time frame.
+        """
 
         base_path = os.path.dirname(dataset_description_path)
 
         description = DatasetDescription(dataset_description_path)
-        file_names = description.files_for_period(start_date, end_date)
+        if file_margin is None:
+            file_names = description.files_for_period(start_date, end_date)
+        else:
+            file_names = description.files_for_period(start_date - file_margin, end_date + file_margin)
         file_paths = [os.path.join(base_path, name) for name in file_names]
 
         dataset = self._importer.import_file_list(file_paths, start_date, end_date)
@@ -4,6 +4,7 @@ import numpy as np
 import pandas as pd
 
 from data.dataset import Metric
+from data.nodeindex import NodeIndex
 from interfaces.fileimport import FileDataImporter
 
 
@@ -47,6 +48,15 @@ class GridKaNodeDataImporter:
 
         self.dropped_columns = []
 
+        # Nodes with identical values in these columns are of the same node type
+        self.node_type_columns = [
+            Metric.CPU_NAME.value,
+            Metric.JOBSLOT_COUNT.value,
+            Metric.PHYSICAL_CORE_COUNT.value,
+            Metric.BENCHMARK_TOTAL.value,
+            Metric.INTERCONNECT_TYPE.value
+        ]
+
     def import_file(self, path):
         logging.info("Reading GridKa node data from file {}".format(path))
 
@@ -77,10 +87,30 @@ class GridKaNodeDataImporter:
 
         df = df.rename(columns=metrics)
 
+        # Number the node types, so jobs can refer to the type of the node they were run on with a small integer code
+        # Nodes with null values are numbered as well, with a separate type for each combination of values
+        df[Metric.NODE_TYPE.value] = df.groupby(self.node_type_columns, dropna=False).ngroup().astype(np.int64)
+
         logging.info("GridKa node type file with shape: {} and columns: {}".format(df.shape, df.columns))
 
         return df
 
+    def create_node_index(self, df):
+        """Create the index mapping the host names of the imported nodes to their node types, which is used to match
+        jobs to the nodes they were run on.
+        """
+        hosts = df[Metric.HOST_NAME.value]
+
+        # Only the first entry of duplicated host names is used
+        duplicated = hosts.duplicated() & hosts.notnull()
+        if duplicated.any():
+            logging.warning("Found {} duplicated host names in node data, using their first entries."
+                            .format(duplicated.sum()))
+
+        indexed = ~duplicated & hosts.notnull()
+
+        return NodeIndex(hosts[indexed].values, df.loc[indexed, Metric.NODE_TYPE.value].values)
+
 
 class CoreUsageImporter(FileDataImporter):
     """Imports time series information about the count of used cores in the format provided by GridKa."""
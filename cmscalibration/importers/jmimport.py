@@ -2,6 +2,7 @@ import logging
 
 import pandas as pd
 
+from data import categorical
 from data.dataset import Metric, Dataset
 from interfaces.fileimport import MultiFileDataImporter
 from utils import unique_identifier
@@ -57,11 +58,15 @@ class JMImporter(ReportingEntity, MultiFileDataImporter):
         'NEvProc': Metric.EVENT_COUNT,
     }
 
-    def __init__(self, timezone_correction=None, hostname_suffix='', with_files=True, report_builder=None):
+    date_filter_metric = Metric.FINISHED_TIME
+
+    def __init__(self, timezone_correction=None, hostname_suffix='', with_files=True, id_hash_method='md5',
+                 report_builder=None):
         super().__init__(report_builder=report_builder)
         self.timezone_correction = timezone_correction
         self.hostname_suffix = hostname_suffix
         self.with_files = with_files
+        self.id_hash_method = id_hash_method
 
         self.key_columns = ['JobId', 'StartedRunningTimeStamp', 'FinishedTimeStamp']
         self.time_stamp_columns = ['StartedRunningTimeStamp', 'FinishedTimeStamp', 'JobExecExitTimeStamp']
@@ -69,8 +74,6 @@ class JMImporter(ReportingEntity, MultiFileDataImporter):
         self.id_column = 'UniqueID'
         self.file_column = 'FileName'
 
-        self.date_filter_metric = Metric.FINISHED_TIME
-
         self.required_columns = set(self.defined_metrics.keys()) | set(self.key_columns)
         if self.with_files:
             self.required_columns.add(self.file_column)
@@ -129,8 +132,9 @@ class JMImporter(ReportingEntity, MultiFileDataImporter):
             logging.debug("Found ID column in Jobmonitoring data.")
         else:
             logging.info("Could not find ID column in Jobmonitoring data.")
-            logging.info("Generating unique ID from columns {}. This may take a while.".format(self.key_columns))
-            df[self.id_column] = unique_identifier.hash_columns(df, self.key_columns)
+            logging.info("Generating unique ID from columns {} with method {}."
+                         .format(self.key_columns, self.id_hash_method))
+            df[self.id_column] = unique_identifier.hash_columns(df, self.key_columns, method=self.id_hash_method)
 
         # Set up table with files for later setting it in the dataset
         additional_tables = {}
@@ -154,6 +158,9 @@ class JMImporter(ReportingEntity, MultiFileDataImporter):
         # Only keep columns defined in metric dictionary
         jobs = self._subset_with_spec_columns(jobs)
 
+        # Store categories of jobs, e.g. workflows and host names, as integer codes
+        jobs = categorical.to_categorical(jobs)
+
         # Convert into Dataset and return
         job_dataset = Dataset(jobs, name="Jobmonitoring Jobs", start=start, end=end, extra_dfs=additional_tables)
 
@@ -201,6 +208,9 @@ class JMImporter(ReportingEntity, MultiFileDataImporter):
         df = df[[self.id_column, self.file_column]]
 
         files = df.drop_duplicates().reset_index(drop=True)
+
+        # Dictionary-encode file names, they are long and repeated often
+        files[self.file_column] = files[self.file_column].astype('category')
         return files
 
     def _get_file_df(self, jmdf):
@@ -0,0 +1,81 @@
+import logging
+import os
+
+import pandas as pd
+
+from data import categorical
+from data.dataset import Dataset
+from interfaces.fileimport import MultiFileDataImporter
+
+
+class ParquetDatasetImporter(MultiFileDataImporter):
+    """Imports datasets that have been converted into daily partitions of Parquet files.
+
+    Partitions contain the already normalized dataset, so no conversions have to be applied when importing them.
+    Additional tables of a partition (e.g. file lists of jobs) are stored next to the partition in a subdirectory
+    with the table's name.
+    """
+
+    def __init__(self, index_col, date_filter_metric, columns=None, extra_tables=None, name='dataset'):
+        """Create a new importer.
+
+        :param index_col: The column containing the index of the dataset.
+        :param date_filter_metric: The metric used to filter the dataset to the imported time frame.
+        :param columns: The columns to import. If None, all columns are imported.
+        :param extra_tables: The names of the additional tables to import with the dataset.
+        :param name: The name of the imported dataset.
+        """
+        self.index_col = index_col
+        self.date_filter_metric = date_filter_metric
+        self.columns = columns
+        self.extra_tables = extra_tables if extra_tables is not None else []
+        self.name = name
+
+    def import_file(self, path, start_date=None, end_date=None):
+        return self.import_file_list([path], start_date, end_date)
+
+    def import_file_list(self, path_list, start_date=None, end_date=None):
+        logging.debug("Reading Parquet partitions from paths {}.".format(path_list))
+
+        columns = None
+        if self.columns is not None:
+            columns = [self.index_col] + [col for col in self.columns if col != self.index_col]
+
+        df_list = [pd.read_parquet(path, columns=columns) for path in path_list]
+
+        # Categorical columns of all partitions must share their categories to remain categorical when concatenated
+        df = pd.concat(categorical.unify_categories(df_list))
+        df = df.set_index(self.index_col)
+
+        additional_tables = {}
+        for table_name in self.extra_tables:
+            table_paths = [self.extra_table_path(path, table_name) for path in path_list]
+            additional_tables[table_name] = pd.concat([pd.read_parquet(path) for path in table_paths],
+                                                      ignore_index=True)
+
+        dataset = Dataset(df, name=self.name, start=start_date, end=end_date, extra_dfs=additional_tables)
+
+        entries_all_dates = dataset.df.shape[0]
+        self.filter_with_date_range(dataset, start_date, end_date)
+        logging.debug("Read {} entries from Parquet partitions, {} within dates {} and {}."
+                      .format(entries_all_dates, dataset.df.shape[0], start_date, end_date))
+
+        return dataset
+
+    def filter_with_date_range(self, dataset, start_date, end_date):
+        """Filter the data in the supplied dataset to only contain data within the provided time frame."""
+
+        df = dataset.df
+
+        if start_date:
+            df = df[df[dataset.col(self.date_filter_metric)] >= start_date]
+        if end_date:
+            df = df[df[dataset.col(self.date_filter_metric)] <= end_date]
+
+        dataset.df = df
+
+    @staticmethod
+    def extra_table_path(path, table_name):
+        """Return the path of an additional table belonging to the partition at the supplied path."""
+        directory, file_name = os.path.split(path)
+        return os.path.join(directory, table_name, file_name)
@@ -1,7 +1,15 @@
+import bz2
+import gzip
+import itertools
+import json
 import logging
+import lzma
+import os
 
+import numpy as np
 import pandas as pd
 
+from data import categorical
 from data.dataset import Metric, Dataset
 from interfaces.fileimport import MultiFileDataImporter
 
@@ -46,17 +54,23 @@ class SummarizedWMAImporter(MultiFileDataImporter):
         'wn_name': Metric.HOST_NAME
     }
 
-    def __init__(self, with_files=True):
+    def __init__(self, with_files=True, chunksize=None):
         """Create a new importer.
 
         :param with_files: If true, also import the file list associated with each row.
+        :param chunksize: If set, files are read in chunks of this number of lines. Only the required fields are kept
+        from each chunk and entries outside of the imported time frame are dropped before reading the next chunk.
         """
         self.id_column = 'wmaid'
         self.with_files = with_files
+        self.chunksize = chunksize
 
         self.date_filter_metric = Metric.STOP_TIME
         self.file_column = 'LFNArray'
 
+        # Fields that are not converted to numbers when reading in chunks
+        self.non_numeric_columns = {self.id_column, self.file_column, 'task', 'jobtype', 'task_name', 'wn_name'}
+
         self.timestamp_columns = ['stopTime', 'startTime', 'ts']
 
         # Keep track of which columns are required for this to importers correctly
@@ -71,7 +85,10 @@ class SummarizedWMAImporter(MultiFileDataImporter):
     def import_file_list(self, path_list, start_date, end_date):
         logging.debug("Importing WMArchive data from paths: {}.".format(path_list))
 
-        wmdf_list = [pd.read_json(path, lines=True) for path in path_list]
+        if self.chunksize:
+            wmdf_list = [self._read_json_chunked(path, start_date, end_date) for path in path_list]
+        else:
+            wmdf_list = [pd.read_json(path, lines=True) for path in path_list]
 
         logging.debug("Reading complete.")
 
@@ -93,6 +110,9 @@ class SummarizedWMAImporter(MultiFileDataImporter):
 
         wmdf = self._subset_with_spec_columns(jobs)
 
+        # Store categories of jobs, e.g. workflows and host names, as integer codes
+        wmdf = categorical.to_categorical(wmdf)
+
         # Create dataset
         job_dataset = Dataset(wmdf, name="WMArchive Jobs", start=start_date, end=end_date, extra_dfs=additional_tables)
 
@@ -166,15 +186,112 @@ class SummarizedWMAImporter(MultiFileDataImporter):
         self._convert_columns(wmdf)
         return wmdf
 
+    def _read_json_chunked(self, path, start_date=None, end_date=None):
+        """Read a JSON lines file in chunks, only keeping required fields and entries within the supplied dates.
+
+        The fields are converted to typed columns for each chunk, so the result has the same columns and types as
+        when reading the whole file at once. Files compressed with gzip, bzip2 or xz are decompressed while reading.
+        """
+        logging.debug("Reading WMArchive file from {} in chunks of {} lines.".format(path, self.chunksize))
+
+        columns = [self.id_column] + list(self.provided_metrics.keys())
+        if self.with_files:
+            columns.append(self.file_column)
+
+        # Order of the first appearance of the fields in the file, fields that never appear are not imported
+        field_order = {}
+
+        chunk_list = []
+        lines_read = 0
+
+        with _open_text(path) as file:
+            while True:
+                lines = list(itertools.islice(file, self.chunksize))
+                if not lines:
+                    break
+
+                lines_read += len(lines)
+
+                records = [json.loads(line) for line in lines if line.strip()]
+                for record in records:
+                    if len(field_order) == len(columns):
+                        break
+                    field_order.update(dict.fromkeys(key for key in record if key in columns))
+
+                # Project records to the required fields before building the chunk
+                chunk = pd.DataFrame.from_records(([record.get(col) for col in columns] for record in records),
+                                                  columns=columns)
+                chunk = self._convert_field_types(chunk)
+
+                chunk_list.append(self._filter_raw_dates(chunk, start_date, end_date))
+
+        if not chunk_list:
+            return pd.DataFrame(columns=columns)
+
+        df = pd.concat(chunk_list, ignore_index=True)[list(field_order)]
+
+        # Infer the types of the non-numeric columns like for files that are read at once
+        df = df.infer_objects()
+
+        logging.debug("Read {} lines, kept {} entries within dates {} and {}."
+                      .format(lines_read, df.shape[0], start_date, end_date))
+
+        return df
+
+    def _convert_field_types(self, chunk):
+        """Convert the fields of a chunk to the same types for each chunk, even if fields are missing in a chunk."""
+        for col in chunk.columns:
+            if col in self.non_numeric_columns:
+                values = chunk[col].astype(object)
+                chunk[col] = values.where(values.notnull(), np.nan)
+            else:
+                chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
+
+        return chunk
+
+    def _filter_raw_dates(self, df, start_date, end_date):
+        """Filter entries from raw data with epoch time stamps, like filter_with_date_range filters converted data."""
+        stop_column = [col for col, metric in self.provided_metrics.items() if metric == self.date_filter_metric][0]
+        epochs = pd.to_numeric(df[stop_column], errors='coerce')
+
+        # Invalid time stamps are converted to null values and would be removed as well
+        mask = epochs > 0
+        if start_date:
+            mask &= epochs >= (pd.Timestamp(start_date) - pd.Timestamp(0)).total_seconds()
+        if end_date:
+            mask &= epochs <= (pd.Timestamp(end_date) - pd.Timestamp(0)).total_seconds()
+
+        return df[mask]
+
     def _get_file_table(self, wmdf, additional_cols=None):
         if additional_cols is None:
             additional_cols = []
 
-        wmdf = wmdf[[self.id_column, self.file_column] + additional_cols]
+        # Entries without a list of files do not contribute to the file table
+        file_lists = wmdf[self.file_column].values
+        list_positions = np.flatnonzero([isinstance(files, list) for files in file_lists])
+        file_lists = file_lists[list_positions]
+
+        lengths = np.fromiter(map(len, file_lists), dtype=np.int64, count=len(file_lists))
+
+        # Flat array of all files, the files of each job are in consecutive rows
+        flat_files = np.array(list(itertools.chain.from_iterable(file_lists)), dtype=object)
+        job_positions = np.repeat(list_positions, lengths)
+
+        # Dictionary-encode file names, they are long and repeated often
+        file_codes, file_names = pd.factorize(flat_files)
+
+        wm_files = pd.DataFrame({'FileName': pd.Categorical.from_codes(file_codes, file_names)})
+        for col in [self.id_column] + additional_cols:
+            wm_files[col] = wmdf[col].values[job_positions]
 
-        # Files from WMArchive table
-        s = wmdf.apply(lambda x: pd.Series(x[self.file_column]), axis=1).stack().reset_index(level=1, drop=True)
-        s.name = 'FileName'
-        wm_files = wmdf.drop(self.file_column, axis=1).join(s)
         wm_files = wm_files[['FileName', self.id_column] + additional_cols].drop_duplicates().reset_index(drop=True)
         return wm_files
+
+
+def _open_text(path):
+    """Open a text file for reading, decompressing it if the file extension denotes a compressed file."""
+    openers = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+    opener = openers.get(os.path.splitext(path)[1].lower(), open)
+
+    return opener(path, 'rt')
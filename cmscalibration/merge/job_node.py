@@ -1,40 +1,47 @@
 import logging
 
+import numpy as np
 import pandas as pd
 
 from data.dataset import Metric
+from data.nodeindex import NodeIndex, factorize_hosts
 
 
-def match_jobs_to_node(jobs: pd.DataFrame, nodes: pd.DataFrame):
-    """Match job information to node performance information and return a dataframe that contains the union of
-    the previous columns.
-    """
+def match_jobs_to_node(jobs: pd.DataFrame, node_index: NodeIndex):
+    """Match job information to nodes and return the jobs with the node type ID of the node they were run on.
 
-    all_job_nodes = jobs[Metric.HOST_NAME.value].unique()
-    available_hosts = nodes[Metric.HOST_NAME.value].unique()
+    Jobs on unknown hosts are assigned the node type ID -1. Node attributes are not copied to the jobs, but can be
+    looked up from the node types with nodeanalysis.node_type_attributes.
 
-    logging.debug("Number of hosts jobs were run on: {}".format(len(all_job_nodes)))
-    logging.debug("Number of hosts in resource environment: {}".format(len(available_hosts)))
+    :param node_index: The index of the host names of the nodes, as created by the node data importer.
+    """
+    # Encode the host names of the jobs once and look up the node type of each distinct host name
+    host_codes, host_names = factorize_hosts(jobs[Metric.HOST_NAME.value])
+    host_node_types = node_index.lookup(host_names)
 
-    unmatched_job_nodes = [node for node in all_job_nodes if node not in available_hosts]
+    host_counts = np.bincount(host_codes[host_codes >= 0], minlength=len(host_names))
+    with_jobs = host_counts > 0
+    job_host_counts = pd.Series(host_counts, index=host_names)[with_jobs]
+    unmatched_host_counts = job_host_counts[host_node_types[with_jobs] < 0].sort_values(ascending=False)
 
-    nodes_without_jobs = [node for node in available_hosts if node not in all_job_nodes]
+    logging.debug("Number of hosts jobs were run on: {}".format(len(job_host_counts)))
+    logging.debug("Number of hosts in resource environment: {}".format(len(node_index)))
 
-    logging.debug("Found {} nodes with jobs.".format(len([node for node in all_job_nodes if node in available_hosts])))
-    logging.debug("Found {} unmatched job nodes: {}".format(len(unmatched_job_nodes), unmatched_job_nodes))
+    matched_host_count = len(job_host_counts) - len(unmatched_host_counts)
+    logging.debug("Found {} nodes with jobs.".format(matched_host_count))
+    logging.debug("Found {} unmatched job nodes: {}".format(len(unmatched_host_counts),
+                                                            list(unmatched_host_counts.index)))
 
     logging.debug("Number of jobs per unmatched job node:")
-    # Retrieve number of jobs that cannot be matched
-    logging.debug(", ".join(
-        ["node: {}, jobs: {}".format(node, jobs[jobs[Metric.HOST_NAME.value] == node].shape[0]) for node in
-         unmatched_job_nodes]))
+    logging.debug(", ".join(["node: {}, jobs: {}".format(node, count) for node, count in unmatched_host_counts.items()]))
 
-    logging.debug("Found {} nodes without jobs.".format(len(nodes_without_jobs)))
+    logging.debug("Found {} nodes without jobs.".format(len(node_index) - matched_host_count))
 
-    # Merge jobs and nodes tables
-    jobs_nodes = pd.merge(jobs, nodes, how='left', on=Metric.HOST_NAME.value)
+    # Assign the node type IDs to the jobs via the host codes, like a left merge on the host names
+    jobs_nodes = jobs.reset_index(drop=True)
+    jobs_nodes[Metric.NODE_TYPE.value] = np.append(host_node_types, -1)[host_codes]
 
-    logging.debug("Joined {} job rows to {} node rows, result with {} rows"
-                  .format(jobs.shape[0], nodes.shape[0], jobs_nodes.shape[0]))
+    logging.debug("Assigned node types of {} nodes to {} jobs, {} jobs without node type"
+                  .format(len(node_index), jobs_nodes.shape[0], (jobs_nodes[Metric.NODE_TYPE.value] < 0).sum()))
 
     return jobs_nodes
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import logging
+import os
+
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+from data.dataset import Dataset, Metric
+from importers.dataset_import import DatasetDescription
+
+
+class MatchCache:
+    """Caches matches between JobMonitoring and WMArchive job reports in time partitions on disk.
+
+    Each partition contains the matches of the Jobmonitoring reports that stopped within its period. Partitions are
+    daily, or as long as the time groups of the matcher if these span multiple days. Partitions are addressed by a key
+    computed from the content hashes of all input files the partition's reports can originate from, the part of the
+    calibration window relevant for the partition and the matching parameters. Changed input files or parameters lead
+    to new keys, so only the affected partitions have to be matched again.
+
+    Only matching on CPU time is supported, as it never matches reports of different partitions and never matches
+    reports without stop time stamps. Matching on files or workflows depends on the reports of all partitions.
+    """
+
+    def __init__(self, cache_dir, dataset_description_paths, parameters=None, partition_margin='1 days'):
+        """Create a new match cache.
+
+        :param cache_dir: The directory the partitions are stored in.
+        :param dataset_description_paths: The paths to the descriptions of the datasets the matches are computed from.
+        :param parameters: Additional parameters that influence the matches, e.g. importer settings. Must be
+        serializable to JSON.
+        :param partition_margin: The margin around each day in which reports can affect the matches of the day.
+        Days within this margin of the calibration window borders are only reused for identical window borders.
+        """
+        self.cache_dir = cache_dir
+        self.descriptions = [(os.path.dirname(path), DatasetDescription(path)) for path in dataset_description_paths]
+        self.parameters = parameters if parameters is not None else {}
+        self.partition_margin = pd.Timedelta(partition_margin)
+
+        self.digest_file = os.path.join(cache_dir, 'digests.json')
+        self._digests = None
+
+    def match_reports(self, matcher, jmset: Dataset, wmset: Dataset, start_date, end_date, use_files=False,
+                      use_workflows=False):
+        """Match the reports from both datasets, reusing all partitions from the cache that are still valid.
+
+        :param matcher: The JobReportMatcher used to match days that are not in the cache.
+        :param use_files: Must be false, matching on files is not supported by the cache.
+        :param use_workflows: Must be false, matching on workflows is not supported by the cache.
+        :return: A data frame containing matches from the index columns of the two datasets.
+        """
+        if use_files or use_workflows:
+            raise ValueError("The match cache only supports matching on CPU time, not on files or workflows!")
+
+        partition_length = self.partition_length(matcher.time_grouping_freq)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Reports without stop time stamps are never matched on CPU time, so they are not part of any partition
+        jm_days = jmset.df[jmset.col(Metric.STOP_TIME)].dt.floor(partition_length)
+        days = sorted(jm_days.dropna().unique())
+
+        parameters = dict(self.parameters, timestampTolerance=matcher.timestamp_tolerance,
+                          timeGroupingFreq=matcher.time_grouping_freq)
+
+        keys = {pd.Timestamp(day): self.partition_key(pd.Timestamp(day), start_date, end_date, parameters,
+                                                      partition_length=partition_length)
+                for day in days}
+
+        cached_list = []
+        stale_days = []
+
+        for day, key in keys.items():
+            path = self._partition_path(day, key)
+
+            if os.path.isfile(path):
+                cached_list.append(pd.read_csv(path, usecols=[jmset.df.index.name, wmset.df.index.name]))
+            else:
+                stale_days.append(day)
+
+        logging.info("Loaded {} of {} days from match cache {}, matching {} days."
+                     .format(len(cached_list), len(keys), self.cache_dir, len(stale_days)))
+
+        match_list = cached_list
+
+        if stale_days:
+            new_matches = self._match_days(matcher, jmset, wmset, jm_days, stale_days, partition_length)
+
+            unique_jm_days = jm_days[~jm_days.index.duplicated()]
+            new_match_days = unique_jm_days.reindex(new_matches[jmset.df.index.name]).values
+
+            for day in stale_days:
+                day_matches = new_matches[new_match_days == day.to_datetime64()]
+                self._store_partition(day, keys[day], day_matches)
+
+            match_list.append(new_matches)
+
+        self._write_digests()
+
+        if not match_list:
+            return pd.DataFrame(columns=[jmset.df.index.name, wmset.df.index.name])
+
+        return pd.concat(match_list).reset_index(drop=True)
+
+    @staticmethod
+    def partition_length(time_grouping_freq):
+        """Return the length of the partitions for the supplied time grouping frequency of the matcher.
+
+        Partitions are daily, unless the time groups span multiple days. Then each partition is a single time group, so
+        no time group is split between partitions.
+        """
+        day = pd.Timedelta('1 days')
+
+        if time_grouping_freq is None:
+            # Reports are matched with a tolerance window, the candidates of the border reports are added to each day
+            return day
+
+        try:
+            group_length = pd.Timedelta(to_offset(time_grouping_freq).nanos, unit='ns')
+        except ValueError:
+            raise ValueError("The match cache requires a fixed time grouping frequency, got {}!"
+                             .format(time_grouping_freq))
+
+        if day % group_length == pd.Timedelta(0):
+            return day
+        elif group_length % day == pd.Timedelta(0):
+            return group_length
+        else:
+            raise ValueError("The time grouping frequency {} of the match cache must divide a day or be a multiple "
+                             "of a day!".format(time_grouping_freq))
+
+    def partition_key(self, day, start_date, end_date, parameters, partition_length=pd.Timedelta('1 days')):
+        """Compute the key of the partition starting at the supplied day."""
+
+        # Reports within the margin of the partition can influence its matches
+        period_start = max(day - self.partition_margin, start_date)
+        period_end = min(day + partition_length + self.partition_margin, end_date)
+
+        file_digests = []
+        for base_path, description in self.descriptions:
+            file_names = description.files_for_period(period_start, period_end)
+
+            file_digests.append(sorted(self.file_digest(os.path.join(base_path, name)) for name in file_names))
+
+        key_content = {
+            'period': [str(period_start), str(period_end)],
+            'files': file_digests,
+            'parameters': parameters
+        }
+
+        return hashlib.sha1(json.dumps(key_content, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def file_digest(self, path):
+        """Return the content hash of a file. Hashes are only recomputed if the size or modification time changed."""
+
+        if self._digests is None:
+            self._digests = self._read_digests()
+
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+
+        entry = self._digests.get(path)
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return entry['digest']
+
+        logging.debug("Computing content hash of file {}.".format(path))
+
+        h = hashlib.sha1()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                h.update(block)
+
+        digest = h.hexdigest()
+        self._digests[path] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'digest': digest}
+
+        return digest
+
+    def _match_days(self, matcher, jmset: Dataset, wmset: Dataset, jm_days, days, partition_length):
+        """Match only the Jobmonitoring reports that stopped within the partitions starting at the supplied days."""
+
+        jmdf = jmset.df[jm_days.isin(days)]
+
+        # WMArchive reports within the tolerance of the partitions are potential candidates
+        tolerance = pd.Timedelta(seconds=matcher.timestamp_tolerance)
+        wm_stop = wmset.df[wmset.col(Metric.STOP_TIME)]
+        wm_mask = (wm_stop - tolerance).dt.floor(partition_length).isin(days) | \
+            (wm_stop + tolerance).dt.floor(partition_length).isin(days)
+        wmdf = wmset.df[wm_mask]
+
+        jm_subset = Dataset(jmdf, name=jmset.name, start=jmset.start, end=jmset.end, extra_dfs=jmset.extra_dfs)
+        wm_subset = Dataset(wmdf, name=wmset.name, start=wmset.start, end=wmset.end, extra_dfs=wmset.extra_dfs)
+
+        return matcher.match_reports(jm_subset, wm_subset, use_files=False, use_workflows=False)
+
+    def _store_partition(self, day, key, matches):
+        # Remove outdated partitions of the same day
+        prefix = self._partition_prefix(day)
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.startswith(prefix):
+                os.remove(os.path.join(self.cache_dir, file_name))
+
+        matches.to_csv(self._partition_path(day, key), index=False)
+
+    def _partition_prefix(self, day):
+        return 'matches-{}-'.format(day.strftime('%Y-%m-%d'))
+
+    def _partition_path(self, day, key):
+        return os.path.join(self.cache_dir, '{}{}.csv'.format(self._partition_prefix(day), key[:16]))
+
+    def _read_digests(self):
+        if not os.path.isfile(self.digest_file):
+            return {}
+
+        with open(self.digest_file, 'r') as file:
+            return json.load(file)
+
+    def _write_digests(self):
+        if self._digests is None:
+            return
+
+        with open(self.digest_file, 'w') as file:
+            json.dump(self._digests, file, indent=4, sort_keys=True)
@@ -1,5 +1,9 @@
 import logging
 
+import numpy as np
+import pandas as pd
+
+from data import categorical
 from data.dataset import Dataset
 
 
@@ -14,8 +18,8 @@ class AugmentDatasetMerge:
     def merge_datasets(self, matches, base: Dataset, augment: Dataset, left_index, right_index):
         """Merge two datasets based on a dataframe containing matches between their indices."""
 
-        base_df = base.df
-        augment_df = augment.df
+        # Use a shared vocabulary for categorical columns, so values can be filled in from the other dataset
+        base_df, augment_df = categorical.unify_categories([base.df, augment.df])
 
         # Join with matches, preserving all entries in base dataframe
         half_joined = matches.join(base_df, on=left_index, how='right')
@@ -60,8 +64,8 @@ class UnionDatasetMerge:
     def merge_datasets(self, matches, left: Dataset, right: Dataset, left_index, right_index, left_suffix='left',
                        right_suffix='right'):
 
-        left_df = left.df
-        right_df = right.df
+        # Use a shared vocabulary for categorical columns, so their values can be merged
+        left_df, right_df = categorical.unify_categories([left.df, right.df])
 
         # Join with matches, preserving all entries in base dataframe
         # Right is base data frame, so use right merge
@@ -77,13 +81,8 @@ class UnionDatasetMerge:
         # Todo Actually join values
 
         # Columns that are suffixed are overlapping, included in both data sets
-        for left_col in [col for col in joined.columns if col.endswith(left_suffix)]:
-            col_name = self.remove_trailing(left_col, left_suffix)
-            right_col = col_name + right_suffix
-
-            # if right_col in right_df.columns:
-            # If suffixed column exists, it also exists in other data set
-            joined = self.merge_cols(joined, col_name, left_col, right_col)
+        overlapping = [self.remove_trailing(col, left_suffix) for col in joined.columns if col.endswith(left_suffix)]
+        joined = self.coalesce_columns(joined, overlapping, left_suffix, right_suffix)
 
         # for right_col in set(right_df.columns) - set(left_df.columns):
         #     # col_name = self.remove_trailing(right_col, right_suffix)
@@ -101,14 +100,107 @@ class UnionDatasetMerge:
         result = Dataset(joined, left.name, start=start_date, end=end_date, sep=self.part_sep, extra_dfs=extra_dfs)
         return result
 
-    def merge_cols(self, df, result_col, left_col, right_col):
-        """Merge columns into a new column"""
-        df[result_col] = df[left_col]
-        df[result_col] = df[result_col].where(df[result_col].notnull(), df[right_col])
-        logging.debug(
-            "Column {}: left null: {}, right null: {}; result null: {}".format(result_col, df[left_col].isnull().sum(),
-                                                                               df[right_col].isnull().sum(),
-                                                                               df[result_col].isnull().sum()))
+    def merge_to_partitions(self, matches, left: Dataset, right: Dataset, left_index, right_index, exporter,
+                            partition_metric, left_suffix='left', right_suffix='right'):
+        """Merge two datasets like merge_datasets, but merge and export the result in time partitions.
+
+        Each merged entry is assigned to the period of its (merged) value of the partition metric. Only the entries of
+        one period are joined and coalesced at once and then written by the exporter, so the merged dataset does not
+        have to fit into memory. Entries are indexed by their position in the merged dataset.
+
+        :param exporter: The PartitionedDatasetExporter the merged partitions are written with.
+        :param partition_metric: The time stamp metric the entries are partitioned by, must be part of both datasets.
+        :return: The path to the description file of the exported dataset.
+        """
+        left_df, right_df = categorical.unify_categories([left.df, right.df])
+
+        # Entries are referenced by their row positions, as IDs can be duplicated in the datasets. Pairs of left and
+        # right row positions of all merged entries: matched entries, then left and right entries without match.
+        # Entries without counterpart are assigned position -1. Like with merge_datasets, matches are joined to all
+        # rows with the matched ID.
+        matches = matches[matches[left_index].isin(left_df.index)]
+        matched = matches[[left_index, right_index]] \
+            .merge(pd.DataFrame({left_index: left_df.index.values, 'leftPosition': np.arange(len(left_df))}),
+                   on=left_index) \
+            .merge(pd.DataFrame({right_index: right_df.index.values, 'rightPosition': np.arange(len(right_df))}),
+                   on=right_index, how='left')
+        matched_right = matched['rightPosition'].fillna(-1).values.astype(np.int64)
+
+        left_only = np.flatnonzero(~np.isin(np.arange(len(left_df)), matched['leftPosition'].values))
+        right_only = np.flatnonzero(~right_df.index.isin(matches[right_index]))
+
+        left_positions = np.concatenate([matched['leftPosition'].values, left_only,
+                                         np.full(len(right_only), -1)]).astype(np.int64)
+        right_positions = np.concatenate([matched_right, np.full(len(left_only), -1),
+                                          right_only]).astype(np.int64)
+
+        # The partition metric of the left entry takes precedence, like when coalescing the columns
+        metric_col = partition_metric.value
+        periods = self._take_rows(left_df[[metric_col]], left_positions)[metric_col].reset_index(drop=True)
+        right_periods = self._take_rows(right_df[[metric_col]], right_positions)[metric_col].reset_index(drop=True)
+        periods = periods.fillna(right_periods)
+        periods = periods.dt.floor(exporter.freq)
+
+        overlapping = [col for col in left_df.columns if col in right_df.columns]
+
+        missing_periods = periods.isnull().sum()
+        if missing_periods > 0:
+            logging.warning("Dropping {} entries without {} values from merged partitions."
+                            .format(missing_periods, metric_col))
+
+        def merged_partitions():
+            for period_start, positions in sorted(periods.groupby(periods).indices.items()):
+                yield period_start, self._merge_partition(
+                    self._take_rows(left_df, left_positions[positions], left_index),
+                    self._take_rows(right_df, right_positions[positions], right_index), positions, left_index,
+                    right_index, overlapping, left_suffix, right_suffix)
+
+        return exporter.export_partitions(merged_partitions(), dataset_name=left.name)
+
+    @staticmethod
+    def _take_rows(df, positions, index_name=None):
+        """Return the rows at the supplied positions, with null rows including a null index for positions -1."""
+        valid = positions >= 0
+
+        rows = df.iloc[positions[valid]].rename_axis(index_name).reset_index()
+        rows.index = np.flatnonzero(valid)
+
+        return rows.reindex(np.arange(len(positions))).set_index(rows.columns[0])
+
+    def _merge_partition(self, left_part, right_part, positions, left_index, right_index, overlapping, left_suffix,
+                         right_suffix):
+        """Join the entries of a single partition, which are supplied in the same order for both datasets."""
+        ids = pd.DataFrame({left_index: left_part.index.values, right_index: right_part.index.values})
+
+        left_part = left_part.rename(columns={col: col + left_suffix for col in overlapping}).reset_index(drop=True)
+        right_part = right_part.rename(columns={col: col + right_suffix for col in overlapping}).reset_index(drop=True)
+
+        partition = pd.concat([ids, left_part, right_part], axis=1)
+        partition = self.coalesce_columns(partition, overlapping, left_suffix, right_suffix, log=False)
+        partition.index = positions
+
+        return partition
+
+    def coalesce_columns(self, df, columns, left_suffix, right_suffix, log=True):
+        """Add merged columns to the data frame, taking the value of the left suffixed column if it is not null and
+        the value of the right suffixed column otherwise. All columns are merged in a single operation.
+        """
+        left_values = df[[col + left_suffix for col in columns]].reset_index(drop=True)
+        right_values = df[[col + right_suffix for col in columns]].reset_index(drop=True)
+        left_values.columns = columns
+        right_values.columns = columns
+
+        # Fill null values column by column, which keeps the data types of the columns, e.g. their categories
+        merged = left_values.where(left_values.notnull(), right_values)
+
+        if log:
+            for col, left_nulls, right_nulls, result_nulls in zip(columns, left_values.isnull().sum(),
+                                                                  right_values.isnull().sum(), merged.isnull().sum()):
+                logging.debug("Column {}: left null: {}, right null: {}; result null: {}"
+                              .format(col, left_nulls, right_nulls, result_nulls))
+
+        for col in columns:
+            df[col] = merged[col].values
 
         return df
 
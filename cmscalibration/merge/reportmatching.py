@@ -1,33 +1,65 @@
 import logging
 from typing import List
 
+import numpy as np
 import pandas as pd
 
+from data import categorical
 from data.dataset import Dataset, Metric
+from merge import sortedmatching
+from utils import memory
+
+# Metrics required to match reports, only these columns are retained while matching
+matching_metrics = [Metric.WORKFLOW, Metric.SUBMISSION_TOOL, Metric.CPU_TIME, Metric.START_TIME, Metric.STOP_TIME]
 
 
 class JobReportMatcher:
     """Matches JobMonitoring to WMArchive job reports."""
 
-    def __init__(self, timestamp_tolerance=10, time_grouping_freq='D'):
+    def __init__(self, timestamp_tolerance=10, time_grouping_freq='D', cpu_match_method='sorted', workers=1,
+                 file_popularity_limit=None):
         """Create a new matching object with supplied preferences.
 
         :param timestamp_tolerance: The tolerance to be used when comparing time stamps for potential matches.
-        :param time_grouping_freq: The frequency with which to group entries by prior to trying to match them.
+        :param time_grouping_freq: The frequency with which to group entries by prior to trying to match them. If None,
+        reports are not grouped, but matched if both their start and stop time stamps are within the tolerance.
+        :param cpu_match_method: The method used to match reports on their CPU time. Either 'sorted' (sort both data
+        sets once and search for unique matches) or 'merge' (merge the reports of each time group separately).
+        :param workers: The number of processes used to match ranges of time groups in parallel. Only supported by the
+        sorted CPU time matching method.
+        :param file_popularity_limit: Files read by more jobs than this limit in either dataset are ignored when
+        matching on files. Such files hardly distinguish jobs, but lead to many candidate pairs. If None, all files
+        are used.
         """
+        if cpu_match_method not in ['sorted', 'merge']:
+            raise ValueError("Unknown CPU time matching method {}!".format(cpu_match_method))
+
+        if workers > 1 and cpu_match_method != 'sorted':
+            raise ValueError("Parallel matching is only supported with the sorted CPU time matching method!")
+
+        if time_grouping_freq is None and cpu_match_method != 'sorted':
+            raise ValueError("Matching without time groups is only supported with the sorted CPU time matching method!")
+
         self.timestamp_tolerance = timestamp_tolerance
         self.time_grouping_freq = time_grouping_freq
+        self.cpu_match_method = cpu_match_method
+        self.workers = workers
+        self.file_popularity_limit = file_popularity_limit
 
-    def match_reports(self, jmset, wmset, use_files=True, previous_matches=None):
+    def match_reports(self, jmset, wmset, use_files=True, previous_matches=None, use_workflows=False):
         """Match reports from jobmonitoring and WMArchive data.
 
         :param jmset: The JobMonitoring dataset.
         :param wmset: The WMArchive dataset.
         :param use_files: If true, use comparisons between file lists to identify potential matches.
+        :param use_workflows: If true, the remaining reports are matched only on their workflow and time stamps.
         :return: A data frame containing matches from the index columns of the two datasets.
         """
-        unmatched_jmdf = jmset.df.copy()
-        unmatched_wmdf = wmset.df.copy()
+        # Only work on a narrow projection of the reports instead of copies of the complete data frames.
+        # Use a shared vocabulary for workflows, so workflows can be compared via their codes.
+        unmatched_jmdf, unmatched_wmdf = categorical.unify_categories([self._project(jmset), self._project(wmset)],
+                                                                      [Metric.WORKFLOW])
+        memory.log_memory("projecting reports for matching")
 
         if previous_matches is not None:
             unmatched_jmdf = unmatched_jmdf.drop(previous_matches[unmatched_jmdf.index.name], errors='ignore')
@@ -52,37 +84,17 @@ class JobReportMatcher:
         logging.debug("Removed {} workflows not present WMArchive data.".format(len(only_wm)))
         logging.debug("Removed {} workflows not present in Jobmonitoring data.".format(len(only_jm)))
 
-        # Group by set frequency to simplify matching.
-        jm_grouped = self._group_by_time(unmatched_jmdf, [jmset.col(Metric.STOP_TIME)], freq=self.time_grouping_freq)
-        wm_grouped = self._group_by_time(unmatched_wmdf, [wmset.col(Metric.STOP_TIME)], freq=self.time_grouping_freq)
-
-        match_list = []
-        total_compared = 0
-        total = unmatched_jmdf.shape[0]
-
-        for key, jm_group in jm_grouped:
-            try:
-                wm_group = wm_grouped.get_group(key)
-            except KeyError:
-                # Group is not present in other frame
-                continue
-
-            if jm_group.empty or wm_group.empty:
-                continue
-
-            group_matches = self._match_on_cpu_time(jmset, wmset, jm_group, wm_group)
-            match_list.append(group_matches)
-
-            total_compared += len(jm_group)
-            logging.debug(
-                "Found {} matches (of {} WM, {} JM, ".format(len(group_matches), len(wm_group), len(jm_group)) +
-                "{:.4}% compared).".format(100 * total_compared / total)
-            )
+        if self.time_grouping_freq is None:
+            new_matches = self._match_on_cpu_time_window(jmset, wmset, unmatched_jmdf, unmatched_wmdf)
+        elif self.cpu_match_method == 'sorted':
+            new_matches = self._match_on_cpu_time_sorted(jmset, wmset, unmatched_jmdf, unmatched_wmdf)
+        else:
+            new_matches = self._match_on_cpu_time_grouped(jmset, wmset, unmatched_jmdf, unmatched_wmdf)
 
-        new_matches = pd.concat(match_list)
+        memory.log_memory("matching on CPU time")
 
         if previous_matches is not None:
-            matches = previous_matches.append(new_matches)
+            matches = pd.concat([previous_matches, new_matches])
         else:
             matches = new_matches
 
@@ -99,11 +111,11 @@ class JobReportMatcher:
             "Found {} matches, {} WMArchive jobs unmatched,".format(matches.shape[0], unmatched_wmdf.shape[0]) +
             "{} Jobmonitoring jobs unmatched.".format(unmatched_jmdf.shape[0]))
 
-        if use_files and 'files' in jmset.extra_dfs and 'files' in jmset.extra_dfs:
+        if use_files and 'files' in jmset.extra_dfs and 'files' in wmset.extra_dfs:
             logging.info("Matching on files.")
 
             file_matches = self._match_on_files(jmset, wmset, unmatched_jmdf, unmatched_wmdf)
-            matches = matches.append(file_matches)
+            matches = pd.concat([matches, file_matches])
 
             unmatched_jmdf = unmatched_jmdf.drop(matches[unmatched_jmdf.index.name], errors='ignore')
             unmatched_wmdf = unmatched_wmdf.drop(matches[unmatched_wmdf.index.name], errors='ignore')
@@ -112,10 +124,16 @@ class JobReportMatcher:
                 "Found {} matches, {} unmatched in Jobmonitoring,".format(matches.shape[0], unmatched_jmdf.shape[0]) +
                 "{} unmatched in WMArchive jobs.".format(unmatched_wmdf.shape[0]))
 
-        # Directly match on workflow with remaining data
-        # Todo Enable matching on workflows again!
-        # workflow_matches = self.match_on_workflow(unmatched_jmdf, unmatched_wmdf, jmset, wmset)
-        # matches = matches.append(workflow_matches)
+            memory.log_memory("matching on files")
+
+        if use_workflows:
+            # Directly match on workflow with remaining data
+            logging.info("Matching on workflows.")
+
+            workflow_matches = self.match_on_workflow(unmatched_jmdf, unmatched_wmdf, jmset, wmset)
+            matches = pd.concat([matches, workflow_matches])
+
+            memory.log_memory("matching on workflows")
 
         # Drop all matches from unmatched jobs
         unmatched_jmdf = unmatched_jmdf.drop(matches[unmatched_jmdf.index.name], errors='ignore')
@@ -127,135 +145,311 @@ class JobReportMatcher:
 
         return matches.reset_index(drop=True)
 
-    def _filter_matches(self, matches, jm_dataset: Dataset, wm_dataset, jmdf_prefix='jmdf_', wmdf_prefix='wmdf_'):
+    def _filter_candidates(self, jm_positions, wm_positions, jmdf, wmdf, jm_dataset: Dataset, wm_dataset: Dataset,
+                           timestamp_metrics=None):
+        """Return a mask of the candidate pairs (supplied as row positions) that have time stamps within the tolerance
+        and belong to the same workflow.
+
+        :param timestamp_metrics: The time stamps to compare, by default the start and stop time stamps.
+        """
+        if timestamp_metrics is None:
+            timestamp_metrics = [Metric.START_TIME, Metric.STOP_TIME]
 
-        timestamp_metrics = [Metric.START_TIME, Metric.STOP_TIME]
+        mask = np.ones(len(jm_positions), dtype=bool)
 
         for metric in timestamp_metrics:
-            jmdf_ts_col = jmdf_prefix + jm_dataset.col(metric)
-            wmdf_ts_col = wmdf_prefix + wm_dataset.col(metric)
-            matches = matches[
-                (self._timestamp_diff_series(matches[jmdf_ts_col], matches[wmdf_ts_col]) < self.timestamp_tolerance)
-                # |
-                # (matches[jmdf_ts_col].isnull()) | (matches[wmdf_ts_col].isnull())
-            ]
+            jm_timestamps = jmdf[jm_dataset.col(metric)].values[jm_positions]
+            wm_timestamps = wmdf[wm_dataset.col(metric)].values[wm_positions]
 
-        jm_workflow_col = jmdf_prefix + jm_dataset.col(Metric.WORKFLOW)
-        wm_workflow_col = wmdf_prefix + wm_dataset.col(Metric.WORKFLOW)
+            # Differences involving null time stamps are NaN and never within the tolerance
+            diff = np.abs((jm_timestamps - wm_timestamps) / np.timedelta64(1, 's'))
+            mask &= diff < self.timestamp_tolerance
 
         # Only accept jobs that match in their workflow
-        matches = matches[matches[jm_workflow_col] == matches[wm_workflow_col]]
+        jm_workflows = jmdf[jm_dataset.col(Metric.WORKFLOW)]
+        wm_workflows = wmdf[wm_dataset.col(Metric.WORKFLOW)]
+
+        mask &= jm_workflows.notnull().values[jm_positions] & wm_workflows.notnull().values[wm_positions]
+        jm_workflows = np.asarray(jm_workflows, dtype=object)[jm_positions]
+        wm_workflows = np.asarray(wm_workflows, dtype=object)[wm_positions]
+        mask &= jm_workflows == wm_workflows
+
+        return mask
+
+    def _match_on_cpu_time_grouped(self, jmset: Dataset, wmset: Dataset, jmdf, wmdf):
+        """Match on CPU time by merging the reports within each time group separately."""
+
+        # Group by set frequency to simplify matching.
+        jm_grouped = self._group_by_time(jmdf, [jmset.col(Metric.STOP_TIME)], freq=self.time_grouping_freq)
+        wm_grouped = self._group_by_time(wmdf, [wmset.col(Metric.STOP_TIME)], freq=self.time_grouping_freq)
+
+        match_list = []
+        total_compared = 0
+        total = jmdf.shape[0]
+
+        for key, jm_group in jm_grouped:
+            try:
+                wm_group = wm_grouped.get_group(key)
+            except KeyError:
+                # Group is not present in other frame
+                continue
+
+            if jm_group.empty or wm_group.empty:
+                continue
+
+            group_matches = self._match_on_cpu_time(jmset, wmset, jm_group, wm_group)
+            match_list.append(group_matches)
+
+            total_compared += len(jm_group)
+            logging.debug(
+                "Found {} matches (of {} WM, {} JM, ".format(len(group_matches), len(wm_group), len(jm_group)) +
+                "{:.4}% compared).".format(100 * total_compared / total)
+            )
+
+        return pd.concat(match_list)
+
+    def _match_on_cpu_time_sorted(self, jmset: Dataset, wmset: Dataset, jmdf, wmdf):
+        """Match on CPU time by sorting both data frames once and searching for unique matches.
+
+        This produces the same matches as the grouped method: Reports are matched if they stop in the same time group,
+        belong to the same workflow, have the same rounded CPU time and their start time stamps are within the
+        tolerance. Only Jobmonitoring reports with exactly one candidate are matched.
+        """
+        jm_index = jmdf.index.name
+        wm_index = wmdf.index.name
+
+        # Reports without stop time or workflow can never be matched
+        jmdf = jmdf[jmdf[jmset.col(Metric.STOP_TIME)].notnull() & jmdf[jmset.col(Metric.WORKFLOW)].notnull()]
+        wmdf = wmdf[wmdf[wmset.col(Metric.STOP_TIME)].notnull() & wmdf[wmset.col(Metric.WORKFLOW)].notnull()]
+
+        jm_groups = jmdf[jmset.col(Metric.STOP_TIME)].dt.floor(self.time_grouping_freq)
+        wm_groups = wmdf[wmset.col(Metric.STOP_TIME)].dt.floor(self.time_grouping_freq)
+
+        # Rounded CPU times that are null are matched with each other, as they are in a merge
+        jm_keys, wm_keys = sortedmatching.factorize_keys(
+            [jm_groups, jmdf[jmset.col(Metric.WORKFLOW)], jmdf[jmset.col(Metric.CPU_TIME)].round()],
+            [wm_groups, wmdf[wmset.col(Metric.WORKFLOW)], wmdf[wmset.col(Metric.CPU_TIME)].round()])
+
+        jm_start, jm_valid = sortedmatching.timestamps_to_int(jmdf[jmset.col(Metric.START_TIME)])
+        wm_start, wm_valid = sortedmatching.timestamps_to_int(wmdf[wmset.col(Metric.START_TIME)])
+
+        if self.workers > 1:
+            logging.debug("Matching on CPU time with {} worker processes.".format(self.workers))
+
+            jm_labels = sortedmatching.timestamps_to_int(jm_groups)[0]
+            wm_labels = sortedmatching.timestamps_to_int(wm_groups)[0]
+
+            # Time groups are part of the keys, so ranges of time groups can be matched independently
+            jm_positions, wm_positions = sortedmatching.partitioned_unique_window_matches(
+                jm_keys, jm_start, jm_labels, wm_keys, wm_start, wm_labels, self._tolerance_ns(),
+                left_valid=jm_valid, right_valid=wm_valid, workers=self.workers)
+        else:
+            jm_positions, wm_positions = sortedmatching.unique_window_matches(
+                jm_keys, jm_start, wm_keys, wm_start, self._tolerance_ns(), left_valid=jm_valid, right_valid=wm_valid)
+
+        # Order matches by time group first, as if they had been matched group by group
+        order = np.lexsort((jm_positions, jm_groups.values[jm_positions]))
+        jm_positions = jm_positions[order]
+        wm_positions = wm_positions[order]
+
+        matches = pd.DataFrame({jm_index: jmdf.index.values[jm_positions],
+                                wm_index: wmdf.index.values[wm_positions]}, columns=[jm_index, wm_index])
+
+        logging.debug("Found {} matches (of {} WM, {} JM).".format(matches.shape[0], wmdf.shape[0], jmdf.shape[0]))
 
         return matches
 
-    def _filter_by_timestamp(self, left, matches, left_dataset, right_dataset, left_prefix='', right_prefix=''):
+    def _match_on_cpu_time_window(self, jmset: Dataset, wmset: Dataset, jmdf, wmdf):
+        """Match on CPU time without grouping reports by time.
 
-        timestamp_metrics = [Metric.START_TIME, Metric.STOP_TIME]
+        Reports are matched if they belong to the same workflow, have the same rounded CPU time and both their start
+        and stop time stamps are within the tolerance. In contrast to grouping by time, this also matches reports
+        that are close to the border of a time group. Only Jobmonitoring reports with exactly one candidate are matched.
+        """
+        jm_index = jmdf.index.name
+        wm_index = wmdf.index.name
 
-        for metric in timestamp_metrics:
+        jmdf = jmdf[jmdf[jmset.col(Metric.WORKFLOW)].notnull()]
+        wmdf = wmdf[wmdf[wmset.col(Metric.WORKFLOW)].notnull()]
 
-            # Handle empty matches data frame
-            if matches.empty:
-                return matches
+        jm_keys, wm_keys = sortedmatching.factorize_keys(
+            [jmdf[jmset.col(Metric.WORKFLOW)], jmdf[jmset.col(Metric.CPU_TIME)].round()],
+            [wmdf[wmset.col(Metric.WORKFLOW)], wmdf[wmset.col(Metric.CPU_TIME)].round()])
 
-            left_timestamp = left[left_prefix + left_dataset.col(metric)]
-            right_colname = right_prefix + right_dataset.col(metric)
+        jm_start, jm_valid = sortedmatching.timestamps_to_int(jmdf[jmset.col(Metric.START_TIME)])
+        wm_start, wm_valid = sortedmatching.timestamps_to_int(wmdf[wmset.col(Metric.START_TIME)])
 
-            if pd.notna(left_timestamp):
-                # Filter timestamps on the right with specified tolerance, or keep entries if the left timestamp is null
+        jm_stop = sortedmatching.timestamps_to_int(jmdf[jmset.col(Metric.STOP_TIME)])[0]
+        wm_stop = sortedmatching.timestamps_to_int(wmdf[wmset.col(Metric.STOP_TIME)])[0]
 
-                ts_mask = matches.apply(
-                    lambda x: self._timestamp_diff(left_timestamp, x[right_colname]) < self.timestamp_tolerance, axis=1)
-                # print(ts_mask.to_string())
+        if self.workers > 1:
+            logging.debug("Matching on CPU time with {} worker processes.".format(self.workers))
 
-                null_mask = matches[right_colname].isnull()
+            # Matches always share their key, so ranges of keys can be matched independently
+            jm_positions, wm_positions = sortedmatching.partitioned_unique_window_matches(
+                jm_keys, jm_start, jm_keys, wm_keys, wm_start, wm_keys, self._tolerance_ns(),
+                left_valid=jm_valid, right_valid=wm_valid, left_secondary=jm_stop, right_secondary=wm_stop,
+                workers=self.workers)
+        else:
+            jm_positions, wm_positions = sortedmatching.unique_window_matches(
+                jm_keys, jm_start, wm_keys, wm_start, self._tolerance_ns(), left_valid=jm_valid, right_valid=wm_valid,
+                left_secondary=jm_stop, right_secondary=wm_stop)
 
-                mask = ts_mask | null_mask
+        order = np.argsort(jm_positions, kind='mergesort')
+        jm_positions = jm_positions[order]
+        wm_positions = wm_positions[order]
 
-                # Filter matches via the masks
-                matches = matches[mask]
+        matches = pd.DataFrame({jm_index: jmdf.index.values[jm_positions],
+                                wm_index: wmdf.index.values[wm_positions]}, columns=[jm_index, wm_index])
+
+        logging.debug("Found {} matches (of {} WM, {} JM).".format(matches.shape[0], wmdf.shape[0], jmdf.shape[0]))
 
         return matches
 
+    def _tolerance_ns(self):
+        return int(round(self.timestamp_tolerance * 1e9))
+
     def _match_on_cpu_time(self, jm_dataset: Dataset, wm_dataset: Dataset, jm_subset=None, wm_subset=None):
-        jmdf = jm_subset if jm_subset is not None else jm_dataset.df
-        wmdf = wm_subset if wm_subset is not None else wm_dataset.df
+        jmdf = self._pick_subset(jm_dataset, jm_subset)
+        wmdf = self._pick_subset(wm_dataset, wm_subset)
 
-        # Round CPU time to account for rounding errors while matching float values
-        jmdf['cpuApprox'] = jmdf[jm_dataset.col(Metric.CPU_TIME)].round()
-        wmdf['cpuApprox'] = wmdf[wm_dataset.col(Metric.CPU_TIME)].round()
+        # Round CPU time to account for rounding errors while matching float values.
+        # Only the row positions of the candidates are merged, the reports themselves are not modified.
+        jm_cpu = pd.DataFrame({'jm_pos': np.arange(len(jmdf)),
+                               'cpuApprox': jmdf[jm_dataset.col(Metric.CPU_TIME)].round().values})
+        wm_cpu = pd.DataFrame({'wm_pos': np.arange(len(wmdf)),
+                               'cpuApprox': wmdf[wm_dataset.col(Metric.CPU_TIME)].round().values})
+
+        candidates = jm_cpu.merge(wm_cpu, on='cpuApprox')
+        jm_positions = candidates['jm_pos'].values
+        wm_positions = candidates['wm_pos'].values
+
+        # Reports are grouped by their rounded stop time stamps, which are equal within each group,
+        # so only the start time stamps are compared
+        filtered = self._filter_candidates(jm_positions, wm_positions, jmdf, wmdf, jm_dataset, wm_dataset,
+                                           timestamp_metrics=[Metric.START_TIME])
+        jm_positions = jm_positions[filtered]
+        wm_positions = wm_positions[filtered]
+
+        candidate_counts = np.bincount(jm_positions, minlength=len(jmdf))
+        perfect = candidate_counts[jm_positions] == 1
+
+        return pd.DataFrame({jmdf.index.name: jmdf.index.values[jm_positions[perfect]],
+                             wmdf.index.name: wmdf.index.values[wm_positions[perfect]]},
+                            columns=[jmdf.index.name, wmdf.index.name])
+
+    def match_on_workflow(self, jmdf, wmdf, jmset: Dataset, wmset: Dataset):
+        """Match the remaining reports only on their workflow and time stamps.
+
+        A WMArchive report is a candidate for a Jobmonitoring report if it belongs to the same workflow and its start
+        and stop time stamps are within the tolerance. Null time stamps on either side are not compared, i.e. they do
+        not exclude candidates. Only Jobmonitoring reports with exactly one candidate are matched.
+
+        Candidates are searched in windows of the reports of each workflow sorted by time. Pairs of reports without
+        time stamps that can be compared are only counted, so workflows of any size can be matched without comparing
+        all of their reports with each other.
+        """
+        jm_index = jmdf.index.name
+        wm_index = wmdf.index.name
 
-        jmdf_index = jmdf.index.name
-        wmdf_index = wmdf.index.name
+        jmdf = jmdf[~jmdf.index.duplicated()]
+        wmdf = wmdf[~wmdf.index.duplicated()]
 
-        self._prefix_columns(jmdf, 'jmdf_')
-        self._prefix_columns(wmdf, 'wmdf_')
+        jm_workflows, wm_workflows = sortedmatching.factorize_keys([jmdf[jmset.col(Metric.WORKFLOW)]],
+                                                                   [wmdf[wmset.col(Metric.WORKFLOW)]])
 
-        matches = jmdf.reset_index().merge(wmdf.reset_index(), left_on='jmdf_cpuApprox', right_on='wmdf_cpuApprox')
+        # Reports without workflow are never matched
+        jm_valid = jmdf[jmset.col(Metric.WORKFLOW)].notnull().values
+        wm_valid = wmdf[wmset.col(Metric.WORKFLOW)].notnull().values
 
-        filtered = self._filter_matches(matches, jm_dataset, wm_dataset, jmdf_prefix='jmdf_', wmdf_prefix='wmdf_')
+        jm_start, jm_start_valid = sortedmatching.timestamps_to_int(jmdf[jmset.col(Metric.START_TIME)])
+        wm_start, wm_start_valid = sortedmatching.timestamps_to_int(wmdf[wmset.col(Metric.START_TIME)])
+        jm_stop, jm_stop_valid = sortedmatching.timestamps_to_int(jmdf[jmset.col(Metric.STOP_TIME)])
+        wm_stop, wm_stop_valid = sortedmatching.timestamps_to_int(wmdf[wmset.col(Metric.STOP_TIME)])
 
-        perfect_matches = filtered.groupby(jmdf_index).filter(lambda x: len(x) == 1)
+        tolerance = self._tolerance_ns()
 
-        return perfect_matches[[jmdf_index, wmdf_index]]
+        def workflow_pairs(jm_times, wm_times, jm_mask, wm_mask):
+            """Candidate pairs of the same workflow with time stamps within the tolerance."""
+            return sortedmatching.window_pairs(jm_workflows, jm_times, wm_workflows, wm_times, tolerance,
+                                               left_valid=jm_valid & jm_mask, right_valid=wm_valid & wm_mask)
 
-    def match_on_workflow(self, jmdf, wmdf, jmset: Dataset, wmset: Dataset, exclusion_limit=200):
-        jm_grouped = jmdf.groupby(jmset.col(Metric.WORKFLOW))
-        wm_grouped = wmdf.groupby(wmset.col(Metric.WORKFLOW))
+        # Candidates are searched in disjoint sets of pairs, depending on the time stamps that are available.
+        # Pairs of reports with start time stamps are windowed on their start time, otherwise on their stop time.
+        jm_start_stop = jm_start_valid & jm_stop_valid
+        jm_stop_only = ~jm_start_valid & jm_stop_valid
+        pair_list = [
+            workflow_pairs(jm_start, wm_start, jm_start_valid, wm_start_valid),
+            workflow_pairs(jm_stop, wm_stop, jm_start_stop, ~wm_start_valid & wm_stop_valid),
+            workflow_pairs(jm_stop, wm_stop, jm_stop_only, wm_stop_valid),
+        ]
 
-        total_compared = 0
-        total = jmdf.shape[0]
+        jm_positions = np.concatenate([jm_pos for jm_pos, _ in pair_list])
+        wm_positions = np.concatenate([wm_pos for _, wm_pos in pair_list])
 
-        matches = {jmdf.index.name: [], wmdf.index.name: []}
+        def within_tolerance(jm_times, jm_times_valid, wm_times, wm_times_valid):
+            return ~jm_times_valid[jm_positions] | ~wm_times_valid[wm_positions] | \
+                   (np.abs(jm_times[jm_positions] - wm_times[wm_positions]) < tolerance)
 
-        for key, jm_group in jm_grouped:
-            try:
-                wm_group = wm_grouped.get_group(key)
-            except KeyError:
-                # Group is not present in other frame
-                continue
+        in_tolerance = within_tolerance(jm_start, jm_start_valid, wm_start, wm_start_valid) & \
+            within_tolerance(jm_stop, jm_stop_valid, wm_stop, wm_stop_valid)
 
-            if jm_group.empty or wm_group.empty:
-                continue
+        jm_positions = jm_positions[in_tolerance]
+        wm_positions = wm_positions[in_tolerance]
 
-            # Todo Maybe also compare large groups?
-            if exclusion_limit > 0 and len(jm_group) > exclusion_limit:
-                continue
+        # Reports without time stamps that can be compared are candidates for each other. Instead of creating all of
+        # these pairs, they are counted for each workflow and only paired if the report is the only candidate.
+        workflow_count = max(jm_workflows.max(initial=-1), wm_workflows.max(initial=-1)) + 1
+        untimed_counts = np.zeros(len(jmdf), dtype=np.int64)
+        untimed_candidates = np.full(len(jmdf), -1, dtype=np.int64)
 
-            logging.debug(
-                "Checking for matches in {} WM, {} JM, ".format(len(wm_group), len(jm_group))
-            )
+        untimed_classes = [
+            (jm_start_stop, ~wm_start_valid & ~wm_stop_valid),
+            (jm_start_valid & ~jm_stop_valid, ~wm_start_valid),
+            (jm_stop_only, ~wm_stop_valid),
+            (~jm_start_valid & ~jm_stop_valid, np.ones(len(wmdf), dtype=bool)),
+        ]
+        for jm_mask, wm_mask in untimed_classes:
+            wm_untimed = np.flatnonzero(wm_valid & wm_mask)
+            wm_counts = np.bincount(wm_workflows[wm_untimed], minlength=workflow_count)
 
-            self._prefix_columns(jm_group, 'jmdf_')
-            self._prefix_columns(wm_group, 'wmdf_')
+            # The position of the report of each workflow, which is only used for workflows with a single report
+            wm_single = np.full(workflow_count, -1, dtype=np.int64)
+            wm_single[wm_workflows[wm_untimed]] = wm_untimed
 
-            group_match_count = 0
-            for jm_index, jm_job in jm_group.iterrows():
+            jm_untimed = np.flatnonzero(jm_valid & jm_mask)
+            untimed_counts[jm_untimed] = wm_counts[jm_workflows[jm_untimed]]
+            untimed_candidates[jm_untimed] = wm_single[jm_workflows[jm_untimed]]
 
-                matching_entries = self._filter_by_timestamp(jm_job, wm_group, jmset, wmset, left_prefix='jmdf_',
-                                                             right_prefix='wmdf_')
+        candidate_counts = np.bincount(jm_positions, minlength=len(jmdf)) + untimed_counts
+        unique = candidate_counts[jm_positions] == 1
 
-                if len(matching_entries) == 1:
-                    # Perfect match found, insert into match list
+        jm_untimed = np.flatnonzero((candidate_counts == 1) & (untimed_counts == 1))
 
-                    # The index of the JM entry is already the label of the group
-                    matches.get(jmdf.index.name).append(jm_index)
+        jm_positions = np.concatenate([jm_positions[unique], jm_untimed])
+        wm_positions = np.concatenate([wm_positions[unique], untimed_candidates[jm_untimed]])
 
-                    # Get the index of the only element in the data frame
-                    matches.get(wmdf.index.name).append(matching_entries.index.values[0])
+        order = np.argsort(jm_positions, kind='mergesort')
+        jm_positions = jm_positions[order]
+        wm_positions = wm_positions[order]
 
-                    group_match_count += 1
+        matches = pd.DataFrame({jm_index: jmdf.index.values[jm_positions],
+                                wm_index: wmdf.index.values[wm_positions]}, columns=[jm_index, wm_index])
 
-            total_compared += len(jm_group)
-            logging.debug(
-                "Found {} matches (of {} WM, {} JM, ".format(group_match_count, len(wm_group), len(jm_group)) +
-                "{:.4}% compared).".format(100 * total_compared / total)
-            )
+        logging.debug("Found {} matches on workflows (of {} WM, {} JM).".format(matches.shape[0], wmdf.shape[0],
+                                                                               jmdf.shape[0]))
 
-        match_df = pd.DataFrame.from_dict(matches)
-        return match_df
+        return matches
+
+    def _match_on_files(self, jm_dataset: Dataset, wm_dataset: Dataset, jm_subset=None, wm_subset=None,
+                        file_col='FileName'):
+        """Match reports that share input files, belong to the same workflow and have start and stop time stamps
+        within the tolerance. Only Jobmonitoring reports with exactly one candidate are matched.
 
-    def _match_on_files(self, jm_dataset: Dataset, wm_dataset: Dataset, jm_subset=None, wm_subset=None):
+        Instead of joining both file tables, the file entries of both datasets are indexed by their file, workflow and
+        start time. Candidate pairs are only created for entries that satisfy all criteria, so popular files do not
+        lead to large intermediate tables. Files read by more jobs than the file popularity limit are ignored.
+        """
         jmdf = self._pick_subset(jm_dataset, jm_subset)
         wmdf = self._pick_subset(wm_dataset, wm_subset)
 
@@ -269,52 +463,79 @@ class JobReportMatcher:
             # Missing file information, skipping matching
             return None
 
-        jm_files = jm_files[jm_files[jm_index].isin(jmdf.index)]
-        wm_files = wm_files[wm_files[wm_index].isin(wmdf.index)]
+        jmdf = jmdf[~jmdf.index.duplicated()]
+        wmdf = wmdf[~wmdf.index.duplicated()]
 
-        possible_matches = self._all_file_matches(jm_files, wm_files, jm_index=jm_index, wm_index=wm_index)
+        # Positions of the jobs each file entry belongs to, only entries of jobs in the subsets are kept
+        jm_jobs = jmdf.index.get_indexer(jm_files[jm_index])
+        wm_jobs = wmdf.index.get_indexer(wm_files[wm_index])
 
-        if possible_matches.empty:
-            return None
+        jm_files = jm_files[jm_jobs >= 0]
+        wm_files = wm_files[wm_jobs >= 0]
+        jm_jobs = jm_jobs[jm_jobs >= 0]
+        wm_jobs = wm_jobs[wm_jobs >= 0]
 
-        self._prefix_columns(jmdf, 'jmdf_')
-        self._prefix_columns(wmdf, 'wmdf_')
+        if jm_files.empty or wm_files.empty:
+            return pd.DataFrame(columns=[jm_index, wm_index])
 
-        matched_jobs = possible_matches.join(jmdf, on=jm_index).join(wmdf, on=wm_index)
-        filtered = self._filter_matches(matched_jobs, jm_dataset, wm_dataset, jmdf_prefix='jmdf_', wmdf_prefix='wmdf_')
+        jm_file_codes, wm_file_codes = sortedmatching.factorize_keys([jm_files[file_col]], [wm_files[file_col]])
+        jm_workflows, wm_workflows = sortedmatching.factorize_keys([jmdf[jm_dataset.col(Metric.WORKFLOW)]],
+                                                                   [wmdf[wm_dataset.col(Metric.WORKFLOW)]])
 
-        perfect_matches = filtered.groupby(jm_index).filter(lambda x: len(x) == 1)
-        return perfect_matches[[jm_index, wm_index]]
+        # Reports without workflow and files without name can never be matched
+        jm_valid = jmdf[jm_dataset.col(Metric.WORKFLOW)].notnull().values[jm_jobs] & jm_files[file_col].notnull().values
+        wm_valid = wmdf[wm_dataset.col(Metric.WORKFLOW)].notnull().values[wm_jobs] & wm_files[file_col].notnull().values
 
-    @staticmethod
-    def _pick_subset(dataset: Dataset, subset=None):
-        return subset if subset is not None else dataset.df
+        if self.file_popularity_limit is not None:
+            file_count = max(jm_file_codes.max(initial=-1), wm_file_codes.max(initial=-1)) + 1
+            popularity = np.maximum(np.bincount(jm_file_codes, minlength=file_count),
+                                    np.bincount(wm_file_codes, minlength=file_count))
+            popular = popularity > self.file_popularity_limit
 
-    @staticmethod
-    def _prefix_columns(df, prefix=''):
-        df.columns = map(lambda x: prefix + x, df.columns)
+            logging.debug("Ignoring {} files read by more than {} jobs."
+                          .format(popular.sum(), self.file_popularity_limit))
 
-    @staticmethod
-    def _timestamp_diff(ts1, ts2):
-        return abs((ts1 - ts2).total_seconds())
+            jm_valid &= ~popular[jm_file_codes]
+            wm_valid &= ~popular[wm_file_codes]
 
-    @staticmethod
-    def _timestamp_diff_series(ts_series1, ts_series2):
-        return (ts_series1 - ts_series2).dt.total_seconds().abs()
+        jm_keys, wm_keys = sortedmatching.factorize_keys([jm_file_codes, jm_workflows[jm_jobs]],
+                                                         [wm_file_codes, wm_workflows[wm_jobs]])
 
-    @staticmethod
-    def _group_by_time(df, ts_cols: List[str], freq):
-        df = df.copy()
-        for timestamp_col in ts_cols:
-            df[timestamp_col] = df[timestamp_col].dt.floor(freq)
+        jm_start, jm_start_valid = sortedmatching.timestamps_to_int(jmdf[jm_dataset.col(Metric.START_TIME)])
+        wm_start, wm_start_valid = sortedmatching.timestamps_to_int(wmdf[wm_dataset.col(Metric.START_TIME)])
+
+        jm_stop = sortedmatching.timestamps_to_int(jmdf[jm_dataset.col(Metric.STOP_TIME)])[0]
+        wm_stop = sortedmatching.timestamps_to_int(wmdf[wm_dataset.col(Metric.STOP_TIME)])[0]
+
+        jm_entries, wm_entries = sortedmatching.window_pairs(
+            jm_keys, jm_start[jm_jobs], wm_keys, wm_start[wm_jobs], self._tolerance_ns(),
+            left_valid=jm_valid & jm_start_valid[jm_jobs], right_valid=wm_valid & wm_start_valid[wm_jobs],
+            left_secondary=jm_stop[jm_jobs], right_secondary=wm_stop[wm_jobs])
+
+        # Jobs sharing multiple files are candidates only once
+        candidates = np.unique(jm_jobs[jm_entries] * len(wmdf) + wm_jobs[wm_entries])
+        jm_positions = candidates // len(wmdf)
+        wm_positions = candidates % len(wmdf)
+
+        candidate_counts = np.bincount(jm_positions, minlength=len(jmdf))
+        unique = candidate_counts[jm_positions] == 1
 
-        return df.groupby(ts_cols)
+        logging.debug("Found {} candidate pairs sharing files for {} Jobmonitoring jobs."
+                      .format(len(candidates), np.count_nonzero(candidate_counts)))
+
+        return pd.DataFrame({jm_index: jmdf.index.values[jm_positions[unique]],
+                             wm_index: wmdf.index.values[wm_positions[unique]]}, columns=[jm_index, wm_index])
 
     @staticmethod
-    def _all_file_matches(jm_files, wm_files, file_col='FileName', jm_index='UniqueID', wm_index='wmaid'):
-        matches = jm_files.merge(wm_files, on=file_col, how='inner')
+    def _pick_subset(dataset: Dataset, subset=None):
+        return subset if subset is not None else dataset.df
 
-        if matches.empty:
-            return pd.DataFrame()
-        else:
-            return matches[[jm_index, wm_index]].drop_duplicates()
+    @staticmethod
+    def _project(dataset: Dataset):
+        columns = [metric.value for metric in matching_metrics if metric.value in dataset.df.columns]
+        return dataset.df[columns]
+
+    @staticmethod
+    def _group_by_time(df, ts_cols: List[str], freq):
+        # Group by the rounded time stamps without modifying (or copying) the data frame
+        return df.groupby([df[timestamp_col].dt.floor(freq) for timestamp_col in ts_cols])
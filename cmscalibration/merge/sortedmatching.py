@@ -0,0 +1,271 @@
+""" Sort-based matching kernels operating on plain NumPy arrays.
+
+The kernels in this module identify candidate pairs between two sets of entries (left and right) that share the same
+key and whose time stamps lie within a tolerance of each other. Instead of building the cartesian product of all
+entries with the same key, both sides are sorted once and windows of candidates are located with sorted searches.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def factorize_keys(left_columns, right_columns):
+    """Jointly factorize the key columns of the left and right side into a single integer key per entry.
+
+    Null values are mapped to a shared code, i.e. null keys are treated as equal to each other (like in a Pandas merge).
+
+    :param left_columns: A list of array-likes with the key columns of the left side.
+    :param right_columns: A list of array-likes with the key columns of the right side, in the same order.
+    :return: A tuple of two int64 arrays with the combined keys for the left and right entries.
+    """
+    if len(left_columns) != len(right_columns) or not left_columns:
+        raise ValueError("Left and right side must have the same, non-zero number of key columns.")
+
+    left_len = len(left_columns[0])
+    combined = None
+
+    for left_col, right_col in zip(left_columns, right_columns):
+        # Null values are assigned code -1, shift to keep all codes non-negative
+        codes = _factorize_column(left_col, right_col) + 1
+
+        if combined is None:
+            combined = codes
+        else:
+            # Refactorize after each step to keep the combined codes small and prevent overflows
+            combined = pd.factorize(combined * (codes.max(initial=0) + 1) + codes)[0].astype(np.int64)
+
+    return combined[:left_len], combined[left_len:]
+
+
+def _factorize_column(left_col, right_col):
+    """Jointly factorize a single column of both sides, null values are assigned code -1."""
+
+    if isinstance(getattr(left_col, 'dtype', None), pd.api.types.CategoricalDtype) and \
+            isinstance(getattr(right_col, 'dtype', None), pd.api.types.CategoricalDtype):
+        # Only factorize the (small) categories and translate the existing codes
+        left_cat = pd.Categorical(left_col)
+        right_cat = pd.Categorical(right_col)
+
+        category_codes = pd.factorize(np.concatenate([np.asarray(left_cat.categories),
+                                                      np.asarray(right_cat.categories)]))[0].astype(np.int64)
+
+        # Append code -1 for null values, which are indexed with code -1 of the categoricals
+        left_map = np.append(category_codes[:len(left_cat.categories)], -1)
+        right_map = np.append(category_codes[len(left_cat.categories):], -1)
+
+        return np.concatenate([left_map[left_cat.codes], right_map[right_cat.codes]])
+
+    values = np.concatenate([np.asarray(left_col), np.asarray(right_col)])
+    return pd.factorize(values)[0].astype(np.int64)
+
+
+def timestamps_to_int(series):
+    """Convert a datetime series or array to int64 nanoseconds and a mask indicating valid (non-null) entries."""
+    values = np.asarray(series, dtype='datetime64[ns]')
+    valid = ~np.isnat(values)
+    return values.view(np.int64), valid
+
+
+def window_bounds(left_keys, left_times, right_keys, right_times, tolerance, left_valid=None, right_valid=None):
+    """Locate all right entries with the same key as a left entry and a time stamp within the tolerance.
+
+    Both sides are merged into a single sorted stream of events which is ordered by key and time. The number of right
+    entries preceding the lower and upper window edges of each left entry directly yields the window bounds.
+
+    :param left_keys: Integer keys of the left entries.
+    :param left_times: Integer time stamps of the left entries.
+    :param right_keys: Integer keys of the right entries.
+    :param right_times: Integer time stamps of the right entries.
+    :param tolerance: The tolerance in the unit of the time stamps. Windows are open, i.e. entries are only within
+    the window if their difference is strictly smaller than the tolerance.
+    :param left_valid: Optional mask of left entries that can be matched at all.
+    :param right_valid: Optional mask of right entries that can be matched at all.
+    :return: A tuple (right_order, lower, upper) where right_order contains the indices of the (valid) right entries
+    sorted by key and time and the positions lower:upper in that order are the candidates of each left entry.
+    """
+    left_keys = np.asarray(left_keys, dtype=np.int64)
+    left_times = np.asarray(left_times, dtype=np.int64)
+    right_keys = np.asarray(right_keys, dtype=np.int64)
+    right_times = np.asarray(right_times, dtype=np.int64)
+
+    if left_valid is None:
+        left_valid = np.ones(len(left_keys), dtype=bool)
+    if right_valid is None:
+        right_valid = np.ones(len(right_keys), dtype=bool)
+
+    right_index = np.flatnonzero(right_valid)
+    right_keys = right_keys[right_index]
+    right_times = right_times[right_index]
+
+    # Invalid entries get a dummy time stamp to prevent overflows, their windows are reset afterwards
+    left_times = np.where(left_valid, left_times, 0)
+
+    n_left = len(left_keys)
+    n_right = len(right_keys)
+
+    keys = np.concatenate([right_keys, left_keys, left_keys])
+    times = np.concatenate([right_times, left_times + tolerance, left_times - tolerance])
+
+    # Upper window edges are sorted before right entries with the same time stamp, lower edges after them.
+    # This makes the windows exclusive on both sides.
+    priority = np.concatenate([np.ones(n_right, dtype=np.int8),
+                               np.zeros(n_left, dtype=np.int8),
+                               np.full(n_left, 2, dtype=np.int8)])
+
+    order = np.lexsort((priority, times, keys))
+
+    is_right = order < n_right
+    right_before = np.cumsum(is_right) - is_right
+
+    positions = np.empty_like(order)
+    positions[order] = np.arange(len(order))
+
+    upper = right_before[positions[n_right:n_right + n_left]]
+    lower = right_before[positions[n_right + n_left:]]
+
+    upper = np.where(left_valid, upper, lower)
+
+    # Sorting is stable, so the right entries appear in the same order as when sorted on their own
+    right_order = right_index[order[is_right]]
+
+    return right_order, lower, upper
+
+
+def expand_windows(lower, upper):
+    """Expand windows of candidates into explicit candidate pairs.
+
+    :return: A tuple of arrays (left_positions, sorted_right_positions) for every candidate pair.
+    """
+    counts = upper - lower
+    left_positions = np.repeat(np.arange(len(lower)), counts)
+
+    # Position within each window, added to the start of the window
+    window_starts = np.cumsum(counts) - counts
+    offsets = np.arange(counts.sum()) - np.repeat(window_starts, counts)
+    right_positions = np.repeat(lower, counts) + offsets
+
+    return left_positions, right_positions
+
+
+def window_pairs(left_keys, left_times, right_keys, right_times, tolerance,
+                 left_valid=None, right_valid=None, left_secondary=None, right_secondary=None):
+    """Find all pairs of left and right entries with the same key and time stamps within the tolerance.
+
+    If secondary time stamps are supplied, candidates are additionally required to have secondary time stamps within
+    the tolerance. Null secondary time stamps have to be marked with the minimum int64 value (NaT) and never match.
+
+    :return: A tuple of arrays (left_indices, right_indices) containing all candidate pairs, ordered by left entry.
+    """
+    right_order, lower, upper = window_bounds(left_keys, left_times, right_keys, right_times, tolerance,
+                                              left_valid=left_valid, right_valid=right_valid)
+
+    # Only windows of candidates are expanded, so the number of pairs stays close to the number of matches
+    left_positions, right_positions = expand_windows(lower, upper)
+    right_candidates = right_order[right_positions]
+
+    if left_secondary is None:
+        return left_positions, right_candidates
+
+    left_ts = np.asarray(left_secondary, dtype=np.int64)[left_positions]
+    right_ts = np.asarray(right_secondary, dtype=np.int64)[right_candidates]
+
+    nat = np.iinfo(np.int64).min
+    in_tolerance = (left_ts != nat) & (right_ts != nat) & (np.abs(left_ts - right_ts) < tolerance)
+
+    return left_positions[in_tolerance], right_candidates[in_tolerance]
+
+
+def unique_window_matches(left_keys, left_times, right_keys, right_times, tolerance,
+                          left_valid=None, right_valid=None, left_secondary=None, right_secondary=None):
+    """Find all left entries that have exactly one candidate on the right side.
+
+    Candidates are found like in window_pairs, including the optional check of secondary time stamps.
+
+    :return: A tuple of arrays (left_indices, right_indices) containing the unique matches.
+    """
+    if left_secondary is None:
+        right_order, lower, upper = window_bounds(left_keys, left_times, right_keys, right_times, tolerance,
+                                                  left_valid=left_valid, right_valid=right_valid)
+
+        left_indices = np.flatnonzero(upper - lower == 1)
+        right_indices = right_order[lower[left_indices]]
+
+        return left_indices, right_indices
+
+    left_positions, right_candidates = window_pairs(left_keys, left_times, right_keys, right_times, tolerance,
+                                                    left_valid=left_valid, right_valid=right_valid,
+                                                    left_secondary=left_secondary, right_secondary=right_secondary)
+
+    candidate_counts = np.bincount(left_positions, minlength=len(left_keys))
+    unique = candidate_counts[left_positions] == 1
+
+    return left_positions[unique], right_candidates[unique]
+
+
+def partitioned_unique_window_matches(left_keys, left_times, left_partitions, right_keys, right_times,
+                                      right_partitions, tolerance, left_valid=None, right_valid=None,
+                                      left_secondary=None, right_secondary=None, workers=1, chunks_per_worker=4):
+    """Find unique matches like unique_window_matches, but process ranges of partitions in a pool of processes.
+
+    Entries can only match if they are in the same partition, i.e. the partition must be part of the keys. Each worker
+    only receives the compact key and time stamp arrays of its range of partitions. Results are collected in the order
+    of the partitions, so the result is identical for any number of workers.
+
+    :param left_partitions: Integer partition labels (e.g. days) of the left entries.
+    :param right_partitions: Integer partition labels of the right entries.
+    :param workers: The number of worker processes.
+    :param chunks_per_worker: The number of partition ranges created per worker to balance the load.
+    :return: A tuple of arrays (left_indices, right_indices) containing the unique matches.
+    """
+    left_keys = np.asarray(left_keys, dtype=np.int64)
+    left_times = np.asarray(left_times, dtype=np.int64)
+    right_keys = np.asarray(right_keys, dtype=np.int64)
+    right_times = np.asarray(right_times, dtype=np.int64)
+
+    if left_valid is None:
+        left_valid = np.ones(len(left_keys), dtype=bool)
+    if right_valid is None:
+        right_valid = np.ones(len(right_keys), dtype=bool)
+
+    def subset(values, index):
+        return values[index] if values is not None else None
+
+    labels = np.unique(left_partitions)
+    chunk_count = max(1, min(len(labels), workers * chunks_per_worker))
+    label_ranges = [(chunk[0], chunk[-1]) for chunk in np.array_split(labels, chunk_count) if len(chunk) > 0]
+
+    chunk_indices = []
+    chunk_args = []
+
+    for first_label, last_label in label_ranges:
+        left_index = np.flatnonzero((left_partitions >= first_label) & (left_partitions <= last_label))
+        right_index = np.flatnonzero((right_partitions >= first_label) & (right_partitions <= last_label))
+
+        chunk_indices.append((left_index, right_index))
+        chunk_args.append((left_keys[left_index], left_times[left_index], right_keys[right_index],
+                           right_times[right_index], tolerance, left_valid[left_index], right_valid[right_index],
+                           subset(left_secondary, left_index), subset(right_secondary, right_index)))
+
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Map returns results in the order of the submitted chunks
+            results = list(executor.map(_unique_window_matches_chunk, chunk_args))
+    else:
+        results = [_unique_window_matches_chunk(args) for args in chunk_args]
+
+    left_results = [left_index[left_pos] for (left_index, _), (left_pos, _) in zip(chunk_indices, results)]
+    right_results = [right_index[right_pos] for (_, right_index), (_, right_pos) in zip(chunk_indices, results)]
+
+    if not left_results:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+    return np.concatenate(left_results), np.concatenate(right_results)
+
+
+def _unique_window_matches_chunk(args):
+    left_keys, left_times, right_keys, right_times, tolerance, left_valid, right_valid, left_sec, right_sec = args
+    return unique_window_matches(left_keys, left_times, right_keys, right_times, tolerance,
+                                 left_valid=left_valid, right_valid=right_valid,
+                                 left_secondary=left_sec, right_secondary=right_sec)
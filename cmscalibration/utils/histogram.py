@@ -20,8 +20,125 @@ def calculate_histogram_mean(counts, bins):
     return mean
 
 
-def bin_by_quantile(x, bin_count=100, cutoff_quantile=0.95, drop_overflow=False, overflow_agg='mean'):
-    """Create a quantile-distributed histogram with the specified number of bins from a Pandas series of values."""
+def bin_by_quantile(x, bin_count=100, cutoff_quantile=0.95, drop_overflow=False, overflow_agg='mean',
+                    method='numpy'):
+    """Create a quantile-distributed histogram with the specified number of bins from a Pandas series of values.
+
+    :param method: The method used to compute the histogram, either 'numpy' or 'pandas'. The 'numpy' method
+    computes the histogram from the sorted values without creating a categorical for all values. Both methods
+    return the same histogram up to floating point rounding of the quantiles, which can also move values that are
+    equal to a bin edge into the adjacent bin.
+    """
+    if method == 'numpy':
+        return _bin_by_quantile_numpy(x, bin_count, cutoff_quantile, drop_overflow, overflow_agg)
+    elif method == 'pandas':
+        return _bin_by_quantile_pandas(x, bin_count, cutoff_quantile, drop_overflow, overflow_agg)
+    else:
+        raise ValueError("Unknown histogram method {}!".format(method))
+
+
+def bin_equal_width_overflow(x, bin_count=100, cutoff_quantile=0.95, method='numpy'):
+    """Create a histogram with equal-width bins, the specified number of bins from a Pandas series of values.
+    This function optionally cuts off outlier values above the provided quantile and handles them by aggregating
+    them into a single overflow bin that preserves their arithmetic mean.
+
+    :param method: The method used to compute the histogram, either 'numpy' or 'pandas'. The 'numpy' method
+    computes the histogram from the sorted values without creating a categorical for all values. Both methods
+    return the same histogram up to floating point rounding of the quantiles, which can also move values that are
+    equal to a bin edge into the adjacent bin.
+    """
+    if method == 'numpy':
+        return _bin_equal_width_overflow_numpy(x, bin_count, cutoff_quantile)
+    elif method == 'pandas':
+        return _bin_equal_width_overflow_pandas(x, bin_count, cutoff_quantile)
+    else:
+        raise ValueError("Unknown histogram method {}!".format(method))
+
+
+def _bin_by_quantile_numpy(x, bin_count=100, cutoff_quantile=0.95, drop_overflow=False, overflow_agg='mean'):
+    if cutoff_quantile < 0.0 or cutoff_quantile >= 1.0:
+        raise ValueError("Quantile must be between 0.0 and <1.0.")
+
+    values = _valid_values(x)
+    sorted_values = np.sort(values)
+
+    quantiles = np.quantile(sorted_values, np.linspace(0.0, cutoff_quantile, num=bin_count + 1))
+    bin_edges = np.append(0.0, quantiles)
+
+    if drop_overflow:
+        return _cut_counts(sorted_values, bin_edges)
+
+    cutoff = np.quantile(sorted_values, cutoff_quantile)
+    overflow_right = _overflow_right(values, cutoff, overflow_agg)
+
+    # Add the last value to the histogram
+    bin_edges = np.append(bin_edges, sorted_values[-1])
+    bin_edges.sort()
+
+    counts, bins = _cut_counts(sorted_values, bin_edges)
+    bins[-1] = overflow_right
+
+    return counts, bins
+
+
+def _bin_equal_width_overflow_numpy(x, bin_count=100, cutoff_quantile=0.95):
+    if cutoff_quantile < 0.0 or cutoff_quantile >= 1.0:
+        raise ValueError("Quantile must be between 0.0 and <1.0.")
+
+    values = _valid_values(x)
+    sorted_values = np.sort(values)
+
+    cutoff = np.quantile(sorted_values, cutoff_quantile)
+    overflow_right = _overflow_right(values, cutoff, 'mean')
+
+    bin_edges = np.linspace(0.0, cutoff, num=bin_count + 1)
+
+    # Add the last value to the histogram
+    bin_edges = np.append(bin_edges, sorted_values[-1])
+
+    counts, bins = _cut_counts(sorted_values, bin_edges)
+    bins[-1] = overflow_right
+
+    return counts, bins
+
+
+def _valid_values(x):
+    values = np.asarray(x)
+    values = values[~np.isnan(values)]
+    return values[values >= 0.0]
+
+
+def _overflow_right(values, cutoff, overflow_agg):
+    # Compute width of overflow bin by aggregating the overflowed values. They are aggregated with Pandas in their
+    # original order, as Pandas can use other summation algorithms than NumPy, e.g. with bottleneck installed.
+    x_overflow = pd.Series(values[values > cutoff])
+
+    if overflow_agg == 'median':
+        overflow_mean = x_overflow.median()
+    elif overflow_agg == 'mean':
+        overflow_mean = x_overflow.mean()
+    else:
+        raise ValueError("Unknown overflow aggregation method {}!".format(overflow_agg))
+
+    overflow_width = 2 * (overflow_mean - cutoff)
+    return cutoff + overflow_width
+
+
+def _cut_counts(sorted_values, bin_edges):
+    # Equivalent to pd.cut(values, bin_edges, right=False, include_lowest=True, duplicates='drop', retbins=True)
+    # followed by value_counts(sort=False) of the binned values. The bins are closed on the left side, so the
+    # values in each bin are found by searching the bin edges in the sorted values. Values equal to the last edge
+    # are not counted, like with pd.cut.
+    bins = pd.unique(np.asarray(bin_edges, dtype=float))
+    if np.isnan(bins).any():
+        raise ValueError("Bin edges must not contain missing values!")
+
+    counts = np.diff(np.searchsorted(sorted_values, bins, side='left'))
+
+    return counts, bins
+
+
+def _bin_by_quantile_pandas(x, bin_count=100, cutoff_quantile=0.95, drop_overflow=False, overflow_agg='mean'):
 
     if cutoff_quantile < 0.0 or cutoff_quantile >= 1.0:
         raise ValueError("Quantile must be between 0.0 and <1.0.")
@@ -70,11 +187,7 @@ def bin_by_quantile(x, bin_count=100, cutoff_quantile=0.95, drop_overflow=False,
         return counts, bins
 
 
-def bin_equal_width_overflow(x, bin_count=100, cutoff_quantile=0.95):
-    """Create a histogram with equal-width bins, the specified number of bins from a Pandas series of values.
-    This function optionally cuts off outlier values above the provided quantile and handles them by aggregating
-    them into a single overflow bin that preserves their arithmetic mean.
-    """
+def _bin_equal_width_overflow_pandas(x, bin_count=100, cutoff_quantile=0.95):
     if cutoff_quantile < 0.0 or cutoff_quantile >= 1.0:
         raise ValueError("Quantile must be between 0.0 and <1.0.")
 
@@ -103,6 +216,214 @@ def bin_equal_width_overflow(x, bin_count=100, cutoff_quantile=0.95):
     return counts, bins
 
 
+class LogHistogramSketch:
+    """A mergeable sketch of the distribution of non-negative values with logarithmically sized buckets.
+
+    The sketch can be updated with chunks of values, e.g. the job reports of a single day, and sketches of different
+    chunks can be merged, so the values never have to be kept in memory at once. Histograms equivalent to those of
+    bin_by_quantile and bin_equal_width_overflow can be created from the sketch.
+
+    Each positive value x is counted in the bucket i with gamma^(i-1) < x <= gamma^i, where
+    gamma = (1 + relative_accuracy) / (1 - relative_accuracy), and is represented by a value that differs from x by
+    at most the relative accuracy. Zeros are counted exactly. This bounds the error compared to the exact histogram
+    functions:
+
+    - Quantiles, and hence quantile bin edges and cutoffs, differ from the exact quantiles by at most the relative
+      accuracy.
+    - The overflow mean and median differ from the exact values by at most the relative accuracy. The right edge of
+      the overflow bin, 2 * overflow mean - cutoff, hence differs by at most the relative accuracy times
+      (2 * overflow mean + cutoff).
+    - Only values that are within the relative accuracy of a bin edge can be counted in an adjacent bin.
+
+    The maximum value, the number of values equal to the maximum and the number of values are tracked exactly. Like
+    with the exact histogram functions, values equal to the last bin edge are not counted.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        if relative_accuracy <= 0.0 or relative_accuracy >= 1.0:
+            raise ValueError("Relative accuracy must be between 0.0 and 1.0.")
+
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+
+        # Counts of the buckets with the indices offset, offset + 1, ...
+        self.offset = 0
+        self.bucket_counts = np.zeros(0, dtype=np.int64)
+        self.zero_count = 0
+        self.count = 0
+        self.max = np.nan
+        self.max_count = 0
+
+    def update(self, values):
+        """Add values to the sketch, null and negative values are ignored."""
+        x = np.asarray(values, dtype=float)
+        x = x[~np.isnan(x)]
+        x = x[x >= 0.0]
+
+        if len(x) == 0:
+            return
+
+        positive = x[x > 0.0]
+        indices = np.ceil(np.log(positive) / np.log(self.gamma)).astype(np.int64)
+
+        if len(indices) > 0:
+            self._extend(indices.min(), indices.max())
+            self.bucket_counts += np.bincount(indices - self.offset, minlength=len(self.bucket_counts))
+
+        self.zero_count += len(x) - len(positive)
+        self.count += len(x)
+        self._update_max(x.max(), np.count_nonzero(x == x.max()))
+
+    def merge(self, other):
+        """Add the values of another sketch with the same relative accuracy to this sketch."""
+        if other.gamma != self.gamma:
+            raise ValueError("Only sketches with the same relative accuracy can be merged!")
+
+        if len(other.bucket_counts) > 0:
+            self._extend(other.offset, other.offset + len(other.bucket_counts) - 1)
+            start = other.offset - self.offset
+            self.bucket_counts[start:start + len(other.bucket_counts)] += other.bucket_counts
+
+        self.zero_count += other.zero_count
+        self.count += other.count
+        if other.count > 0:
+            self._update_max(other.max, other.max_count)
+
+    def quantile(self, q):
+        """Estimate quantiles of the values, interpolating linearly between order statistics like pandas."""
+        values, weights = self._weighted_values()
+        return _weighted_quantile(values, weights, q)
+
+    def bin_by_quantile(self, bin_count=100, cutoff_quantile=0.95, drop_overflow=False, overflow_agg='mean'):
+        """Create a quantile-distributed histogram like bin_by_quantile from the values of the sketch."""
+
+        if cutoff_quantile < 0.0 or cutoff_quantile >= 1.0:
+            raise ValueError("Quantile must be between 0.0 and <1.0.")
+
+        values, weights = self._weighted_values()
+
+        quantiles = _weighted_quantile(values, weights, np.linspace(0.0, cutoff_quantile, num=bin_count + 1))
+        bin_edges = np.append(0.0, quantiles)
+
+        if drop_overflow:
+            bin_edges = np.unique(bin_edges)
+            return _weighted_bin_counts(values, weights, bin_edges), bin_edges
+
+        overflow_right = self._overflow_right(values, weights, cutoff_quantile, overflow_agg)
+
+        # Add the last value to the histogram
+        bin_edges = np.unique(np.append(bin_edges, self.max))
+
+        counts = _weighted_bin_counts(values, weights, bin_edges)
+        bin_edges[-1] = overflow_right
+
+        return counts, bin_edges
+
+    def bin_equal_width_overflow(self, bin_count=100, cutoff_quantile=0.95):
+        """Create a histogram with equal-width bins and an overflow bin like bin_equal_width_overflow from the values
+        of the sketch.
+        """
+        if cutoff_quantile < 0.0 or cutoff_quantile >= 1.0:
+            raise ValueError("Quantile must be between 0.0 and <1.0.")
+
+        values, weights = self._weighted_values()
+
+        cutoff = _weighted_quantile(values, weights, cutoff_quantile)
+        overflow_right = self._overflow_right(values, weights, cutoff_quantile, 'mean')
+
+        bin_edges = np.linspace(0.0, cutoff, num=bin_count + 1)
+
+        # Add the last value to the histogram
+        bin_edges = np.unique(np.append(bin_edges, self.max))
+
+        counts = _weighted_bin_counts(values, weights, bin_edges)
+        bin_edges[-1] = overflow_right
+
+        return counts, bin_edges
+
+    def _overflow_right(self, values, weights, cutoff_quantile, overflow_agg):
+        # Compute width of overflow bin by aggregating the values above the cutoff
+        cutoff = _weighted_quantile(values, weights, cutoff_quantile)
+        overflow = values > cutoff
+
+        if overflow_agg not in ['median', 'mean']:
+            raise ValueError("Unknown overflow aggregation method {}!".format(overflow_agg))
+
+        # Without values above the cutoff, the overflow bin is undefined like with the exact histogram functions
+        if not overflow.any():
+            overflow_mean = np.nan
+        elif overflow_agg == 'median':
+            overflow_mean = _weighted_quantile(values[overflow], weights[overflow], 0.5)
+        else:
+            overflow_mean = values[overflow].dot(weights[overflow]) / weights[overflow].sum()
+
+        return cutoff + 2 * (overflow_mean - cutoff)
+
+    def _update_max(self, max_value, max_count):
+        # Keep the maximum and the number of values equal to it
+        if self.max_count == 0 or max_value > self.max:
+            self.max = max_value
+            self.max_count = max_count
+        elif max_value == self.max:
+            self.max_count += max_count
+
+    def _extend(self, min_index, max_index):
+        # Grow the bucket counts to include the bucket indices from min_index to max_index
+        if len(self.bucket_counts) == 0:
+            self.offset = min_index
+            self.bucket_counts = np.zeros(max_index - min_index + 1, dtype=np.int64)
+            return
+
+        new_offset = min(self.offset, min_index)
+        new_end = max(self.offset + len(self.bucket_counts), max_index + 1)
+
+        if new_offset < self.offset or new_end > self.offset + len(self.bucket_counts):
+            bucket_counts = np.zeros(new_end - new_offset, dtype=np.int64)
+            start = self.offset - new_offset
+            bucket_counts[start:start + len(self.bucket_counts)] = self.bucket_counts
+
+            self.offset = new_offset
+            self.bucket_counts = bucket_counts
+
+    def _weighted_values(self):
+        # The representative values of the non-empty buckets in ascending order, with zero as first value. The values
+        # equal to the maximum are represented exactly, the other values of its bucket are represented below it.
+        indices = np.arange(self.offset, self.offset + len(self.bucket_counts))
+        representatives = np.minimum(2 * self.gamma ** indices / (self.gamma + 1), np.nextafter(self.max, 0.0))
+
+        values = np.append(0.0, representatives)
+        weights = np.append(self.zero_count, self.bucket_counts)
+
+        if self.max > 0.0:
+            weights[-1] -= self.max_count
+            values = np.append(values, self.max)
+            weights = np.append(weights, self.max_count)
+
+        non_empty = weights > 0
+
+        return values[non_empty], weights[non_empty]
+
+
+def _weighted_quantile(values, weights, q):
+    # Quantiles of sorted values with integer weights, interpolating between order statistics like pandas
+    rank = np.asarray(q, dtype=float) * (weights.sum() - 1)
+    cumulative = np.cumsum(weights)
+
+    lower = values[np.searchsorted(cumulative, np.floor(rank), side='right')]
+    upper = values[np.searchsorted(cumulative, np.ceil(rank), side='right')]
+
+    return lower + (rank - np.floor(rank)) * (upper - lower)
+
+
+def _weighted_bin_counts(values, weights, bin_edges):
+    # Count the values in bins that are closed on the left like pd.cut(..., right=False), values at or beyond the last
+    # edge are not counted
+    bin_indices = np.searchsorted(bin_edges, values, side='right') - 1
+    in_bins = (bin_indices >= 0) & (bin_indices < len(bin_edges) - 1)
+
+    return np.bincount(bin_indices[in_bins], weights=weights[in_bins], minlength=len(bin_edges) - 1).astype(np.int64)
+
+
 def log_value_counts(df, col, loglevel=logging.INFO):
     total_entries = df.shape[0]
     series = df[col]
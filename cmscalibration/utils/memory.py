@@ -0,0 +1,32 @@
+""" Utilities to report the memory usage of the calibration process. """
+
+import logging
+import sys
+
+try:
+    import resource
+except ImportError:
+    # Not available on all platforms, e.g. Windows
+    resource = None
+
+
+def peak_memory_mb():
+    """Return the peak resident set size of the current process in MB or None if it cannot be determined."""
+    if resource is None:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # The peak size is reported in bytes on macOS and in kilobytes on Linux
+    if sys.platform == 'darwin':
+        return max_rss / 2 ** 20
+
+    return max_rss / 2 ** 10
+
+
+def log_memory(stage):
+    """Log the peak memory usage of the process after the supplied stage of the calibration."""
+    peak = peak_memory_mb()
+
+    if peak is not None:
+        logging.debug("Peak memory usage after {}: {:.1f} MB.".format(stage, peak))
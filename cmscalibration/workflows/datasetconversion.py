@@ -0,0 +1,85 @@
+import logging
+import os
+
+import pandas as pd
+
+from data.dataset import Metric
+from exporters.partitionedexport import PartitionedDatasetExporter
+from importers.dataset_import import DatasetImporter
+from importers.jmimport import JMImporter
+from importers.wmaimport import SummarizedWMAImporter
+from interfaces.workflow import CalibrationWorkflow
+from merge.merge_datasets import UnionDatasetMerge
+from merge.reportmatching import JobReportMatcher
+from utils import config
+
+
+class JMParquetConversion(CalibrationWorkflow):
+    """Converts the JobMonitoring dataset of the configured time frame into daily Parquet partitions.
+
+    The partitions contain the normalized job reports, so later calibration runs can import them without parsing
+    and converting the original CSV files again. The resulting dataset description is written to the 'jmParquet'
+    output path and can be used as 'jmParquet' input path of a calibration run.
+    """
+
+    def run(self):
+        start_date = pd.to_datetime(config.startDate)
+        end_date = pd.to_datetime(config.endDate)
+
+        options = config.workflowOptions
+        importer = JMImporter(timezone_correction=options.get('timezoneCorrection', 'Europe/Berlin'),
+                              hostname_suffix=options.get('hostnameSuffix', '.gridka.de'),
+                              with_files=options.get('withFiles', False),
+                              id_hash_method=options.get('idHashMethod', 'md5'))
+
+        logging.info("Converting Jobmonitoring dataset between {} and {} to Parquet.".format(start_date, end_date))
+
+        jm_dataset = DatasetImporter(importer).import_dataset(config.inputPaths['jm'], start_date, end_date)
+
+        output_path = os.path.join(config.outputDirectory, config.outputPaths.get('jmParquet', 'jm-parquet'))
+        description_path = PartitionedDatasetExporter(output_path, name='jm') \
+            .export(jm_dataset, importer.date_filter_metric)
+
+        logging.info("Wrote Jobmonitoring dataset description to {}.".format(description_path))
+
+
+class MergedJobsConversion(CalibrationWorkflow):
+    """Matches the JobMonitoring and WMArchive job reports of the configured time frame and writes the merged job
+    reports into daily Parquet partitions.
+
+    The merged reports are joined and written one day at a time, so the merged dataset does not have to fit into
+    memory. The resulting dataset description is written to the 'mergedJobs' output path.
+    """
+
+    def run(self):
+        start_date = pd.to_datetime(config.startDate)
+        end_date = pd.to_datetime(config.endDate)
+
+        options = config.workflowOptions
+
+        # Matching on files requires the file lists of the jobs in both datasets
+        match_on_files = options.get('matchOnFiles', False)
+
+        jm_importer = JMImporter(timezone_correction=options.get('timezoneCorrection', 'Europe/Berlin'),
+                                 hostname_suffix=options.get('hostnameSuffix', '.gridka.de'),
+                                 with_files=match_on_files,
+                                 id_hash_method=options.get('idHashMethod', 'md5'))
+        wma_importer = SummarizedWMAImporter(with_files=match_on_files,
+                                             chunksize=options.get('wmaChunkSize', 100000))
+
+        jm_dataset = DatasetImporter(jm_importer).import_dataset(config.inputPaths['jm'], start_date, end_date)
+        wm_dataset = DatasetImporter(wma_importer).import_dataset(config.inputPaths['wma'], start_date, end_date)
+
+        matcher = JobReportMatcher(timestamp_tolerance=10,
+                                   time_grouping_freq=options.get('matchingTimeGrouping', 'D'),
+                                   workers=options.get('matchingWorkers', 1))
+        matches = matcher.match_reports(jm_dataset, wm_dataset, use_files=match_on_files,
+                                        use_workflows=options.get('matchOnWorkflows', False))
+
+        output_path = os.path.join(config.outputDirectory, config.outputPaths.get('mergedJobs', 'merged-jobs'))
+        description_path = UnionDatasetMerge().merge_to_partitions(
+            matches, jm_dataset, wm_dataset, left_index='UniqueID', right_index='wmaid',
+            exporter=PartitionedDatasetExporter(output_path, name='jobs'), partition_metric=Metric.STOP_TIME,
+            left_suffix='jm', right_suffix='wma')
+
+        logging.info("Wrote merged job dataset description to {}.".format(description_path))
@@ -9,6 +9,7 @@ from analysis import jobreportanalysis
 from analysis import jobreportcleaning
 from analysis import nodeanalysis
 from analysis.demandextraction import FilteredJobClassifier, JobDemandExtractor
+from data import categorical
 from data.dataset import Metric
 from exporters.datasetexport import ReferenceWalltimeExporter
 from importers.dataset_import import DatasetImporter
@@ -16,15 +17,17 @@ from importers.gridkadata import GridKaNodeDataImporter, ColumnCoreUsageImporter
     CPUEfficiencyReferenceImporter
 from importers.jmimport import JMImporter
 from importers.jobcounts import JobCountImporter
+from importers.parquetimport import ParquetDatasetImporter
 from importers.wmaimport import SummarizedWMAImporter
 from interfaces.workflow import CalibrationWorkflow
 from merge import job_node
+from merge.matchcache import MatchCache
 from merge.merge_datasets import UnionDatasetMerge
 from merge.reportmatching import JobReportMatcher
-from utils import config, visualization
+from utils import config, memory, visualization
 from utils import report as rp
 from utils.report import ReportBuilder
-from workflows.workflowutils import export_job_counts, export_parameters
+from workflows.workflowutils import export_job_counts, export_parameters, export_parameter_sweep
 
 
 # Todo Split this up into smaller methods
@@ -53,54 +56,87 @@ class GridKaCalibration(CalibrationWorkflow):
         # Import data sets
         ##################
 
-        # Timezone correction correct for errors in timestamps of JobMonitoring data
-        dataset_importer = DatasetImporter(
-            JMImporter(timezone_correction='Europe/Berlin', hostname_suffix='.gridka.de', with_files=False))
-        jm_dataset = dataset_importer.import_dataset(config.inputPaths['jm'], start_date, end_date)
+        # Matching on files requires the file lists of the jobs in both datasets
+        match_on_files = config.workflowOptions.get('matchOnFiles', False)
 
-        wm_dataset = DatasetImporter(SummarizedWMAImporter(with_files=False)) \
-            .import_dataset(config.inputPaths['wma'], start_date, end_date)
+        if 'jmParquet' in config.inputPaths:
+            # Previously converted Jobmonitoring data, already normalized with the importer options of the conversion
+            jm_description_path = config.inputPaths['jmParquet']
+            dataset_importer = DatasetImporter(
+                ParquetDatasetImporter('UniqueID', JMImporter.date_filter_metric,
+                                       columns=[metric.value for metric in JMImporter.defined_metrics.values()],
+                                       extra_tables=['files'] if match_on_files else None,
+                                       name="Jobmonitoring Jobs"))
 
-        cached_matches = None
-        use_caching = config.cacheDir is not None
+            # The content hashes of the converted partitions already reflect the importer options of the conversion
+            match_cache_parameters = {}
+        else:
+            # Timezone correction correct for errors in timestamps of JobMonitoring data
+            jm_importer_options = {'timezone_correction': 'Europe/Berlin', 'hostname_suffix': '.gridka.de',
+                                   'id_hash_method': config.workflowOptions.get('idHashMethod', 'md5')}
 
-        if use_caching:
-            match_cache_file = os.path.join(config.cacheDir, 'jm-wma-matches.csv')
+            jm_description_path = config.inputPaths['jm']
+            dataset_importer = DatasetImporter(JMImporter(with_files=match_on_files, **jm_importer_options))
 
-            if os.path.isfile(match_cache_file):
-                try:
-                    cached_matches = pd.read_csv(match_cache_file,
-                                                 usecols=[jm_dataset.df.index.name, wm_dataset.df.index.name])
-                    logging.info(
-                        "Loaded {} matches from match cache {}!".format(cached_matches.shape[0], match_cache_file))
-                except Exception:
-                    logging.warning("No match cache found at {}!".format(match_cache_file))
+            # Importer settings influence the report IDs and time stamps and hence the matches
+            match_cache_parameters = {'jmImporter': jm_importer_options}
 
-        # Match Jobmonitoring and WMArchive job reports
-        matcher = JobReportMatcher(timestamp_tolerance=10, time_grouping_freq='D')
-        matches = matcher.match_reports(jm_dataset, wm_dataset, use_files=False, previous_matches=cached_matches)
+        jm_dataset = dataset_importer.import_dataset(jm_description_path, start_date, end_date)
+
+        wma_importer = SummarizedWMAImporter(with_files=match_on_files,
+                                             chunksize=config.workflowOptions.get('wmaChunkSize', 100000))
+        wm_dataset = DatasetImporter(wma_importer).import_dataset(config.inputPaths['wma'], start_date, end_date)
 
-        if use_caching:
-            match_cache_file = os.path.join(config.cacheDir, 'jm-wma-matches.csv')
+        # Share the vocabularies of categorical columns, e.g. workflows, between both datasets
+        jm_dataset.df, wm_dataset.df = categorical.unify_categories([jm_dataset.df, wm_dataset.df])
+        memory.log_memory("importing job reports")
 
-            logging.info("Writing {} matches to file {}".format(matches.shape[0], match_cache_file))
-            matches.to_csv(match_cache_file)
+        # Match Jobmonitoring and WMArchive job reports
+        # Without a time grouping frequency, reports are matched with a tolerance window around their time stamps
+        matcher = JobReportMatcher(timestamp_tolerance=10,
+                                   time_grouping_freq=config.workflowOptions.get('matchingTimeGrouping', 'D'),
+                                   workers=config.workflowOptions.get('matchingWorkers', 1),
+                                   file_popularity_limit=config.workflowOptions.get('filePopularityLimit', 1000))
+
+        # Reports that remain unmatched can be matched on their workflows and time stamps only
+        match_on_workflows = config.workflowOptions.get('matchOnWorkflows', False)
+
+        use_cache = config.cacheDir is not None
+        if use_cache and (match_on_files or match_on_workflows):
+            logging.warning("The match cache does not support matching on files or workflows, matching without it.")
+            use_cache = False
+
+        if use_cache:
+            match_cache = MatchCache(os.path.join(config.cacheDir, 'matches'),
+                                     [jm_description_path, config.inputPaths['wma']],
+                                     parameters=match_cache_parameters)
+            matches = match_cache.match_reports(matcher, jm_dataset, wm_dataset, start_date, end_date,
+                                                use_files=match_on_files, use_workflows=match_on_workflows)
+        else:
+            matches = matcher.match_reports(jm_dataset, wm_dataset, use_files=match_on_files,
+                                            use_workflows=match_on_workflows)
 
         jobs_dataset = UnionDatasetMerge().merge_datasets(matches, jm_dataset, wm_dataset, left_index='UniqueID',
                                                           right_index='wmaid', left_suffix='jm', right_suffix='wma')
+        memory.log_memory("merging matched job reports")
 
-        jobs_dataset.df = jobreportcleaning.clean_job_reports(jobs_dataset.df)
+        jobs_dataset.df = jobreportcleaning.clean_job_reports(jobs_dataset.df, inplace=True)
 
         # Import node information
-        nodes = GridKaNodeDataImporter().import_file(config.inputPaths['nodeInfo'])
+        node_importer = GridKaNodeDataImporter()
+        nodes = node_importer.import_file(config.inputPaths['nodeInfo'])
+        node_index = node_importer.create_node_index(nodes)
         nodes = nodeanalysis.add_performance_data(nodes, simulated_cores=config.workflowOptions['coreSimulationMethod'],
                                                   thread_rate_method=config.workflowOptions['threadPerformanceMethod'])
 
-        # Match jobs to nodes
-        matched_jobs = job_node.match_jobs_to_node(jobs_dataset.df, nodes)
-        matched_jobs = jobreportanalysis.add_missing_node_info(matched_jobs, nodes)
+        node_types = nodeanalysis.extract_node_types(nodes)
+
+        # Match jobs to nodes, the jobs only carry the IDs of their node types
+        matched_jobs = job_node.match_jobs_to_node(jobs_dataset.df, node_index)
+        default_rate_per_thread = jobreportanalysis.average_rate_per_thread(nodes)
 
-        jm_dataset.df = jobreportanalysis.add_performance_data(matched_jobs)
+        jm_dataset.df = jobreportanalysis.add_performance_data(matched_jobs, node_types,
+                                                               default_rate_per_thread=default_rate_per_thread)
         job_data = jm_dataset.df
 
         # Import additional information for usage of GridKa site
@@ -117,11 +153,13 @@ class GridKaCalibration(CalibrationWorkflow):
         self.add_cpu_efficiency(job_data, start_date, end_date)
 
         # Compute calibration parameters
-        node_types = nodeanalysis.extract_node_types(nodes)
-
         # Scale the resource environment with both information from the job reports and the Pilot jobs
-        scaled_nodes_pilots = nodeanalysis.scale_site_by_jobslots(node_types, cms_avg_cores)
-        scaled_nodes_reports = nodeanalysis.scale_site_by_jobslots(node_types, avg_jobslots_reports)
+        # Additional target jobslot counts can be supplied to export a sweep of scaled resource environments
+        sweep_scores = config.workflowOptions.get('siteScalingSweep', [])
+
+        scaling_method = config.workflowOptions.get('siteScalingMethod', 'greedy')
+        scaled_nodes_pilots, scaled_nodes_reports, *scaled_nodes_sweep = nodeanalysis.scale_site_by_jobslots_sweep(
+            node_types, [cms_avg_cores, avg_jobslots_reports] + sweep_scores, method=scaling_method)
 
         type_split_cols = config.workflowOptions['typeSplitCols']
 
@@ -143,6 +181,9 @@ class GridKaCalibration(CalibrationWorkflow):
         export_parameters('parameters_slots_from_pilots', scaled_nodes_pilots, demands)
         export_parameters('parameters_slots_from_reports', scaled_nodes_reports, demands)
 
+        if sweep_scores:
+            export_parameter_sweep('parameters_site_sweep', scaled_nodes_sweep, sweep_scores, demands)
+
         # Sample half of the reports, fix random state for reproducibility
         reports_train, reports_test = sampling.split_samples(job_data, frac=0.5, random_state=38728)
 
@@ -162,8 +203,10 @@ class GridKaCalibration(CalibrationWorkflow):
         # Export job throughputs from analyzed jobs
 
         jobs_from_reports = job_data.copy()
-        jobs_from_reports[Metric.JOB_TYPE.value] = jobs_from_reports[Metric.JOB_TYPE.value].fillna('unknown')
-        job_counts_reports = jobs_from_reports.groupby(Metric.JOB_TYPE.value).size().reset_index()
+        jobs_from_reports[Metric.JOB_TYPE.value] = categorical.fill_category(jobs_from_reports[Metric.JOB_TYPE.value],
+                                                                             'unknown')
+        job_counts_reports = jobs_from_reports.groupby(Metric.JOB_TYPE.value, observed=True).size().sort_index() \
+            .reset_index()
         job_counts_reports.columns = ['type', 'count']
         job_counts_reports['throughput_day'] = job_counts_reports['count'].divide(day_count)
 
@@ -176,7 +219,7 @@ class GridKaCalibration(CalibrationWorkflow):
         ReferenceWalltimeExporter().export_to_json_file(partitions, walltime_path)
 
         # Write jobs to report
-        calibrationreport.add_jobs_report_section(jm_dataset, self.report)
+        calibrationreport.add_jobs_report_section(jm_dataset, node_types, self.report)
 
         # Write report out to disk
         self.report.write()
@@ -188,7 +231,7 @@ class GridKaCalibration(CalibrationWorkflow):
                                                                     end_ts_col=Metric.STOP_TIME.value,
                                                                     slot_col=Metric.USED_CORES.value)
 
-        jobslots_from_reports = jobslot_timeseries['totalSlots'].resample('s').pad().resample('H').mean()
+        jobslots_from_reports = resource_usage.time_weighted_resample(jobslot_timeseries, 'h')
         avg_jobslots_reports = jobslots_from_reports.mean()
 
         fig, axes = calibrationreport.multiple_jobslot_usage(
@@ -0,0 +1,181 @@
+import logging
+from datetime import datetime
+
+import pandas as pd
+
+from analysis import calibrationreport
+from analysis import jobreportanalysis
+from analysis import jobreportcleaning
+from analysis import nodeanalysis
+from analysis.demandextraction import JobDemandExtractor
+from analysis.streamingstatistics import CalibrationStatistics
+from data import categorical
+from importers.dataset_import import DatasetImporter
+from importers.gridkadata import GridKaNodeDataImporter, ColumnCoreUsageImporter
+from importers.jmimport import JMImporter
+from importers.parquetimport import ParquetDatasetImporter
+from importers.wmaimport import SummarizedWMAImporter
+from interfaces.workflow import CalibrationWorkflow
+from merge import job_node
+from merge.merge_datasets import UnionDatasetMerge
+from merge.reportmatching import JobReportMatcher
+from utils import config, memory
+from utils import report as rp
+from utils.report import ReportBuilder
+from workflows.workflowutils import export_job_counts, export_parameters
+
+
+class StreamingGridKaCalibration(CalibrationWorkflow):
+    """Calibrates the resource environment of GridKa like GridKaCalibration, but processes the configured time frame
+    one day at a time.
+
+    The job reports of each day are imported, matched, cleaned and then folded into mergeable statistics, so the
+    memory usage only depends on the job reports of a single day. Resource demands are extracted from sketches of
+    their distributions, see LogHistogramSketch for their error bounds. Reports whose JobMonitoring and WMArchive
+    parts fall on different days are not matched.
+    """
+
+    def __init__(self):
+        self.report = ReportBuilder(base_path=config.outputDirectory, filename='calibration-report.md')
+
+    def run(self):
+        self.report.append('# GridKa Streaming Calibration Run')
+
+        time_now = datetime.now().strftime('%Y-%m-%d, %H:%M:%S')
+        self.report.append('at {}'.format(time_now))
+        logging.info("Streaming Model Calibration run at {}".format(time_now))
+
+        start_date = pd.to_datetime(config.startDate)
+        end_date = pd.to_datetime(config.endDate)
+
+        day_count = (end_date - start_date).days
+
+        self.report.append()
+        self.report.append("Start date: {}  \nEnd date: {}".format(start_date, end_date))
+
+        # Import node information, which is shared by all days
+        node_importer = GridKaNodeDataImporter()
+        nodes = node_importer.import_file(config.inputPaths['nodeInfo'])
+        node_index = node_importer.create_node_index(nodes)
+        nodes = nodeanalysis.add_performance_data(nodes, simulated_cores=config.workflowOptions['coreSimulationMethod'],
+                                                  thread_rate_method=config.workflowOptions['threadPerformanceMethod'])
+        node_types = nodeanalysis.extract_node_types(nodes)
+        default_rate_per_thread = jobreportanalysis.average_rate_per_thread(nodes)
+
+        type_split_cols = config.workflowOptions['typeSplitCols']
+        relative_accuracy = config.workflowOptions.get('sketchRelativeAccuracy', 0.001)
+
+        if 'splitTypes' in config.workflowOptions:
+            logging.warning("Splitting job types by values is not supported by the streaming calibration, ignoring.")
+
+        statistics = CalibrationStatistics(start_date, end_date, type_split_cols=type_split_cols,
+                                           relative_accuracy=relative_accuracy)
+
+        for day_start in pd.date_range(start_date, end_date, freq='D', inclusive='left'):
+            # The importers include jobs at the end date, so the day ends just before the next day starts
+            day_end = min(day_start + pd.Timedelta(days=1), end_date) - pd.Timedelta(1, unit='ns')
+
+            jobs = self.import_jobs(day_start, day_end)
+
+            jobs = job_node.match_jobs_to_node(jobs, node_index)
+            jobs = jobreportanalysis.add_performance_data(jobs, node_types,
+                                                          default_rate_per_thread=default_rate_per_thread)
+
+            day_statistics = CalibrationStatistics(start_date, end_date, type_split_cols=type_split_cols,
+                                                   relative_accuracy=relative_accuracy)
+            day_statistics.add_jobs(jobs)
+            statistics.merge(day_statistics)
+
+            memory.log_memory("processing jobs of {}".format(day_start.date()))
+
+        # Import additional information for usage of GridKa site
+        core_df = ColumnCoreUsageImporter().import_file(config.inputPaths['coreUsage'], start_date, end_date)
+        cms_avg_cores = core_df['cms'].mean()
+
+        jobslots_from_reports = statistics.jobslots.timeseries()
+        avg_jobslots_reports = statistics.jobslots.mean()
+
+        fig, axes = calibrationreport.multiple_jobslot_usage(
+            {'Extracted from job reports': jobslots_from_reports,
+             'Allocated to GridKa CMS pilots': core_df['cms']})
+        self.report.add_figure(fig, axes, 'jobslot_usage_reference')
+
+        self.add_job_type_statistics(statistics, day_count)
+
+        # Scale the resource environment with both information from the job reports and the Pilot jobs
+        scaling_method = config.workflowOptions.get('siteScalingMethod', 'greedy')
+        scaled_nodes_pilots, scaled_nodes_reports = nodeanalysis.scale_site_by_jobslots_sweep(
+            node_types, [cms_avg_cores, avg_jobslots_reports], method=scaling_method)
+
+        job_demand_extractor = JobDemandExtractor(self.report, equal_width=False, bin_count=60,
+                                                  cutoff_quantile=0.95,
+                                                  overflow_agg=config.workflowOptions['overflowAggregationMethod'],
+                                                  additional_job_options=config.workflowOptions['additionalJobOptions'],
+                                                  drop_overflow=config.workflowOptions.get('dropOverflow', False))
+
+        demands, _ = job_demand_extractor.extract_job_demands(statistics.demands.job_groups())
+
+        export_parameters('parameters_slots_from_pilots', scaled_nodes_pilots, demands)
+        export_parameters('parameters_slots_from_reports', scaled_nodes_reports, demands)
+
+        # Export job throughputs from analyzed jobs
+        job_counts_reports = statistics.job_types.job_counts().reset_index()
+        job_counts_reports.columns = ['type', 'count']
+        job_counts_reports['throughput_day'] = job_counts_reports['count'].divide(day_count)
+
+        export_job_counts(job_counts_reports, 'parameters_slots_from_pilots', config.outputPaths['jobCountReports'])
+
+        self.report.write()
+
+    def import_jobs(self, start_date, end_date):
+        """Import, match and clean the job reports of the supplied time frame."""
+        logging.info("Processing job reports between {} and {}.".format(start_date, end_date))
+
+        if 'jmParquet' in config.inputPaths:
+            # Previously converted Jobmonitoring data, already normalized with the importer options
+            jm_description_path = config.inputPaths['jmParquet']
+            jm_importer = ParquetDatasetImporter('UniqueID', JMImporter.date_filter_metric,
+                                                 columns=[metric.value for metric in
+                                                          JMImporter.defined_metrics.values()],
+                                                 name="Jobmonitoring Jobs")
+        else:
+            jm_description_path = config.inputPaths['jm']
+            jm_importer = JMImporter(timezone_correction='Europe/Berlin', hostname_suffix='.gridka.de',
+                                     id_hash_method=config.workflowOptions.get('idHashMethod', 'md5'))
+
+        # Time zone corrections can move job reports into the time frames of adjacent files
+        file_margin = pd.Timedelta(config.workflowOptions.get('streamingFileMargin', '1D'))
+
+        jm_dataset = DatasetImporter(jm_importer).import_dataset(jm_description_path, start_date, end_date,
+                                                                 file_margin=file_margin)
+
+        wma_importer = SummarizedWMAImporter(with_files=False,
+                                             chunksize=config.workflowOptions.get('wmaChunkSize', 100000))
+        wm_dataset = DatasetImporter(wma_importer).import_dataset(config.inputPaths['wma'], start_date, end_date,
+                                                                  file_margin=file_margin)
+
+        jm_dataset.df, wm_dataset.df = categorical.unify_categories([jm_dataset.df, wm_dataset.df])
+
+        matcher = JobReportMatcher(timestamp_tolerance=10,
+                                   time_grouping_freq=config.workflowOptions.get('matchingTimeGrouping', 'D'),
+                                   workers=config.workflowOptions.get('matchingWorkers', 1))
+        matches = matcher.match_reports(jm_dataset, wm_dataset,
+                                        use_workflows=config.workflowOptions.get('matchOnWorkflows', False))
+
+        jobs_dataset = UnionDatasetMerge().merge_datasets(matches, jm_dataset, wm_dataset, left_index='UniqueID',
+                                                          right_index='wmaid', left_suffix='jm', right_suffix='wma')
+
+        return jobreportcleaning.clean_job_reports(jobs_dataset.df, inplace=True)
+
+    def add_job_type_statistics(self, statistics, day_count):
+        self.report.append("## Job types")
+
+        summary = pd.DataFrame({'count': statistics.job_types.job_counts(),
+                                'cpuEfficiency': statistics.job_types.cpu_efficiencies()})
+        summary['countPerDay'] = summary['count'] / day_count
+        summary['relFrequency'] = summary['count'] / summary['count'].sum()
+
+        self.report.append_paragraph(rp.CodeBlock().append(summary.to_string()))
+
+        self.report.append("Total (CPU time/wall time) efficiency: {}  ".format(statistics.job_types.cpu_efficiency()))
+        self.report.append("Mean number of jobslots used: {}  ".format(statistics.jobslots.mean()))
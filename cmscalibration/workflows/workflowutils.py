@@ -20,3 +20,11 @@ def export_parameters(subdir, node_params, demand_params):
 
     exporter = CalibrationParameterExporter(parameter_path)
     exporter.export(node_params, 'nodes.json', demand_params, 'jobs.json')
+
+
+def export_parameter_sweep(subdir, node_param_sets, target_scores, demand_params):
+    parameter_path = os.path.join(config.outputDirectory, subdir)
+    node_file_names = ['nodes_{:g}.json'.format(target_score) for target_score in target_scores]
+
+    exporter = CalibrationParameterExporter(parameter_path)
+    exporter.export_sweep(node_param_sets, node_file_names, demand_params, 'jobs.json')
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Benchmark the histogram methods used for resource demand extraction on synthetic job demands.
+
+Run with `python scripts/benchmark_histograms.py --sizes 100000 1000000 10000000`.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cmscalibration'))
+
+from analysis.demandextraction import JobGroupSketch  # noqa: E402
+from data.dataset import Metric  # noqa: E402
+from utils.histogram import bin_by_quantile, bin_equal_width_overflow  # noqa: E402
+
+
+def synthetic_demands(job_count, job_types=('processing', 'production', 'merge', 'analysis'), seed=0):
+    """Create a data frame of heavy-tailed job demands for each of the demand metrics and job types."""
+    rng = np.random.RandomState(seed)
+
+    types = np.array(job_types, dtype=object)[rng.randint(0, len(job_types), size=job_count)]
+
+    cpu_demand = np.round(rng.lognormal(9, 1.5, size=job_count), 2)
+    idle_time = np.round(rng.lognormal(7, 2, size=job_count), 2)
+    events = rng.geometric(1e-4, size=job_count).astype(float)
+
+    df = pd.DataFrame({
+        Metric.JOB_TYPE.value: types,
+        Metric.CPU_DEMAND.value: cpu_demand,
+        Metric.CPU_IDLE_TIME.value: idle_time,
+        Metric.IO_RATIO.value: idle_time / cpu_demand,
+        Metric.EVENT_COUNT.value: events,
+        Metric.CPU_DEMAND_PER_EVENT.value: cpu_demand / events,
+        Metric.CPU_IDLE_TIME_PER_EVENT.value: idle_time / events,
+    })
+
+    # Real job reports contain missing and invalid demands
+    for metric in JobGroupSketch.demand_metrics:
+        df.loc[rng.rand(job_count) < 0.05, metric.value] = np.nan
+        df.loc[rng.rand(job_count) < 0.01, metric.value] = -1.0
+
+    return df
+
+
+def run_histogram(x, method, equal_width, bin_count, cutoff_quantile):
+    start = time.perf_counter()
+    if equal_width:
+        counts, bins = bin_equal_width_overflow(x, bin_count=bin_count, cutoff_quantile=cutoff_quantile,
+                                                method=method)
+    else:
+        counts, bins = bin_by_quantile(x, bin_count=bin_count, cutoff_quantile=cutoff_quantile, method=method)
+    elapsed = time.perf_counter() - start
+
+    return (counts, bins), elapsed
+
+
+def identical(left, right):
+    """Check whether two histograms have bitwise identical counts and bin edges."""
+    left_counts, left_bins = left
+    right_counts, right_bins = right
+
+    return (np.asarray(left_counts, dtype=np.int64).tobytes() == np.asarray(right_counts, dtype=np.int64).tobytes()
+            and np.asarray(left_bins).tobytes() == np.asarray(right_bins).tobytes())
+
+
+def main():
+    parser = argparse.ArgumentParser("Benchmark the histogram methods of the demand extraction.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10 ** 5, 10 ** 6],
+                        help="Numbers of jobs to benchmark with")
+    parser.add_argument('--bin-count', type=int, default=60, help="Number of histogram bins")
+    parser.add_argument('--cutoff-quantile', type=float, default=0.95, help="Quantile of the overflow bin cutoff")
+    parser.add_argument('--equal-width', action='store_true', help="Benchmark histograms with equal-width bins")
+    args = parser.parse_args()
+
+    print("{:>10} {:>20} {:>12} {:>12} {:>12} {:>8} {:>10}".format('jobs', 'metric', 'type', 'pandas [s]',
+                                                                   'numpy [s]', 'speedup', 'identical'))
+
+    for size in args.sizes:
+        df = synthetic_demands(size)
+
+        for metric in JobGroupSketch.demand_metrics:
+            for job_type, jobs_of_type in df.groupby(Metric.JOB_TYPE.value):
+                x = jobs_of_type[metric.value]
+
+                pandas_hist, pandas_time = run_histogram(x, 'pandas', args.equal_width, args.bin_count,
+                                                         args.cutoff_quantile)
+                numpy_hist, numpy_time = run_histogram(x, 'numpy', args.equal_width, args.bin_count,
+                                                       args.cutoff_quantile)
+
+                print("{:>10} {:>20} {:>12} {:>12.4f} {:>12.4f} {:>8.1f} {:>10}".format(
+                    size, metric.value, job_type, pandas_time, numpy_time, pandas_time / numpy_time,
+                    str(identical(pandas_hist, numpy_hist))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Benchmark the CPU time matching methods of the JobReportMatcher on synthetic job reports.
+
+Run with `python scripts/benchmark_matching.py --sizes 100000 1000000 10000000`.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cmscalibration'))
+
+from data.dataset import Dataset, Metric  # noqa: E402
+from merge.reportmatching import JobReportMatcher  # noqa: E402
+
+
+def synthetic_datasets(report_count, days=30, jobs_per_workflow=200, overlap=0.9, seed=0):
+    """Create a pair of JobMonitoring and WMArchive datasets with overlapping job reports."""
+    rng = np.random.RandomState(seed)
+
+    start = pd.Timestamp('2018-05-01')
+    start_offsets = rng.randint(0, days * 24 * 3600, size=report_count)
+    durations = rng.randint(60, 48 * 3600, size=report_count)
+
+    start_times = start + pd.to_timedelta(start_offsets, unit='s')
+    stop_times = start_times + pd.to_timedelta(durations, unit='s')
+
+    workflow_count = max(1, report_count // jobs_per_workflow)
+    workflows = np.array(['workflow_{}'.format(i) for i in range(workflow_count)], dtype=object)
+    workflow = workflows[rng.randint(0, workflow_count, size=report_count)]
+
+    cpu_time = durations * rng.uniform(0.3, 1.0, size=report_count)
+
+    jm = pd.DataFrame({
+        Metric.START_TIME.value: start_times,
+        Metric.STOP_TIME.value: stop_times,
+        Metric.WORKFLOW.value: workflow,
+        Metric.CPU_TIME.value: cpu_time,
+        Metric.SUBMISSION_TOOL.value: 'wmagent',
+    }, index=pd.Index(['jm{}'.format(i) for i in range(report_count)], name='UniqueID'))
+
+    # WMArchive reports are a noisy subset of the JobMonitoring reports
+    wm_rows = rng.rand(report_count) < overlap
+    wm = jm[wm_rows].drop(columns=Metric.SUBMISSION_TOOL.value)
+    wm.index = pd.Index(['wm{}'.format(i) for i in range(wm.shape[0])], name='wmaid')
+
+    wm[Metric.START_TIME.value] += pd.to_timedelta(rng.randint(-3, 4, size=wm.shape[0]), unit='s')
+    wm[Metric.CPU_TIME.value] += rng.uniform(-0.2, 0.2, size=wm.shape[0])
+
+    return Dataset(jm, name='JM'), Dataset(wm, name='WMA')
+
+
+def run_matcher(jmset, wmset, method, workers=1):
+    matcher = JobReportMatcher(timestamp_tolerance=10, time_grouping_freq='D', cpu_match_method=method,
+                               workers=workers)
+
+    start = time.perf_counter()
+    matches = matcher.match_reports(jmset, wmset, use_files=False)
+    elapsed = time.perf_counter() - start
+
+    return matches, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser("Benchmark the CPU time matching methods.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10 ** 5, 10 ** 6, 10 ** 7],
+                        help="Numbers of JobMonitoring reports to benchmark with")
+    parser.add_argument('--max-merge-size', type=int, default=10 ** 6,
+                        help="Largest data set size to also run the merge-based method for")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of worker processes used by the sorted method")
+    args = parser.parse_args()
+
+    print("{:>10} {:>12} {:>12} {:>10} {:>10}".format('reports', 'sorted [s]', 'merge [s]', 'matches', 'identical'))
+
+    for size in args.sizes:
+        jmset, wmset = synthetic_datasets(size)
+
+        sorted_matches, sorted_time = run_matcher(jmset, wmset, 'sorted', workers=args.workers)
+
+        merge_time = float('nan')
+        identical = '-'
+        if size <= args.max_merge_size:
+            merge_matches, merge_time = run_matcher(jmset, wmset, 'merge')
+            identical = sorted_matches.equals(merge_matches)
+
+        print("{:>10} {:>12.2f} {:>12.2f} {:>10} {:>10}".format(size, sorted_time, merge_time,
+                                                               sorted_matches.shape[0], str(identical)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Smoke run of the streaming GridKa calibration on synthetic input files of a two-day time frame.
+
+Run with `python scripts/smoke_streaming_calibration.py`. The input and output files are written to a temporary
+directory, which is kept with --keep.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cmscalibration'))
+
+from utils import config  # noqa: E402
+from workflows.streamingcalibration import StreamingGridKaCalibration  # noqa: E402
+
+JOB_TYPES = ['Processing', 'Production', 'Merge']
+
+
+def write_inputs(directory, start, days, jobs_per_day, host_count=50, seed=0):
+    """Write JobMonitoring, WMArchive, node and core usage files, including the days before and after the
+    time frame, as reports can be moved into adjacent days by time zone corrections.
+    """
+    rng = np.random.RandomState(seed)
+
+    hosts = np.array(['n{}'.format(i) for i in range(host_count)], dtype=object)
+    jm_files, wm_files = [], []
+
+    for day_index in range(-1, days + 1):
+        day = start + pd.Timedelta(days=day_index)
+        first_id = (day_index + 1) * jobs_per_day
+
+        start_ms = day.value // 10 ** 6 + rng.randint(0, 24 * 3600 * 1000, size=jobs_per_day)
+        duration_ms = rng.randint(60 * 1000, 8 * 3600 * 1000, size=jobs_per_day)
+        cores = rng.choice([1, 4, 8], size=jobs_per_day)
+        cpu_time = duration_ms / 1000 * cores * rng.uniform(0.2, 0.95, size=jobs_per_day)
+        workflows = np.array(['wf{}'.format(i) for i in rng.randint(0, 20, size=jobs_per_day)], dtype=object)
+        job_hosts = hosts[rng.randint(0, host_count, size=jobs_per_day)]
+        job_types = np.array(JOB_TYPES, dtype=object)[rng.randint(0, len(JOB_TYPES), size=jobs_per_day)]
+
+        jm = pd.DataFrame({
+            'JobId': np.arange(first_id, first_id + jobs_per_day),
+            'FileName': 'file',
+            'Type': job_types,
+            'GenericType': 'generic',
+            'SubmissionTool': 'wmagent',
+            'InputSE': 'se',
+            'TaskJobId': 1,
+            'TaskId': 1,
+            'TaskMonitorId': ['wmagent_' + workflow for workflow in workflows],
+            'JobExecExitCode': 0.0,
+            'JobExecExitTimeStamp': start_ms + duration_ms,
+            'StartedRunningTimeStamp': start_ms,
+            'FinishedTimeStamp': start_ms + duration_ms,
+            'WrapWC': duration_ms / 1000,
+            'WrapCPU': cpu_time,
+            'NCores': cores,
+            'NEvProc': rng.randint(0, 5000, size=jobs_per_day),
+            'WNHostName': [host + '.gridka.de' for host in job_hosts],
+            'JobType': job_types,
+        })
+        jm_name = 'jm{}.csv'.format(day_index + 1)
+        jm.to_csv(os.path.join(directory, jm_name), index=False)
+
+        # WMArchive time stamps are in UTC, while JobMonitoring time stamps are corrected from local time
+        local_start = pd.to_datetime(start_ms, unit='ms').tz_localize('UTC').tz_convert('Europe/Berlin')
+        local_stop = pd.to_datetime(start_ms + duration_ms, unit='ms').tz_localize('UTC').tz_convert('Europe/Berlin')
+        start_s = (local_start.tz_localize(None) - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+        stop_s = (local_stop.tz_localize(None) - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+
+        wm_name = 'wma{}.txt'.format(day_index + 1)
+        with open(os.path.join(directory, wm_name), 'w') as file:
+            for i in range(jobs_per_day):
+                report = {'wmaid': 'wma{}'.format(first_id + i), 'startTime': int(start_s[i]),
+                          'stopTime': int(stop_s[i]), 'ts': int(stop_s[i]),
+                          'task': '/{}/task'.format(workflows[i]), 'jobtype': job_types[i],
+                          'TotalJobCPU': float(cpu_time[i]), 'TotalJobTime': float(duration_ms[i] / 1000),
+                          'NumberOfThreads': int(cores[i]), 'NumberOfStreams': int(cores[i]),
+                          'inputEvents': 1000, 'outputEvents': 100, 'TotalInitTime': 30.0,
+                          'EventThroughput': float(rng.uniform(0.01, 2)), 'writeTotalSecs': 10.0,
+                          'readTotalMB': 500.0, 'writeTotalMB': 100.0, 'readMBSec': 10.0, 'writeMBSec': 10.0,
+                          'exitCode': None, 'wn_name': job_hosts[i], 'LFNArray': []}
+                file.write(json.dumps(report) + '\n')
+
+        next_day = day + pd.Timedelta(days=1)
+        jm_files.append({'file': jm_name, 'start': str(day.date()), 'end': str(next_day.date())})
+        wm_files.append({'file': wm_name, 'start': str(day.date()), 'end': str(next_day.date())})
+
+    with open(os.path.join(directory, 'jm.json'), 'w') as file:
+        json.dump({'name': 'jm', 'files': jm_files}, file)
+    with open(os.path.join(directory, 'wma.json'), 'w') as file:
+        json.dump({'name': 'wma', 'files': wm_files}, file)
+
+    with open(os.path.join(directory, 'nodes.csv'), 'w') as file:
+        file.write('hostname,jobslots,hs06,db12-at-boot,db12cpp-at-boot,db12numpy-at-boot,cores,cpu model,'
+                   'interconnect\n')
+        for i, host in enumerate(hosts):
+            cores, jobslots, hs06 = [(16, 32, 350.0), (20, 40, 420.0)][i % 2]
+            file.write('{},{},{},1,1,1,{},model{},eth\n'.format(host, jobslots, hs06, cores, i % 2))
+
+    times = pd.date_range(start - pd.Timedelta(days=1), start + pd.Timedelta(days=days + 1), freq='15min')
+    pd.DataFrame({'Time': times.strftime('%Y-%m-%d %H:%M:%S'), 'cms': rng.uniform(300, 600, len(times))}) \
+        .to_csv(os.path.join(directory, 'cores.csv'), sep=';', index=False)
+
+
+def write_config(directory, start, days):
+    conf = {
+        'workflow': 'workflows.streamingcalibration.StreamingGridKaCalibration',
+        'runName': 'smoke',
+        'startDate': str(start.date()),
+        'endDate': str((start + pd.Timedelta(days=days)).date()),
+        'outputDirectory': os.path.join(directory, 'out'),
+        'workflowOptions': {
+            'coreSimulationMethod': 'physical',
+            'threadPerformanceMethod': 'physical',
+            'overflowAggregationMethod': 'median',
+            'typeSplitCols': ['JobType'],
+            'additionalJobOptions': {'schedulingDelay': 0, 'useIoRatio': True, 'resourceDemandRounds': 1},
+        },
+        'inputPaths': {
+            'jm': os.path.join(directory, 'jm.json'),
+            'wma': os.path.join(directory, 'wma.json'),
+            'nodeInfo': os.path.join(directory, 'nodes.csv'),
+            'coreUsage': os.path.join(directory, 'cores.csv'),
+        },
+        'outputPaths': {
+            'jobCountReports': 'job_counts.csv',
+        },
+    }
+
+    path = os.path.join(directory, 'calibration.json')
+    with open(path, 'w') as file:
+        json.dump(conf, file, indent=2)
+
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser("Smoke run of the streaming GridKa calibration.")
+    parser.add_argument('--days', type=int, default=2, help="Number of days in the calibrated time frame")
+    parser.add_argument('--jobs-per-day', type=int, default=500, help="Number of job reports per day")
+    parser.add_argument('--keep', action='store_true', help="Keep the temporary input and output files")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='streaming-calibration-')
+    start = pd.Timestamp('2018-05-02')
+
+    try:
+        write_inputs(directory, start, args.days, args.jobs_per_day)
+        config.load_config(write_config(directory, start, args.days))
+
+        StreamingGridKaCalibration().run()
+
+        out = config.outputDirectory
+        for name in ['calibration-report.md', 'parameters_slots_from_pilots', 'parameters_slots_from_reports']:
+            if not os.path.exists(os.path.join(out, name)):
+                raise RuntimeError("Missing output {} of the streaming calibration!".format(name))
+
+        print("Streaming calibration finished, outputs in {}".format(out))
+    finally:
+        if not args.keep:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
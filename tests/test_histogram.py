@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.histogram import LogHistogramSketch, bin_by_quantile
+
+
+@pytest.mark.parametrize('drop_overflow, overflow_agg', [(False, 'mean'), (False, 'median'), (True, 'mean')])
+def test_sketch_excludes_values_at_last_edge(drop_overflow, overflow_agg):
+    # Tied values, many of which are equal to the maximum and hence the last bin edge
+    x = pd.Series(np.random.RandomState(0).randint(1, 5, size=1000).astype(float))
+
+    sketch = LogHistogramSketch()
+    for chunk in np.array_split(x.values, 3):
+        chunk_sketch = LogHistogramSketch()
+        chunk_sketch.update(chunk)
+        sketch.merge(chunk_sketch)
+
+    counts, bins = bin_by_quantile(x, bin_count=10, drop_overflow=drop_overflow, overflow_agg=overflow_agg)
+    sketch_counts, sketch_bins = sketch.bin_by_quantile(bin_count=10, drop_overflow=drop_overflow,
+                                                        overflow_agg=overflow_agg)
+
+    np.testing.assert_array_equal(sketch_counts, counts)
+    np.testing.assert_allclose(sketch_bins, bins, rtol=sketch.relative_accuracy)
@@ -0,0 +1,61 @@
+import gzip
+import json
+
+import pandas as pd
+import pytest
+
+from importers.wmaimport import SummarizedWMAImporter
+
+# Marks fields that are missing from a report
+MISSING = object()
+
+
+def wma_report(i, **fields):
+    report = {'wmaid': 'wma{}'.format(i), 'startTime': 1525219200 + 60 * i, 'stopTime': 1525222800 + 60 * i,
+              'ts': 1525222800 + 60 * i, 'task': '/wf{}/task{}'.format(i % 3, i % 2), 'jobtype': 'Processing',
+              'TotalJobCPU': 1800.5, 'TotalJobTime': 3600.25, 'NumberOfThreads': 1 + i % 4, 'NumberOfStreams': 1,
+              'inputEvents': 1000, 'outputEvents': 100, 'TotalInitTime': 30.5, 'EventThroughput': 0.5,
+              'writeTotalSecs': 10.5, 'readTotalMB': 500.5, 'writeTotalMB': 100.5, 'readMBSec': 10.5,
+              'writeMBSec': 10.25, 'exitCode': None, 'wn_name': 'node{}'.format(i % 5),
+              'LFNArray': ['/store/file{}'.format(i), '/store/file{}'.format(i + 1)]}
+    report.update(fields)
+    return {key: value for key, value in report.items() if value is not MISSING}
+
+
+@pytest.fixture
+def wma_file(tmp_path):
+    # Fields that are missing or null in all reports of a chunk, in some chunks only
+    reports = [wma_report(i) for i in range(12)]
+    reports[2:4] = [wma_report(i, readMBSec=MISSING, exitCode=MISSING, wn_name=None) for i in range(2, 4)]
+    reports[5] = wma_report(5, NumberOfStreams=None, LFNArray=MISSING)
+    reports[7] = wma_report(7, exitCode=8001, stopTime=0)
+    reports[9] = wma_report(9, stopTime=1525222800 - 10 * 24 * 3600)
+
+    path = tmp_path / 'wma.json.gz'
+    with gzip.open(str(path), 'wt') as file:
+        for report in reports:
+            file.write(json.dumps(report) + '\n')
+
+    return str(path)
+
+
+def used_categories(df):
+    # Reports outside of the time frame are dropped before categories are created when reading in chunks
+    return df.apply(lambda col: col.cat.remove_unused_categories() if isinstance(col.dtype, pd.CategoricalDtype)
+                    else col)
+
+
+@pytest.mark.parametrize('chunksize', [1, 2, 5, 100])
+def test_chunked_import_equals_whole_file_import(wma_file, chunksize):
+    start, end = pd.Timestamp('2018-05-01'), pd.Timestamp('2018-05-10')
+
+    whole = SummarizedWMAImporter(with_files=True).import_file_list([wma_file], start, end)
+    chunked = SummarizedWMAImporter(with_files=True, chunksize=chunksize).import_file_list([wma_file], start, end)
+
+    assert len(whole.df) == 10
+    pd.testing.assert_frame_equal(used_categories(chunked.df), used_categories(whole.df))
+
+    # Files of reports outside of the time frame are only dropped when reading in chunks
+    whole_files = whole.extra_dfs['files']
+    whole_files = whole_files[whole_files['wmaid'].isin(whole.df.index)].reset_index(drop=True)
+    pd.testing.assert_frame_equal(used_categories(chunked.extra_dfs['files']), used_categories(whole_files))